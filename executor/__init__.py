@@ -3,7 +3,7 @@
 # Programmer friendly subprocess wrapper.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: February 25, 2018
+# Last Change: October 19, 2026
 # URL: https://executor.readthedocs.io
 
 """
@@ -41,16 +41,22 @@ Classes and functions
 """
 
 # Standard library modules.
+import codecs
 import errno
+import io
 import logging
+import mmap
 import os
 import pipes
 import pprint
 import shlex
 import signal
+import stat
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 
 # External dependencies.
 from humanfriendly import compact, concatenate, format
@@ -65,7 +71,9 @@ from property_manager import (
 from six import string_types, text_type
 
 # Modules included in our package.
-from executor.process import ControllableProcess
+from executor.cgroups import coerce_cgroup
+from executor.limits import create_preexec_fn, validate_cpu_affinity, validate_rlimits
+from executor.process import ControllableProcess, wait_for_readable
 
 # Semi-standard module versioning.
 __version__ = '19.0'
@@ -114,9 +122,32 @@ COMMAND_NOT_FOUND_CODES = (errno.ENOENT,)
 COMMAND_NOT_FOUND_STATUS = 127
 """The exit status used by shells when a command is not found (an integer)."""
 
+LAZY_LOAD_THRESHOLD = 1024 * 1024
+"""
+The size of captured output that is loaded on demand instead of when the command finishes (an integer).
+
+Output captured to a temporary file (see :attr:`ExternalCommand.buffered`)
+that is larger than this number of bytes is kept in the temporary file when
+the command finishes and :attr:`ExternalCommand.lazy_loading` is enabled,
+refer to :func:`CachedStream.finalize()`.
+"""
+
 IS_WINDOWS = sys.platform.startswith('win')
 
 
+def get_monotonic_time():
+    """
+    Get the current value of a monotonic clock (a floating point number of seconds).
+
+    This uses :func:`time.monotonic()` when it's available (Python 3.3+) and
+    falls back to :func:`time.time()` on older Python versions. The returned
+    values are only meaningful in relation to each other, they're used to
+    record the lifecycle timestamps of :class:`ExternalCommand` objects (see
+    for example :attr:`~ExternalCommand.started_time`).
+    """
+    return time.monotonic() if hasattr(time, 'monotonic') else time.time()
+
+
 def execute(*command, **options):
     """
     Execute an external command and make sure it succeeded.
@@ -232,14 +263,16 @@ class ExternalCommand(ControllableProcess):
 
     **Writable properties**
      The :attr:`async`, :attr:`callback`, :attr:`capture`,
-     :attr:`capture_stderr`, :attr:`check`, :attr:`directory`,
-     :attr:`encoding`, :attr:`environment`, :attr:`fakeroot`, :attr:`input`,
-     :attr:`ionice`, :attr:`~executor.process.ControllableProcess.logger`,
-     :attr:`merge_streams`, :attr:`really_silent`, :attr:`shell`,
-     :attr:`silent`, :attr:`stdout_file`, :attr:`stderr_file`, :attr:`uid`,
-     :attr:`user`, :attr:`sudo` and :attr:`virtual_environment` properties
-     allow you to configure how the external command will be run (before it is
-     started).
+     :attr:`capture_head`, :attr:`capture_stderr`, :attr:`capture_tail`,
+     :attr:`cgroup`, :attr:`check`, :attr:`cpu_affinity`, :attr:`directory`, :attr:`encoding`, :attr:`environment`,
+     :attr:`fakeroot`, :attr:`input`, :attr:`ionice`, :attr:`ioprio`,
+     :attr:`~executor.process.ControllableProcess.logger`,
+     :attr:`memory_files`, :attr:`merge_streams`, :attr:`nice`,
+     :attr:`process_group`,
+     :attr:`really_silent`, :attr:`rlimits`, :attr:`shell`, :attr:`silent`,
+     :attr:`spill_threshold`, :attr:`stdout_file`, :attr:`stderr_file`, :attr:`uid`, :attr:`user`, :attr:`sudo` and
+     :attr:`virtual_environment` properties allow you to configure how the
+     external command will be run (before it is started).
 
     **Computed properties**
      The :attr:`command`, :attr:`command_line`, :attr:`decoded_stderr`,
@@ -254,6 +287,13 @@ class ExternalCommand(ControllableProcess):
      inspect if and how the external command was started, what its current
      status is and what its output is.
 
+    **Lifecycle timestamps**
+     The :attr:`created_time`, :attr:`queued_time`, :attr:`started_time`,
+     :attr:`exited_time` and :attr:`collected_time` properties record when
+     the external command reached each stage of its lifecycle, the
+     :attr:`queue_delay`, :attr:`runtime` and :attr:`collect_delay`
+     properties summarize the time spent between those stages.
+
     **Public methods**
      The public methods :func:`start()`, :func:`wait()`,
      :func:`~executor.process.ControllableProcess.terminate()` and
@@ -294,13 +334,20 @@ class ExternalCommand(ControllableProcess):
                         used to set :attr:`command`.
         :param options: Keyword arguments can be used to conveniently override
                         the default values of :attr:`async`, :attr:`callback`,
-                        :attr:`capture`, :attr:`capture_stderr`, :attr:`check`,
-                        :attr:`directory`, :attr:`encoding`,
-                        :attr:`environment`, :attr:`fakeroot`, :attr:`input`,
+                        :attr:`capture`, :attr:`capture_head`,
+                        :attr:`capture_stderr`, :attr:`capture_tail`,
+                        :attr:`cgroup`, :attr:`check`, :attr:`cpu_affinity`, :attr:`directory`,
+                        :attr:`encoding`, :attr:`environment`,
+                        :attr:`fakeroot`, :attr:`input`, :attr:`ioprio`,
+                        :attr:`lazy_loading`,
                         :attr:`~executor.process.ControllableProcess.logger`,
-                        :attr:`merge_streams`, :attr:`really_silent`,
-                        :attr:`shell`, :attr:`silent`, :attr:`stdout_file`,
-                        :attr:`stderr_file`, :attr:`uid`, :attr:`user`,
+                        :attr:`memory_files`,
+                        :attr:`merge_streams`, :attr:`nice`,
+                        :attr:`process_group`, :attr:`really_silent`,
+                        :attr:`rlimits`,
+                        :attr:`shell`, :attr:`silent`, :attr:`spill_threshold`,
+                        :attr:`stdout_file`, :attr:`stderr_file`,
+                        :attr:`uid`, :attr:`user`,
                         :attr:`sudo` and :attr:`virtual_environment`. Keyword
                         argument that are not supported will raise
                         :exc:`TypeError` as usual.
@@ -313,6 +360,8 @@ class ExternalCommand(ControllableProcess):
         self.command = list(command)
         # Set properties based on keyword arguments.
         super(ExternalCommand, self).__init__(**options)
+        # Remember when the command object was created.
+        self.created_time = get_monotonic_time()
         # Initialize instance variables.
         self.stdin_stream = CachedStream(self, 'stdin')
         self.stdout_stream = CachedStream(self, 'stdout')
@@ -454,6 +503,32 @@ class ExternalCommand(ControllableProcess):
         """
         return True if self.callback else False
 
+    @mutable_property
+    def capture_head(self):
+        """
+        The maximum number of bytes to capture from the start of each output stream (an integer or :data:`None`).
+
+        When :attr:`capture_head` and/or :attr:`capture_tail` are set the
+        captured output streams are read through pipes by a background thread
+        per stream which keeps only the first :attr:`capture_head` bytes and
+        the last :attr:`capture_tail` bytes (in a :class:`BoundedBuffer`).
+        This means the memory used per command stays constant regardless of
+        how much output the command produces, while the output that's most
+        useful in error messages (see :attr:`error_message`) is still
+        available. The total number of bytes written to the streams is
+        available as :attr:`stdout_size` and :attr:`stderr_size`. This option
+        can't be combined with :attr:`buffered` set to :data:`False`
+        (:func:`start()` raises :exc:`~exceptions.ValueError`).
+        """
+
+    @mutable_property
+    def capture_tail(self):
+        """
+        The maximum number of bytes to capture from the end of each output stream (an integer or :data:`None`).
+
+        Refer to :attr:`capture_head` for details.
+        """
+
     @mutable_property
     def capture_stderr(self):
         """
@@ -465,6 +540,46 @@ class ExternalCommand(ControllableProcess):
         """
         return False
 
+    @mutable_property
+    def cgroup(self):
+        """
+        The control group of the external command (a :class:`.ControlGroup` object or :data:`None`).
+
+        When this property is set the control group is created by
+        :func:`start()` (applying the configured limits) and the child process
+        joins the control group before the external command is executed, so
+        that all descendants of the external command (including daemonized
+        grandchildren) are part of the same control group. This has the
+        following effects:
+
+        - When the external command is terminated or killed all processes in
+          the control group are signaled.
+
+        - When the external command has ended the resource usage of the
+          control group is recorded in :attr:`cgroup_statistics` and the
+          control group is removed (unless it still contains processes).
+
+        Instead of a :class:`.ControlGroup` object you can also set this
+        property to a dictionary with :class:`.ControlGroup` options (for
+        example ``dict(memory_max=1024 ** 3)``) or :data:`True` (refer to
+        :func:`.coerce_cgroup()`).
+        """
+
+    @cgroup.setter
+    def cgroup(self, value):
+        """Coerce and set the control group."""
+        set_property(self, 'cgroup', coerce_cgroup(value))
+
+    @mutable_property
+    def cgroup_statistics(self):
+        """
+        Resource usage of the external command's control group (a dictionary or :data:`None`).
+
+        This is the value of :attr:`.ControlGroup.statistics` as recorded by
+        :func:`cleanup()` after the external command ended, or :data:`None`
+        when :attr:`cgroup` isn't set.
+        """
+
     @mutable_property
     def check(self):
         """
@@ -477,6 +592,29 @@ class ExternalCommand(ControllableProcess):
         """
         return True
 
+    @property
+    def collect_delay(self):
+        """
+        The time between :attr:`exited_time` and :attr:`collected_time` (a float or :data:`None`).
+
+        This is the number of seconds that passed between the moment the
+        external command was seen to exit and the moment its output and return
+        code were collected. In command pools this reflects how quickly the
+        pool notices finished commands.
+        """
+        if self.exited_time is not None and self.collected_time is not None:
+            return self.collected_time - self.exited_time
+
+    @mutable_property
+    def collected_time(self):
+        """
+        The time when the external command's results were collected (a float or :data:`None`).
+
+        This is set by :func:`cleanup()` once the output of the command has
+        been loaded and the :class:`subprocess.Popen` object has been released.
+        Refer to :func:`get_monotonic_time()` for details about the clock used.
+        """
+
     @mutable_property
     def command(self):
         """
@@ -545,14 +683,45 @@ class ExternalCommand(ControllableProcess):
         # Allow running of the command under `sudo' and/or `ionice'.
         return self.sudo_command + self.ionice_command + command_line
 
+    @mutable_property
+    def cpu_affinity(self):
+        """
+        The CPUs that the external command is allowed to run on (a list of integers or :data:`None`).
+
+        When this property is set the CPU affinity of the child process is
+        changed using :func:`os.sched_setaffinity()` before the external
+        command is executed, so no wrapper program like ``taskset`` is needed.
+        On platforms that don't support this the option is ignored (a warning
+        is logged). Command pools can set this property automatically, refer
+        to :attr:`.CommandPool.cpu_pinning` for details.
+
+        :raises: Any exceptions raised by :func:`.validate_cpu_affinity()`.
+        """
+
+    @cpu_affinity.setter
+    def cpu_affinity(self, value):
+        """Validate and set the CPU affinity."""
+        set_property(self, 'cpu_affinity', validate_cpu_affinity(value) if value is not None else None)
+
+    @mutable_property
+    def created_time(self):
+        """
+        The time when the :class:`ExternalCommand` object was created (a float).
+
+        Refer to :func:`get_monotonic_time()` for details about the clock used.
+        """
+
     @property
     def decoded_stdout(self):
         """
         The value of :attr:`stdout` decoded using :attr:`encoding`.
 
         This is a :func:`python2:unicode` object (in Python 2) or a
-        :class:`python3:str` object (in Python 3).
+        :class:`python3:str` object (in Python 3). The decoded value is cached
+        (see :func:`CachedStream.get_view()`).
         """
+        if self.buffered:
+            return self.stdout_stream.get_view(('decoded', self.encoding), lambda raw: raw.decode(self.encoding))
         value = self.stdout
         if value is not None:
             return value.decode(self.encoding)
@@ -563,8 +732,11 @@ class ExternalCommand(ControllableProcess):
         The value of :attr:`stderr` decoded using :attr:`encoding`.
 
         This is a :func:`python2:unicode` object (in Python 2) or a
-        :class:`python3:str` object (in Python 3).
+        :class:`python3:str` object (in Python 3). The decoded value is cached
+        (see :func:`CachedStream.get_view()`).
         """
+        if self.buffered:
+            return self.stderr_stream.get_view(('decoded', self.encoding), lambda raw: raw.decode(self.encoding))
         value = self.stderr
         if value is not None:
             return value.decode(self.encoding)
@@ -657,6 +829,18 @@ class ExternalCommand(ControllableProcess):
         elif self.returncode not in (None, 0):
             return ExternalCommandFailed
 
+    @mutable_property
+    def exited_time(self):
+        """
+        The time when the external command was seen to exit (a float or :data:`None`).
+
+        This is set the first time :attr:`is_running` notices that the process
+        has ended, which means the precision of this timestamp depends on how
+        frequently the process is polled (for example by :func:`wait()` or by
+        a command pool). Refer to :func:`get_monotonic_time()` for details
+        about the clock used.
+        """
+
     @property
     def failed(self):
         """
@@ -744,6 +928,21 @@ class ExternalCommand(ControllableProcess):
         communicate with the external command in real time. See also the
         :attr:`buffered` and :attr:`stdin` properties.
 
+        You can also set :attr:`input` to a file object or an iterable (for
+        example a generator) that produces strings (see :func:`is_input_stream()`):
+
+        - File objects that have a file descriptor (regular files but also for
+          example the pipes of other commands) are connected directly to the
+          standard input stream of the external command.
+
+        - Other file-like objects and iterables are fed to the external
+          command through a pipe by a background thread, so that large inputs
+          can be streamed to the external command using constant memory and
+          without having to write a temporary file before the command can be
+          started. Strings are encoded using :attr:`encoding`. When the
+          external command exits before consuming all of its input the
+          remaining input is discarded.
+
         Defaults to :data:`None`.
         """
 
@@ -773,6 +972,36 @@ class ExternalCommand(ControllableProcess):
         """The ionice_ command based on :attr:`ionice` (a list of strings)."""
         return ['ionice', '--class', self.ionice] if self.ionice else []
 
+    @mutable_property
+    def ioprio(self):
+        """
+        The I/O scheduling class for the external command (a string or :data:`None`).
+
+        This is a native alternative to :attr:`ionice` that accepts the same
+        values (refer to :func:`validate_ionice_class()`). Instead of prefixing
+        the ionice_ program to :attr:`command_line` the I/O scheduling class is
+        set using the ``ioprio_set()`` system call in the child process before
+        the external command is executed, which avoids an extra program
+        execution per command. On platforms that don't support this the
+        option is ignored (a warning is logged).
+
+        .. note:: Because :attr:`ioprio`, :attr:`nice`, :attr:`cpu_affinity`
+                  and :attr:`rlimits` are applied to the local child process
+                  they don't make sense for commands that run elsewhere (like
+                  :class:`.RemoteCommand` objects, where they would affect the
+                  local SSH client instead of the remote command). Use
+                  :attr:`ionice` in those cases.
+
+        :raises: Any exceptions raised by :func:`validate_ionice_class()`.
+        """
+
+    @ioprio.setter
+    def ioprio(self, value):
+        """Validate and set the I/O scheduling class."""
+        if value is not None:
+            validate_ionice_class(value)
+        set_property(self, 'ioprio', value)
+
     @property
     def is_finished(self):
         """
@@ -788,9 +1017,33 @@ class ExternalCommand(ControllableProcess):
     def is_running(self):
         """:data:`True` if the process is currently running, :data:`False` otherwise."""
         if self.subprocess is not None:
-            return self.subprocess.poll() is None
-        else:
-            return False
+            if self.subprocess.poll() is None:
+                return True
+            if self.exited_time is None:
+                # Remember when we first noticed that the process ended.
+                self.exited_time = get_monotonic_time()
+        return False
+
+    @property
+    def is_group_running(self):
+        """
+        :data:`True` if the process or other members of its process group are running, :data:`False` otherwise.
+
+        When :attr:`process_group` isn't set this is the same as
+        :attr:`is_running`, otherwise the process group is checked as well
+        (because other members of the process group can outlive the process
+        that started them).
+        """
+        if self.is_running:
+            return True
+        if self.process_group and self.pid:
+            try:
+                os.killpg(self.pid, 0)
+                return True
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+        return False
 
     @property
     def is_terminated(self):
@@ -803,6 +1056,48 @@ class ExternalCommand(ControllableProcess):
         """
         return abs(self.returncode) == signal.SIGTERM if self.is_finished and self.returncode < 0 else False
 
+    @mutable_property
+    def lazy_loading(self):
+        """
+        Whether to load large output on demand (a boolean, defaults to :data:`False`).
+
+        By default the output of asynchronous commands that was captured to a
+        temporary file (see :attr:`buffered`) is read into memory when the
+        command finishes, after which the temporary file is removed. When
+        :attr:`lazy_loading` is :data:`True` output larger than
+        :data:`LAZY_LOAD_THRESHOLD` is kept in the temporary file instead,
+        until :attr:`stdout` or :attr:`stderr` is first accessed (or
+        :attr:`stdout_view` and :attr:`stderr_view` map the file into memory).
+
+        .. note:: Because the temporary file is kept open this costs one file
+                  descriptor per stream for as long as the output hasn't been
+                  loaded, so think twice before enabling this for a large
+                  number of commands (for example in a
+                  :class:`~executor.concurrent.CommandPool`).
+        """
+        return False
+
+    @mutable_property
+    def memory_files(self):
+        """
+        Whether to use anonymous memory files instead of temporary files (a boolean).
+
+        By default the :attr:`input` and captured output of asynchronous
+        commands (see :attr:`buffered`) are stored in named temporary files
+        (created using :func:`tempfile.mkstemp()`) which are removed after
+        the command has finished. When :attr:`memory_files` is :data:`True`
+        (not the default) anonymous memory files created using
+        :func:`create_memory_file()` are used instead. This avoids the disk
+        that holds the temporary directory and leaves no files behind when
+        the current process crashes. On platforms that don't support
+        anonymous memory files named temporary files are used regardless.
+
+        .. note:: Anonymous memory files are backed by memory (and swap) so
+                  this option is not a good idea for commands whose output
+                  is much larger than the available memory.
+        """
+        return False
+
     @mutable_property
     def merge_streams(self):
         """
@@ -814,6 +1109,18 @@ class ExternalCommand(ControllableProcess):
         """
         return False
 
+    @mutable_property
+    def nice(self):
+        """
+        The niceness increment for the external command (an integer or :data:`None`).
+
+        When this property is set :func:`os.nice()` is used to change the
+        scheduling priority of the child process before the external command
+        is executed, so no wrapper program like ``nice`` is needed. Positive
+        numbers lower the priority of the command, negative numbers raise the
+        priority (this requires superuser privileges).
+        """
+
     @property
     def output(self):
         """
@@ -849,8 +1156,89 @@ class ExternalCommand(ControllableProcess):
         """
         text_output = self.decoded_stdout
         if text_output is not None:
-            stripped_output = text_output.strip()
-            return stripped_output if '\n' not in stripped_output else text_output
+            return self.stdout_stream.get_view(('output', self.encoding), lambda raw: strip_output(text_output))
+
+    @property
+    def preexec_fn(self):
+        """
+        The function that prepares the child process (a callable or :data:`None`).
+
+        The value of this property is created by :func:`.create_preexec_fn()`
+        based on :attr:`cgroup`, :attr:`nice`, :attr:`cpu_affinity`,
+        :attr:`rlimits`, :attr:`ioprio` and :attr:`process_group` and it's
+        passed to :class:`subprocess.Popen` by
+        :func:`start()`. On Python < 3.2 it also restores the default action
+        of the signals that Python ignores (refer to
+        :data:`.RESTORED_SIGNALS`), like :class:`subprocess.Popen` does on
+        later Python versions.
+        """
+        return create_preexec_fn(
+            cgroup=self.cgroup,
+            cpu_affinity=self.cpu_affinity,
+            ioprio=self.ioprio,
+            nice=self.nice,
+            process_group=self.process_group,
+            restore_signals=sys.version_info[:2] < (3, 2),
+            rlimits=self.rlimits,
+        )
+
+    @mutable_property
+    def process_group(self):
+        """
+        Start the external command in a new process group or session (a string or :data:`None`).
+
+        By default the external command is part of the process group of the
+        current process and :func:`~executor.process.ControllableProcess.terminate()`
+        and :func:`~executor.process.ControllableProcess.kill()` only signal
+        the process created by :func:`start()`. When the real workload is a
+        grandchild (for example because of :attr:`shell`, :attr:`sudo`,
+        :attr:`ionice` or because the command is a shell script) the workload
+        may keep running after the command was "terminated". This property
+        can be set to one of the following strings:
+
+        ``'group'``
+         The external command is started in a new process group (using
+         :func:`os.setpgid()`) and signals are sent to the whole process group
+         (using :func:`os.killpg()`). The escalation from ``SIGTERM`` to
+         ``SIGKILL`` applies to the process group as a whole.
+
+        ``'session'``
+         The same as ``'group'`` but the external command is started in a new
+         session (using :func:`os.setsid()`) which also detaches it from the
+         controlling terminal (this means programs like ``sudo`` and ``ssh``
+         can't prompt for passwords).
+
+        :raises: Any exceptions raised by :func:`validate_process_group()`.
+        """
+
+    @process_group.setter
+    def process_group(self, value):
+        """Validate and set the process group mode."""
+        if value is not None:
+            validate_process_group(value)
+        set_property(self, 'process_group', value)
+
+    @property
+    def queue_delay(self):
+        """
+        The time between :attr:`queued_time` and :attr:`started_time` (a float or :data:`None`).
+
+        This is the number of seconds that the external command spent waiting
+        in a command pool before it was started. It's :data:`None` when the
+        command wasn't added to a pool or hasn't been started yet.
+        """
+        if self.queued_time is not None and self.started_time is not None:
+            return self.started_time - self.queued_time
+
+    @mutable_property
+    def queued_time(self):
+        """
+        The time when the external command was queued for execution (a float or :data:`None`).
+
+        This is set by :func:`.CommandPool.add()` when the command is added to
+        a command pool. Refer to :func:`get_monotonic_time()` for details about
+        the clock used.
+        """
 
     @mutable_property
     def really_silent(self):
@@ -904,6 +1292,34 @@ class ExternalCommand(ControllableProcess):
                 self.wait()
             return self.callback(self)
 
+    @mutable_property
+    def rlimits(self):
+        """
+        Resource limits for the external command (a dictionary or :data:`None`).
+
+        The keys of the dictionary are resource names and the values are
+        numbers (used as both the soft and hard limit) or tuples with two
+        numbers (the soft and hard limit, :data:`None` means unlimited), for
+        example:
+
+        .. code-block:: python
+
+           ExternalCommand('make', rlimits=dict(address_space=2 * 1024 ** 3,
+                                                open_files=1024,
+                                                cpu_seconds=(60, 120)))
+
+        The limits are applied in the child process using
+        :func:`resource.setrlimit()` before the external command is executed,
+        so no wrapper program like ``prlimit`` is needed.
+
+        :raises: Any exceptions raised by :func:`.validate_rlimits()`.
+        """
+
+    @rlimits.setter
+    def rlimits(self, value):
+        """Validate and set the resource limits."""
+        set_property(self, 'rlimits', validate_rlimits(value) if value else None)
+
     @mutable_property
     def returncode(self):
         """
@@ -914,6 +1330,18 @@ class ExternalCommand(ControllableProcess):
         if self.subprocess is not None:
             return self.subprocess.poll()
 
+    @property
+    def runtime(self):
+        """
+        The time between :attr:`started_time` and :attr:`exited_time` (a float or :data:`None`).
+
+        This is the number of seconds that the external command was running.
+        It's :data:`None` when the command hasn't been started yet or hasn't
+        finished yet.
+        """
+        if self.started_time is not None and self.exited_time is not None:
+            return self.exited_time - self.started_time
+
     @mutable_property
     def shell(self):
         """
@@ -948,6 +1376,37 @@ class ExternalCommand(ControllableProcess):
         """
         return False
 
+    @mutable_property
+    def spill_threshold(self):
+        """
+        The number of bytes of captured output to keep in memory (an integer or :data:`None`).
+
+        By default the output of asynchronous commands is captured to
+        temporary files (see :attr:`buffered`) which means even a few bytes of
+        output involve creating, reading and removing a file on disk. When
+        :attr:`spill_threshold` is set the output is captured through pipes
+        instead: A background thread per stream reads the output into memory
+        until the given number of bytes is exceeded, after which the output is
+        spilled to an (anonymous) temporary file (using
+        :class:`tempfile.SpooledTemporaryFile`). This means small outputs
+        never touch the file system while large outputs don't exhaust memory.
+        Because the output is read through pipes, :func:`wait()` returns when
+        all processes that inherited the pipes have closed them (just like
+        synchronous commands).
+
+        Output that was spilled to disk isn't read into memory when the
+        command finishes, this is deferred until :attr:`stdout` or
+        :attr:`stderr` is first accessed (the same applies to output larger
+        than :data:`LAZY_LOAD_THRESHOLD` that was captured to a temporary
+        file, when :attr:`lazy_loading` is enabled). Use :attr:`stdout_view` and
+        :attr:`stderr_view` to parse or hash large outputs in place (without
+        reading them into memory at all).
+
+        The default is :data:`None` which means temporary files are used.
+        This property has no effect when :attr:`async` or :attr:`buffered` is
+        :data:`False` (in those cases pipes are used already).
+        """
+
     @mutable_property
     def start_event(self):
         """
@@ -962,6 +1421,16 @@ class ExternalCommand(ControllableProcess):
         pools.
         """
 
+    @mutable_property
+    def started_time(self):
+        """
+        The time when the external command was started (a float or :data:`None`).
+
+        This is set by :func:`start()` just before the :class:`subprocess.Popen`
+        object is constructed. Refer to :func:`get_monotonic_time()` for details
+        about the clock used.
+        """
+
     @property
     def stderr(self):
         """
@@ -984,6 +1453,26 @@ class ExternalCommand(ControllableProcess):
         elif self.subprocess is not None:
             return self.subprocess.stderr
 
+    @property
+    def stderr_view(self):
+        """
+        A read only view of the captured standard error stream (a :class:`memoryview` or :data:`None`).
+
+        This provides the same data as :attr:`stderr` without copying it,
+        refer to :attr:`stdout_view` for details.
+        """
+        if self.buffered:
+            return self.stderr_stream.view()
+
+    @property
+    def stderr_size(self):
+        """
+        The total number of bytes written to the standard error stream (an integer or :data:`None`).
+
+        Refer to :attr:`stdout_size` for details.
+        """
+        return self.stderr_stream.get_size()
+
     @mutable_property
     def stderr_file(self):
         """
@@ -1045,6 +1534,50 @@ class ExternalCommand(ControllableProcess):
         elif self.subprocess is not None:
             return self.subprocess.stdout
 
+    @property
+    def stdout_view(self):
+        """
+        A read only view of the captured standard output stream (a :class:`memoryview` or :data:`None`).
+
+        This provides the same data as :attr:`stdout` without copying it.
+        When the output is kept on disk (because :attr:`spill_threshold` is
+        set and the output was spilled to disk, or because :attr:`lazy_loading`
+        is enabled and the output is larger than :data:`LAZY_LOAD_THRESHOLD`)
+        the view is backed by a
+        memory mapping of the file (created using :mod:`mmap`) which means
+        the output doesn't need to be read into memory, for example:
+
+        .. code-block:: python
+
+           import hashlib
+           from executor import ExternalCommand
+
+           cmd = ExternalCommand('pg_dump', 'example', async=True,
+                                 capture=True, spill_threshold=1024 ** 2)
+           cmd.wait()
+           print(hashlib.sha256(cmd.stdout_view).hexdigest())
+
+        The memory mapping is closed when the output is loaded into memory
+        or the command is restarted (as long as the caller has released the
+        view, otherwise the mapping is closed when the view is garbage
+        collected). This property is only available when :attr:`buffered`
+        is :data:`True`.
+        """
+        if self.buffered:
+            return self.stdout_stream.view()
+
+    @property
+    def stdout_size(self):
+        """
+        The total number of bytes written to the standard output stream (an integer or :data:`None`).
+
+        This is the length of :attr:`stdout` unless :attr:`capture_head` or
+        :attr:`capture_tail` is set, in which case it can be (a lot) larger
+        than the length of :attr:`stdout`. When the standard output stream
+        isn't captured this is :data:`None`.
+        """
+        return self.stdout_stream.get_size()
+
     @mutable_property
     def stdout_file(self):
         """
@@ -1258,8 +1791,8 @@ class ExternalCommand(ControllableProcess):
         value = getattr(self, name)
         if value:
             try:
-                value = value.decode(self.encoding)
-                value = value.strip()
+                stream = getattr(self, '%s_stream' % name)
+                value = stream.get_view(('stripped', self.encoding), lambda raw: raw.decode(self.encoding).strip())
             except Exception:
                 pass
         return value
@@ -1341,11 +1874,20 @@ class ExternalCommand(ControllableProcess):
                 terminate, kill or wait for the running process before you can
                 re-use the ExternalCommand object)
             """))
+        if not self.buffered and (self.capture_head is not None or self.capture_tail is not None):
+            # Bounded capturing reads the pipes in a background thread, which
+            # conflicts with handing the pipes to the caller.
+            raise ValueError(compact("""
+                The capture_head and capture_tail options can't be combined
+                with buffered=False! (unbuffered output is read from the pipes
+                by the caller so it can't be bounded)
+            """))
         # Prepare the keyword arguments to subprocess.Popen().
         kw = dict(args=self.command_line,
                   bufsize=self.buffer_size,
                   cwd=self.directory,
-                  env=os.environ.copy())
+                  env=os.environ.copy(),
+                  preexec_fn=self.preexec_fn)
         kw['env'].update(self.environment)
         # Prepare the command's standard input/output/error streams.
         kw['stdin'] = self.stdin_stream.prepare_input()
@@ -1355,13 +1897,19 @@ class ExternalCommand(ControllableProcess):
         # Let the operator know what's about to happen.
         self.logger.debug("Executing external command: %s", quote(kw['args']))
         # Lightweight reset of internal state.
-        for name in 'error_type', 'pid', 'returncode', 'subprocess':
+        for name in ('cgroup_statistics', 'error_type', 'pid', 'returncode',
+                     'subprocess', 'exited_time', 'collected_time'):
             delattr(self, name)
+        # Create the control group (applying its limits) before the child
+        # process tries to join it.
+        if self.cgroup is not None:
+            self.cgroup.create()
         # Invoke the start event callback?
         self.invoke_event_callback('start_event')
         # Remember that we called subprocess.Popen() regardless of whether it
         # is about to raise an exception or not.
         self.was_started = True
+        self.started_time = get_monotonic_time()
         # Create the subprocess.Popen object and start the subprocess.
         try:
             self.logger.debug("Constructing subprocess.Popen object ..")
@@ -1371,6 +1919,7 @@ class ExternalCommand(ControllableProcess):
                 # Translate errno.ENOENT into a CommandNotFound exception.
                 self.error_type = CommandNotFound
                 self.returncode = COMMAND_NOT_FOUND_STATUS
+                self.exited_time = get_monotonic_time()
                 self.stdout_stream.finalize(b'')
                 self.stderr_stream.finalize(b'')
                 # Cleanup temporary resources and raise the exception (or not).
@@ -1383,10 +1932,31 @@ class ExternalCommand(ControllableProcess):
             # it becomes available. This enables us to garbage collect the
             # subprocess.Popen object without losing track of the process ID.
             self.pid = self.subprocess.pid
+            # Start copying captured output from pipes to spooled or bounded
+            # buffers. The pipes are detached from the subprocess.Popen object
+            # so that communicate() doesn't try to read from them as well.
+            for name in 'stdout', 'stderr':
+                if getattr(self, '%s_stream' % name).start_reader(getattr(self.subprocess, name)):
+                    setattr(self.subprocess, name, None)
+            # Start feeding streaming input to the command (the same applies).
+            if self.stdin_stream.start_writer(self.subprocess.stdin):
+                self.subprocess.stdin = None
+            # Also create the new process group from the parent process to
+            # avoid a race condition where the process group is signaled
+            # before the child process got around to creating it.
+            if self.process_group == 'group':
+                try:
+                    os.setpgid(self.pid, self.pid)
+                except OSError:
+                    # The child process has already called execve() (which
+                    # means it also called setpgid()) or it already exited.
+                    pass
             # Synchronously wait for the external command to end?
             if not self.async:
                 self.logger.debug("Joining synchronous process using subprocess.Popen.communicate() ..")
-                stdout, stderr = self.subprocess.communicate(self.encoded_input)
+                stdout, stderr = self.subprocess.communicate(
+                    None if is_input_stream(self.input) else self.encoded_input
+                )
                 self.stdout_stream.finalize(stdout)
                 self.stderr_stream.finalize(stderr)
                 self.wait()
@@ -1396,6 +1966,39 @@ class ExternalCommand(ControllableProcess):
             if not self.is_running:
                 self.invoke_event_callback('finish_event')
 
+    def record_result(self, returncode, stdout=b'', stderr=b'', check=None):
+        """
+        Record the result of an external command that was executed by other means.
+
+        :param returncode: The exit status of the external command (an integer).
+        :param stdout: The output on the standard output stream (a byte string).
+        :param stderr: The output on the standard error stream (a byte string).
+        :param check: Override the value of :attr:`check` for the duration of
+                      this call. Defaults to :data:`None` which means
+                      :attr:`check` is not overridden.
+        :raises: :exc:`ExternalCommandFailed` when :attr:`check` is
+                 :data:`True` and the external command failed.
+
+        This method enables alternative execution strategies (like the
+        persistent shells implemented in :mod:`executor.sessions`) to return
+        regular :class:`ExternalCommand` objects to their callers. Captured
+        output is stored in :attr:`stdout` and :attr:`stderr`, output that
+        wasn't captured or silenced is written to the standard output and
+        error streams of the Python process.
+        """
+        self.was_started = True
+        self.started_time = self.exited_time = get_monotonic_time()
+        self.returncode = returncode
+        for stream, data, capture, handle in ((self.stdout_stream, stdout, self.capture, sys.stdout),
+                                              (self.stderr_stream, stderr, self.capture_stderr, sys.stderr)):
+            if capture or (self.silent and not self.really_silent):
+                stream.finalize(data)
+            elif not self.silent and data:
+                handle.flush()
+                getattr(handle, 'buffer', handle).write(data)
+                handle.flush()
+        self.check_errors(check=check)
+
     def wait(self, check=None, **kw):
         """
         Wait for the external command to finish.
@@ -1440,14 +2043,24 @@ class ExternalCommand(ControllableProcess):
 
         :raises: Any exceptions raised by the :mod:`subprocess` module.
 
+        When :attr:`process_group` is set the whole process group is signaled,
+        otherwise only the process created by :func:`start()` is signaled.
+
         This method sets :attr:`check` to :data:`False`, the idea being that if
         you consciously terminate a command you don't need to be bothered with
         an exception telling you that you succeeded :-).
         """
-        if self.subprocess is not None:
+        if self.process_group and self.pid:
+            self.logger.debug("Terminating process group using os.killpg() ..")
+            self.signal_process_group(signal.SIGTERM)
+        elif self.subprocess is not None:
             self.logger.debug("Terminating process using subprocess.Popen.terminate() ..")
             self.subprocess.terminate()
-            self.check = False
+        else:
+            return
+        if self.cgroup is not None:
+            self.cgroup.send_signal(signal.SIGTERM)
+        self.check = False
 
     def kill_helper(self):
         """
@@ -1455,14 +2068,38 @@ class ExternalCommand(ControllableProcess):
 
         :raises: Any exceptions raised by the :mod:`subprocess` module.
 
+        When :attr:`process_group` is set the whole process group is signaled,
+        otherwise only the process created by :func:`start()` is signaled.
+
         This method sets :attr:`check` to :data:`False`, the idea being that if
         you consciously kill a command you don't need to be bothered with an
         exception telling you that you succeeded :-).
         """
-        if self.subprocess is not None:
+        if self.process_group and self.pid:
+            self.logger.debug("Killing process group using os.killpg() ..")
+            self.signal_process_group(signal.SIGKILL)
+        elif self.subprocess is not None:
             self.logger.debug("Killing process using subprocess.Popen.kill() ..")
             self.subprocess.kill()
-            self.check = False
+        else:
+            return
+        if self.cgroup is not None:
+            self.cgroup.kill()
+        self.check = False
+
+    def signal_process_group(self, number):
+        """
+        Send a signal to the process group of the external command.
+
+        :param number: The signal number (an integer).
+        :raises: Any exceptions raised by :func:`os.killpg()` except for
+                 ``ESRCH`` (which means the process group no longer exists).
+        """
+        try:
+            os.killpg(self.pid, number)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
 
     def load_output(self):
         """
@@ -1490,6 +2127,10 @@ class ExternalCommand(ControllableProcess):
         - File handles to the previously mentioned temporary files and
           :data:`os.devnull` (used to implement the :attr:`silent` option).
 
+        - The control group of the external command (only when :attr:`cgroup`
+          is set, after its resource usage has been recorded in
+          :attr:`cgroup_statistics`).
+
         - The reference to the :class:`subprocess.Popen` object stored in
           :attr:`subprocess`. By destroying this reference as soon as possible
           we enable the object to be garbage collected and its related
@@ -1510,6 +2151,8 @@ class ExternalCommand(ControllableProcess):
                 # so we don't lose track of it once we allow the subprocess.Popen
                 # object to be garbage collected.
                 self.returncode = self.subprocess.wait()
+                if self.exited_time is None:
+                    self.exited_time = get_monotonic_time()
                 # Invoke the finish event callback?
                 self.invoke_event_callback('finish_event')
             else:
@@ -1520,14 +2163,26 @@ class ExternalCommand(ControllableProcess):
             # Destroy our reference to the subprocess.Popen object
             # to allow it to be garbage collected.
             delattr(self, 'subprocess')
+        if self.exited_time is not None:
+            # Record the resource usage of the control group and remove it.
+            if self.cgroup is not None and self.cgroup_statistics is None:
+                self.cgroup_statistics = self.cgroup.statistics
+                self.cgroup.destroy()
+            # Remember when the command's results were collected.
+            if self.collected_time is None:
+                self.collected_time = get_monotonic_time()
 
     def reset(self):
         """Reset internal state created by :func:`start()`."""
         self.cleanup()
+        delattr(self, 'cgroup_statistics')
         delattr(self, 'error_message')
         delattr(self, 'error_type')
         delattr(self, 'pid')
         delattr(self, 'returncode')
+        delattr(self, 'started_time')
+        delattr(self, 'exited_time')
+        delattr(self, 'collected_time')
         self.stdin_stream.reset()
         self.stdout_stream.reset()
         self.stderr_stream.reset()
@@ -1563,6 +2218,80 @@ class ExternalCommand(ControllableProcess):
             logger.debug("Invoking %s callback ..", name)
             callback(self)
 
+    def iter_streams(self, tee=None):
+        """
+        Iterate over the lines of output on the standard output and error streams in realtime.
+
+        :param tee: An optional dictionary that maps stream names ('stdout' or
+                    'stderr') to file-like objects (which the lines of text
+                    are written to, including line endings) or callables
+                    (which are called with each line of text, without line
+                    ending).
+        :returns: A generator of tuples with two values each: The name of a
+                  stream ('stdout' or 'stderr') and a line of text (a Unicode
+                  string without line ending).
+        :raises: :exc:`~exceptions.ValueError` when the command has already
+                 been started without pipes for its output streams.
+
+        If the command hasn't been started yet :attr:`async`, :attr:`capture`
+        and :attr:`capture_stderr` are set to :data:`True` and
+        :attr:`buffered` is set to :data:`False` before the command is
+        started. Both pipes are then drained at the same time (using
+        :func:`.wait_for_readable()`) so that the command can't block because the
+        pipe we're not reading from is full, and lines are generated in the
+        order in which they arrive (decoded incrementally by a
+        :class:`LineDecoder` per stream, output on both streams that becomes
+        available at the same time is generated stdout first). This doesn't use any background
+        threads. When :attr:`merge_streams` is :data:`True` only 'stdout'
+        lines are generated.
+
+        Here's an example that logs the output of a long running command
+        while it's running:
+
+        .. code-block:: python
+
+           from executor import ExternalCommand
+
+           cmd = ExternalCommand('make', 'all')
+           for stream, line in cmd.iter_streams():
+               if stream == 'stderr':
+                   logger.warning("%s", line)
+               else:
+                   logger.info("%s", line)
+           cmd.wait()
+        """
+        if not self.was_started:
+            self.async = True
+            self.buffered = False
+            self.capture = True
+            self.capture_stderr = True
+            self.start()
+        streams = {}
+        for name in 'stdout', 'stderr':
+            pipe = getattr(self.subprocess, name, None) if self.subprocess is not None else None
+            if pipe is not None:
+                streams[pipe.fileno()] = name
+        if not streams:
+            raise ValueError("Can't iterate over output streams that aren't connected to pipes!")
+        decoders = dict((name, LineDecoder(self.encoding)) for name in streams.values())
+        while streams:
+            for fd in wait_for_readable(sorted(streams)):
+                name = streams[fd]
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    lines = decoders[name].decode(chunk)
+                else:
+                    lines = decoders[name].decode(b'', final=True)
+                    del streams[fd]
+                target = (tee or {}).get(name)
+                for text in lines:
+                    line = text[:-1] if text.endswith(u'\n') else text
+                    if callable(target):
+                        target(line)
+                    elif target is not None:
+                        target.write(text)
+                    yield name, line
+
     def __enter__(self):
         """
         Start the external command if it hasn't already been started.
@@ -1604,6 +2333,21 @@ class ExternalCommand(ControllableProcess):
                 # handling an exception.
                 self.check_errors()
 
+    def __or__(self, other):
+        """
+        Connect the output of the external command to the input of another command.
+
+        :param other: An :class:`ExternalCommand` or :class:`.Pipeline` object.
+        :returns: A :class:`.Pipeline` object.
+
+        This enables shell-like pipelines of external commands whose output and
+        input streams are connected by operating system pipes (without passing
+        the data through the Python process). Refer to the
+        :mod:`executor.pipelines` module for details.
+        """
+        from executor.pipelines import Pipeline
+        return Pipeline(self, other)
+
     def __iter__(self):
         """
         Iterate over the lines of text in the captured output.
@@ -1618,13 +2362,11 @@ class ExternalCommand(ControllableProcess):
         cases the output will be decoded using :attr:`encoding`.
 
         If :attr:`buffered` is :data:`True` the captured output will be split
-        into a list of strings which is then iterated. If it is :data:`False`
-        then the following idiom is used to create an iterator instead:
-
-        .. code-block:: python
-
-           iter(handle.readline, b'')
-
+        into a list of strings (which is cached, see
+        :func:`CachedStream.get_view()`) which is then iterated. If it is
+        :data:`False` then the output is read from the pipe as it becomes
+        available (using :func:`os.read()`) and decoded incrementally (using
+        :func:`iter_decoded_lines()`) instead of using Python's file iteration.
         To understand why this is useful, consider the following:
 
         - Iteration over file-like objects in Python uses a hidden read-ahead
@@ -1642,22 +2384,136 @@ class ExternalCommand(ControllableProcess):
             self.start()
         for is_enabled, value_property in (('capture', 'stdout'), ('capture_stderr', 'stderr')):
             if getattr(self, is_enabled):
-                stream = getattr(self, value_property)
                 if self.buffered:
-                    text = stream.decode(self.encoding)
-                    return iter(text.splitlines())
+                    cached_stream = getattr(self, '%s_stream' % value_property)
+                    lines = cached_stream.get_view(('lines', self.encoding),
+                                                   lambda raw: raw.decode(self.encoding).splitlines())
+                    return iter(lines)
                 else:
                     # For posterity: I've tried codecs.getreader(self.encoding)
                     # here (because it seemed a more elegant and performant
                     # solution then decoding per line) but the resulting stream
                     # is affected by the `hidden read-ahead buffer' problem and
-                    # I found no way to work around that.
-                    return iter(lambda: stream.readline().decode(self.encoding), u'')
+                    # I found no way to work around that. Reading chunks using
+                    # os.read() and decoding them using an incremental decoder
+                    # avoids the problem because os.read() returns as soon as
+                    # any output is available.
+                    fd = getattr(self, value_property).fileno()
+                    return iter_decoded_lines(iter(lambda: os.read(fd, 65536), b''), self.encoding)
+
+
+class BoundedBuffer(object):
+
+    """
+    A buffer that keeps only the start and/or end of the data written to it.
+
+    The first :attr:`head_size` bytes written to the buffer are kept as is,
+    of the remaining bytes only the last :attr:`tail_size` bytes are kept
+    (like a ring buffer) which means the memory used by the buffer is
+    bounded regardless of how much data is written to it.
+    """
+
+    def __init__(self, head_size=0, tail_size=0):
+        """
+        Initialize a :class:`BoundedBuffer` object.
+
+        :param head_size: The number of bytes to keep from the start (an integer).
+        :param tail_size: The number of bytes to keep from the end (an integer).
+        """
+        self.head = bytearray()
+        self.head_size = head_size
+        self.tail = bytearray()
+        self.tail_size = tail_size
+        self.total_size = 0
+
+    @property
+    def omitted_size(self):
+        """The number of bytes that were written to the buffer but not kept (an integer)."""
+        return self.total_size - len(self.head) - len(self.tail)
+
+    def write(self, data):
+        """
+        Write data to the buffer.
+
+        :param data: The data to write (a byte string).
+        """
+        self.total_size += len(data)
+        if len(self.head) < self.head_size:
+            available = self.head_size - len(self.head)
+            self.head += data[:available]
+            data = data[available:]
+        if data and self.tail_size > 0:
+            self.tail += data[-self.tail_size:]
+            excess = len(self.tail) - self.tail_size
+            if excess > 0:
+                del self.tail[:excess]
+
+    def getvalue(self):
+        """
+        Get the data that was kept.
+
+        :returns: A byte string with the start and the end of the data
+                  (concatenated without separator, use :attr:`omitted_size`
+                  to find out whether data was omitted in between).
+        """
+        return bytes(self.head + self.tail)
+
+    def close(self):
+        """Release the memory used by the buffer."""
+        self.head = bytearray()
+        self.tail = bytearray()
+
+
+class LineDecoder(object):
+
+    """
+    Incrementally decode byte strings into lines of text.
+
+    Each byte string is decoded using an incremental decoder from the
+    :mod:`codecs` module, which correctly handles multibyte characters that
+    are split between byte strings, and a line is returned as soon as its line
+    ending has been decoded. Lines are split on line feeds only (just like
+    :func:`file.readline()`).
+    """
+
+    def __init__(self, encoding, keepends=True):
+        """
+        Initialize a :class:`LineDecoder` object.
+
+        :param encoding: The name of the character encoding (a string).
+        :param keepends: :data:`True` to include line endings in the decoded
+                         lines (the default), :data:`False` otherwise.
+        """
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.ending = u'\n' if keepends else u''
+        self.pending = u''
+
+    def decode(self, data, final=False):
+        """
+        Decode a byte string.
+
+        :param data: The byte string to decode.
+        :param final: :data:`True` if this is the last byte string,
+                      :data:`False` otherwise.
+        :returns: A list of Unicode strings with the lines that were
+                  completed by `data`. When `final` is :data:`True` any
+                  remaining text without line ending is included.
+        """
+        self.pending += self.decoder.decode(data, final)
+        lines = []
+        if u'\n' in self.pending:
+            lines = self.pending.split(u'\n')
+            self.pending = lines.pop()
+            lines = [line + self.ending for line in lines]
+        if final and self.pending:
+            lines.append(self.pending)
+            self.pending = u''
+        return lines
 
 
 class CachedStream(object):
 
-    """Manages a temporary file with input for / output from an external command."""
+    """Manages a temporary file or spool with input for / output from an external command."""
 
     def __init__(self, command, kind):
         """
@@ -1674,16 +2530,42 @@ class CachedStream(object):
         self.cached_output = None
         self.fd = None
         self.filename = None
+        self.is_memory_file = False
         self.is_temporary_file = False
         self.kind = kind
+        self.lock = threading.Lock()
+        self.mappings = []
         self.null_device = None
+        self.is_spilled = False
+        self.num_bytes = None
+        self.reader = None
+        self.spool = None
+        self.views = {}
+        self.views_source = None
+        self.writer = None
 
     def prepare_temporary_file(self):
-        """Prepare the stream's temporary file."""
+        """
+        Prepare the stream's temporary file.
+
+        When :attr:`ExternalCommand.memory_files` is :data:`True` and
+        :func:`create_memory_file()` succeeds an anonymous memory file is used,
+        otherwise a named temporary file is created. In the first case
+        :attr:`filename` refers to the file descriptor in ``/proc/self/fd``
+        which means the file can be reopened (with its own file offset)
+        without knowing that it's an anonymous file.
+        """
         if not (self.fd and self.filename):
             self.is_temporary_file = True
-            self.fd, self.filename = tempfile.mkstemp(prefix='executor-', suffix='-%s.txt' % self.kind)
-            logger.debug("Connected %s stream to temporary file %s ..", self.kind, self.filename)
+            fd = create_memory_file('executor-%s' % self.kind) if self.command.memory_files else None
+            if fd is not None:
+                self.fd = fd
+                self.filename = '/proc/self/fd/%i' % fd
+                self.is_memory_file = True
+                logger.debug("Connected %s stream to anonymous memory file %s ..", self.kind, self.filename)
+            else:
+                self.fd, self.filename = tempfile.mkstemp(prefix='executor-', suffix='-%s.txt' % self.kind)
+                logger.debug("Connected %s stream to temporary file %s ..", self.kind, self.filename)
 
     def prepare_input(self):
         """
@@ -1693,7 +2575,15 @@ class CachedStream(object):
                   :class:`subprocess.Popen` as the ``stdin`` argument.
         """
         if self.command.input is not None:
-            if self.command.async and self.command.input is not True:
+            if is_input_stream(self.command.input):
+                try:
+                    # Connect file objects that have a file descriptor
+                    # directly to the command's standard input stream.
+                    return self.command.input.fileno()
+                except (AttributeError, EnvironmentError, ValueError):
+                    # Feed other input through a pipe (see start_writer()).
+                    return subprocess.PIPE
+            elif self.command.async and self.command.input is not True:
                 # Store the input provided by the caller in a temporary file
                 # and connect the file to the command's standard input stream.
                 self.prepare_temporary_file()
@@ -1728,7 +2618,18 @@ class CachedStream(object):
             self.redirect(file)
             return self.fd
         elif capture or (self.command.silent and not self.command.really_silent):
-            if self.command.async and self.command.buffered:
+            if self.command.capture_head is not None or self.command.capture_tail is not None:
+                # Capture the start and/or end of the stream in memory using
+                # a reader thread.
+                self.spool = BoundedBuffer(head_size=self.command.capture_head or 0,
+                                           tail_size=self.command.capture_tail or 0)
+                return subprocess.PIPE
+            elif self.command.async and self.command.buffered:
+                if self.command.spill_threshold is not None:
+                    # Capture the stream in memory (spilling to disk when the
+                    # threshold is exceeded) using a reader thread.
+                    self.spool = io.BytesIO()
+                    return subprocess.PIPE
                 # Capture the stream to a temporary file.
                 self.prepare_temporary_file()
                 return self.fd
@@ -1741,6 +2642,201 @@ class CachedStream(object):
                 self.null_device = open(os.devnull, 'wb')
             return self.null_device
 
+    def start_reader(self, pipe):
+        """
+        Start a background thread that copies output from a pipe to the spool.
+
+        :param pipe: The pipe connected to the output stream of the external
+                     command (a file object or :data:`None`).
+        :returns: :data:`True` if a thread was started, :data:`False` otherwise.
+
+        This method does nothing when :func:`prepare_output()` didn't create a
+        spool (see :attr:`ExternalCommand.spill_threshold`,
+        :attr:`ExternalCommand.capture_head` and
+        :attr:`ExternalCommand.capture_tail`).
+        """
+        if self.spool is not None and pipe is not None:
+            self.num_bytes = 0
+            self.reader = threading.Thread(target=self.copy_to_spool, args=(pipe,))
+            self.reader.daemon = True
+            self.reader.start()
+            return True
+        return False
+
+    def copy_to_spool(self, pipe):
+        """
+        Copy output from a pipe to the spool until the pipe is closed.
+
+        :param pipe: The pipe connected to the output stream of the external
+                     command (a file object).
+
+        This method runs in the background thread started by :func:`start_reader()`.
+        """
+        try:
+            fd = pipe.fileno()
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                with self.lock:
+                    self.spool.write(chunk)
+                    self.num_bytes += len(chunk)
+                    if (self.command.spill_threshold is not None and isinstance(self.spool, io.BytesIO)
+                            and self.spool.tell() > self.command.spill_threshold):
+                        self.spill()
+        finally:
+            pipe.close()
+
+    def start_writer(self, pipe):
+        """
+        Start a background thread that feeds streaming input to a pipe.
+
+        :param pipe: The pipe connected to the standard input stream of the
+                     external command (a file object or :data:`None`).
+        :returns: :data:`True` if a thread was started, :data:`False` otherwise.
+
+        This method does nothing unless :attr:`ExternalCommand.input` is a
+        file-like object or iterable (see :func:`is_input_stream()`).
+        """
+        if pipe is not None and is_input_stream(self.command.input):
+            self.writer = threading.Thread(target=self.copy_from_input, args=(pipe,))
+            self.writer.daemon = True
+            self.writer.start()
+            return True
+        return False
+
+    def copy_from_input(self, pipe):
+        """
+        Copy streaming input to a pipe until the input is exhausted.
+
+        :param pipe: The pipe connected to the standard input stream of the
+                     external command (a file object).
+
+        This method runs in the background thread started by :func:`start_writer()`.
+        """
+        value = self.command.input
+        try:
+            if hasattr(value, 'read'):
+                # Read file-like objects in chunks (the sentinel
+                # matches the type of string returned by read()).
+                chunks = iter(lambda: value.read(65536), value.read(0))
+            else:
+                chunks = iter(value)
+            for chunk in chunks:
+                if isinstance(chunk, text_type):
+                    chunk = chunk.encode(self.command.encoding)
+                pipe.write(chunk)
+            pipe.close()
+        except Exception as e:
+            if getattr(e, 'errno', None) == errno.EPIPE:
+                logger.debug("External command closed its %s stream before all input was written.", self.kind)
+            else:
+                logger.warning("Failed to feed input to external command!", exc_info=True)
+        finally:
+            try:
+                pipe.close()
+            except EnvironmentError:
+                pass
+
+    def spill(self):
+        """
+        Move the contents of the spool from memory to an anonymous file.
+
+        An anonymous memory file is used when
+        :attr:`ExternalCommand.memory_files` is :data:`True` (and
+        :func:`create_memory_file()` succeeds), otherwise a temporary file
+        that's removed immediately (using :func:`tempfile.TemporaryFile()`).
+        """
+        fd = create_memory_file('executor-%s' % self.kind) if self.command.memory_files else None
+        if fd is not None:
+            handle = os.fdopen(fd, 'w+b')
+        else:
+            handle = tempfile.TemporaryFile(prefix='executor-', suffix='-%s.txt' % self.kind)
+        logger.debug("Spilling %s stream to disk (more than %i bytes) ..", self.kind, self.command.spill_threshold)
+        handle.write(self.spool.getvalue())
+        handle.flush()
+        self.spool = handle
+        self.is_spilled = True
+
+    def get_size(self):
+        """
+        Get the total number of bytes written to the stream.
+
+        :returns: The number of bytes (an integer) or :data:`None` when the
+                  stream was never initialized.
+
+        When the output was captured by a reader thread (see
+        :func:`start_reader()`) this is the number of bytes read from the
+        pipe (which can be more than the number of bytes that were kept),
+        otherwise it's the length of the captured output.
+        """
+        if self.num_bytes is not None:
+            return self.num_bytes
+        if self.cached_output is None and self.is_spilled:
+            with self.lock:
+                self.spool.flush()
+                return os.fstat(self.spool.fileno()).st_size
+        output = self.load()
+        if output is not None:
+            return len(output)
+
+    def get_view(self, key, function):
+        """
+        Get a cached value derived from the stream's contents.
+
+        :param key: A hashable value that identifies the derived value (for
+                    example a tuple with a name and an encoding).
+        :param function: A callable that takes the stream's contents (a byte
+                         string) and returns the derived value.
+        :returns: The derived value or :data:`None` when the stream was never
+                  initialized.
+
+        Derived values (like decoded text) are cached until the contents of
+        the stream change (while the command is running) or :func:`reset()`
+        is called, so that :attr:`ExternalCommand.output` and friends don't
+        need to decode the output on every access.
+        """
+        output = self.load()
+        if output is not None:
+            if self.views_source is not output:
+                self.views = {}
+                self.views_source = output
+            if key not in self.views:
+                self.views[key] = function(output)
+            return self.views[key]
+
+    def view(self):
+        """
+        Get a read only view of the stream's contents without copying them.
+
+        :returns: A :class:`memoryview` object or :data:`None` when the stream
+                  was never initialized.
+
+        When the output is kept in a file (see
+        :attr:`ExternalCommand.spill_threshold` and :func:`finalize()`) and
+        hasn't been loaded yet the file is mapped into memory (using
+        :mod:`mmap`) instead of being read, otherwise a view of the output in
+        memory is returned. Memory mappings are closed by :func:`close_spool()`
+        and :func:`cleanup()`. On Python 2 :class:`memoryview` doesn't
+        support memory mappings, in that case the output is loaded instead.
+        """
+        if self.cached_output is None and self.is_spilled:
+            with self.lock:
+                self.spool.flush()
+                size = os.fstat(self.spool.fileno()).st_size
+                if size > 0:
+                    mapping = mmap.mmap(self.spool.fileno(), size, access=mmap.ACCESS_READ)
+                    try:
+                        view = memoryview(mapping)
+                    except TypeError:
+                        mapping.close()
+                    else:
+                        self.mappings.append(mapping)
+                        return view
+        output = self.load()
+        if output is not None:
+            return memoryview(output)
+
     def redirect(self, obj):
         """
         Capture the stream in a file provided by the caller.
@@ -1753,6 +2849,11 @@ class CachedStream(object):
         except Exception:
             msg = "Can't capture %s stream to file object without file descriptor!"
             raise ValueError(msg % self.kind)
+        # Pipes, sockets and devices are connected as is (their contents
+        # can't be loaded afterwards so we don't need a filename).
+        if not stat.S_ISREG(os.fstat(self.fd).st_mode):
+            logger.debug("Connected %s stream to file descriptor %i ..", self.kind, self.fd)
+            return
         # Try to get the filename.
         self.filename = getattr(obj, 'name', None)
         if not self.filename:
@@ -1767,7 +2868,18 @@ class CachedStream(object):
         :returns: The output of the stream (a string) or :data:`None` when the
                   stream was never initialized.
         """
-        if self.filename and os.path.isfile(self.filename):
+        if self.spool is not None:
+            # The reader thread may still be appending to the spool.
+            with self.lock:
+                if isinstance(self.spool, BoundedBuffer):
+                    self.cached_output = self.spool.getvalue()
+                else:
+                    self.spool.seek(0)
+                    self.cached_output = self.spool.read()
+            # Once the output is complete we no longer need the spool.
+            if self.reader is None:
+                self.close_spool()
+        elif self.filename and os.path.isfile(self.filename):
             with open(self.filename, 'rb') as handle:
                 self.cached_output = handle.read()
         return self.cached_output
@@ -1783,27 +2895,94 @@ class CachedStream(object):
         if output is not None:
             self.cached_output = output
         else:
-            self.load()
+            # Wait for the reader thread to copy the remaining output.
+            if self.reader is not None:
+                self.reader.join()
+                self.reader = None
+            # Output that was spilled to disk is loaded on demand.
+            if not (self.is_spilled or self.keep_temporary_file()):
+                self.load()
         self.cleanup()
 
+    def keep_temporary_file(self):
+        """
+        Keep large output in the temporary file instead of loading it into memory.
+
+        :returns: :data:`True` if the output is kept in the temporary file,
+                  :data:`False` otherwise.
+
+        When :attr:`ExternalCommand.lazy_loading` is enabled, the output was
+        captured to a temporary file (created by
+        :func:`prepare_temporary_file()`) and is larger than
+        :data:`LAZY_LOAD_THRESHOLD` the file descriptor of the temporary file
+        is used as the spool (just like output that was spilled to disk, see
+        :func:`spill()`) so that the output is loaded on demand by
+        :func:`load()` or mapped into memory by :func:`view()`. The named
+        temporary file is still removed by :func:`cleanup()` (the open file
+        descriptor keeps its contents available).
+        """
+        if self.command.lazy_loading and self.is_temporary_file and self.fd is not None and self.spool is None:
+            if os.fstat(self.fd).st_size > LAZY_LOAD_THRESHOLD:
+                self.spool = os.fdopen(self.fd, 'rb')
+                self.fd = None
+                self.is_spilled = True
+                return True
+        return False
+
     def cleanup(self):
         """Cleanup temporary resources."""
+        if self.writer is not None:
+            self.writer.join()
+            self.writer = None
         if self.is_temporary_file:
             if self.fd is not None:
                 os.close(self.fd)
                 self.fd = None
             if self.filename:
-                if os.path.isfile(self.filename):
+                # Anonymous memory files disappear when their
+                # (last) file descriptor is closed.
+                if not self.is_memory_file and os.path.isfile(self.filename):
                     os.unlink(self.filename)
                 self.filename = None
+            self.is_memory_file = False
             self.is_temporary_file = False
         if self.null_device is not None:
             self.null_device.close()
             self.null_device = None
+        self.close_mappings()
+        if self.reader is None and not self.is_spilled:
+            self.close_spool()
+
+    def close_mappings(self):
+        """
+        Close the memory mappings created by :func:`view()`.
+
+        Mappings that are still exported by a :class:`memoryview` held by the
+        caller can't be closed yet, those are unmapped when the last view is
+        garbage collected.
+        """
+        while self.mappings:
+            try:
+                self.mappings.pop().close()
+            except BufferError:
+                pass
+
+    def close_spool(self):
+        """Release the spool (see :attr:`ExternalCommand.spill_threshold`) and any memory mappings of it."""
+        self.close_mappings()
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        self.is_spilled = False
 
     def reset(self):
         """Reset internal state."""
         self.cached_output = None
+        self.num_bytes = None
+        self.views = {}
+        self.views_source = None
+        if self.reader is None:
+            self.close_spool()
         self.cleanup()
 
 
@@ -1932,6 +3111,91 @@ def is_executable(filename, mode=os.F_OK | os.X_OK):
     return os.path.exists(filename) and os.access(filename, mode) and not os.path.isdir(filename)
 
 
+def iter_decoded_lines(chunks, encoding, keepends=True):
+    """
+    Incrementally decode byte strings and generate lines of text.
+
+    :param chunks: An iterable of byte strings (for example the output of
+                   a command, as it becomes available).
+    :param encoding: The name of the character encoding (a string).
+    :param keepends: :data:`True` to include line endings in the generated
+                     lines (the default), :data:`False` otherwise.
+    :returns: A generator of Unicode strings (one per line).
+
+    This is a generator based wrapper for :class:`LineDecoder`. Any remaining
+    text without line ending is generated once `chunks` is exhausted.
+    """
+    decoder = LineDecoder(encoding, keepends)
+    for chunk in chunks:
+        for line in decoder.decode(chunk):
+            yield line
+    for line in decoder.decode(b'', final=True):
+        yield line
+
+
+def is_input_stream(value):
+    """
+    Check whether a value can be used as streaming input for an external command.
+
+    :param value: The value of :attr:`ExternalCommand.input`.
+    :returns: :data:`True` if the value is a file-like object (it has a
+              ``read()`` method) or an iterable that isn't a string,
+              :data:`False` otherwise.
+    """
+    if value is None or value is True or isinstance(value, (bytes, string_types, text_type)):
+        return False
+    return hasattr(value, 'read') or hasattr(value, '__iter__')
+
+
+def strip_output(text):
+    """
+    Strip surrounding whitespace from single line output.
+
+    :param text: The output of a command (a string).
+    :returns: The string with leading and trailing whitespace stripped if
+              the result doesn't contain any newlines, otherwise the original
+              string (refer to :attr:`ExternalCommand.output` for details).
+    """
+    stripped_text = text.strip()
+    return stripped_text if '\n' not in stripped_text else text
+
+
+def create_memory_file(name):
+    """
+    Create an anonymous file that lives in memory.
+
+    :param name: The name of the file (a string, only used for debugging, it
+                 shows up in ``/proc/$PID/fd``).
+    :returns: The file descriptor (an integer) or :data:`None` when anonymous
+              memory files aren't supported.
+
+    This uses :func:`os.memfd_create()` when available (Python 3.8 and later)
+    and otherwise calls the ``memfd_create()`` function in the C library using
+    :mod:`ctypes`. Because the file doesn't have a name in the file system it
+    can only be reopened using ``/proc/self/fd`` which is why :data:`None` is
+    returned when ``/proc`` isn't available. The file descriptor has the
+    close-on-exec flag set, which means it's only inherited by child processes
+    that use it as a standard stream.
+    """
+    if not os.path.isdir('/proc/self/fd'):
+        return None
+    if hasattr(os, 'memfd_create'):
+        try:
+            return os.memfd_create(name, os.MFD_CLOEXEC)
+        except OSError:
+            return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.memfd_create(name.encode('ascii'), 1)
+        return fd if fd >= 0 else None
+    except Exception:
+        # The C library doesn't define memfd_create() (glibc < 2.27) or
+        # we're not running on Linux.
+        return None
+
+
 def validate_ionice_class(value):
     """
     Ensure that the given value is a valid I/O scheduling class for ionice_.
@@ -1949,6 +3213,22 @@ def validate_ionice_class(value):
     return value
 
 
+def validate_process_group(value):
+    """
+    Validate a process group mode (see :attr:`ExternalCommand.process_group`).
+
+    :param value: The value to validate (a string).
+    :returns: The validated value (one of the strings 'group' or 'session').
+    :raises: :exc:`~exceptions.ValueError` when the given value isn't one of
+             the strings mentioned above.
+    """
+    expected = ('group', 'session')
+    if value not in expected:
+        msg = "Invalid process group mode! (got %r while valid options are %s)"
+        raise ValueError(msg % (value, concatenate(expected)))
+    return value
+
+
 class ExternalCommandFailed(PropertyManager, Exception):
 
     """
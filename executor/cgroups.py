@@ -0,0 +1,460 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 19, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Control group (cgroup v2) support for external commands and command pools.
+
+The :mod:`executor.cgroups` module defines the :class:`ControlGroup` class
+which can be used to place external commands (see
+:attr:`.ExternalCommand.cgroup`) and command pools (see
+:attr:`.CommandPool.cgroup`) in their own cgroup v2 subtree. This makes it
+possible to:
+
+- Limit the CPU time, memory and disk I/O available to commands (using the
+  ``cpu.max``, ``memory.max`` and ``io.max`` interface files).
+
+- Find out how much memory and CPU time commands used (using the
+  ``memory.peak`` and ``cpu.stat`` interface files).
+
+- Reliably kill all processes started by a command, including daemonized
+  grandchildren that are no longer part of the process tree.
+
+Creating control groups requires write access to the parent group, which is
+why :attr:`ControlGroup.parent` defaults to the control group of the current
+process (under systemd this is usually part of a subtree that is delegated to
+the current user). To apply limits the relevant controllers also need to be
+available in the parent group and because of the "no internal processes" rule
+of cgroup v2 controllers can't be enabled in a group that contains processes
+itself, so when limits are used :attr:`ControlGroup.parent` should be set to a
+(delegated) group that doesn't contain the current process (for example using
+the ``Delegate=yes`` option of systemd units).
+"""
+
+# Standard library modules.
+import errno
+import logging
+import os
+import signal
+import time
+import uuid
+
+# External dependencies.
+from property_manager import PropertyManager, mutable_property, writable_property
+
+# Initialize a logger for this module.
+logger = logging.getLogger(__name__)
+
+CGROUP_FILESYSTEM_TYPE = 'cgroup2'
+"""The file system type of the cgroup v2 hierarchy (a string)."""
+
+KILL_TIMEOUT = 10
+"""The number of seconds :func:`ControlGroup.kill()` waits for processes to disappear (a number)."""
+
+
+class ControlGroup(PropertyManager):
+
+    """
+    A cgroup v2 control group that can contain external commands.
+
+    Control groups are created on demand by :func:`create()`, which also
+    applies the configured :attr:`cpu_max`, :attr:`io_max` and
+    :attr:`memory_max` limits. Processes are moved into the group by
+    :func:`join()` (which is called in child processes before the external
+    command is executed, so that all descendants of the command inherit the
+    group). After a command has ended :attr:`statistics` can be used to find
+    out how much resources it used.
+    """
+
+    @mutable_property
+    def cpu_max(self):
+        """
+        The CPU bandwidth limit for the control group (a string, number or :data:`None`).
+
+        Strings are written to ``cpu.max`` as is (for example ``'50000
+        100000'`` means 50 milliseconds every 100 milliseconds), numbers are
+        interpreted as a number of CPUs (for example 1.5 allows the group to
+        use one and a half CPUs).
+        """
+
+    @mutable_property
+    def io_max(self):
+        """
+        Disk I/O limits for the control group (a dictionary, string or :data:`None`).
+
+        Strings are written to ``io.max`` as is, dictionaries map device
+        numbers (strings like ``'8:0'``) to limits (strings like ``'rbps=1048576
+        wiops=120'``).
+        """
+
+    @mutable_property
+    def memory_max(self):
+        """The memory limit for the control group in bytes (an integer, string or :data:`None`)."""
+
+    @writable_property(cached=True)
+    def name(self):
+        """
+        The name of the control group (a string).
+
+        Defaults to a unique name based on the process ID of the current
+        process and a random UUID.
+        """
+        return 'executor-%i-%s' % (os.getpid(), uuid.uuid4().hex[:12])
+
+    @mutable_property
+    def parent(self):
+        """
+        The parent group (a :class:`ControlGroup` object, pathname or :data:`None`).
+
+        When this is :data:`None` (the default) the control group of the
+        current process (as returned by :func:`find_current_cgroup()`) is used.
+        """
+
+    @property
+    def controllers(self):
+        """The controllers required for the configured limits (a list of strings)."""
+        controllers = []
+        if self.cpu_max is not None:
+            controllers.append('cpu')
+        if self.io_max:
+            controllers.append('io')
+        if self.memory_max is not None:
+            controllers.append('memory')
+        return controllers
+
+    @property
+    def cpu_stat(self):
+        """
+        The contents of ``cpu.stat`` (a dictionary of integers).
+
+        Keys are names like ``usage_usec``, ``user_usec`` and ``system_usec``.
+        When the control group doesn't exist the dictionary is empty.
+        """
+        statistics = {}
+        contents = self.read_file('cpu.stat')
+        for line in (contents or '').splitlines():
+            tokens = line.split()
+            if len(tokens) == 2 and tokens[1].isdigit():
+                statistics[tokens[0]] = int(tokens[1])
+        return statistics
+
+    @property
+    def exists(self):
+        """:data:`True` if the control group exists, :data:`False` otherwise."""
+        return os.path.isdir(self.path)
+
+    @property
+    def memory_peak(self):
+        """The peak memory usage of the control group in bytes (an integer or :data:`None`)."""
+        value = self.read_file('memory.peak')
+        return int(value) if value and value.isdigit() else None
+
+    @property
+    def parent_path(self):
+        """The pathname of the parent group (a string)."""
+        if isinstance(self.parent, ControlGroup):
+            return self.parent.path
+        elif self.parent:
+            return self.parent
+        current = find_current_cgroup()
+        if not current:
+            raise EnvironmentError("The cgroup v2 file system is not mounted!")
+        return current
+
+    @property
+    def path(self):
+        """The pathname of the control group (a string)."""
+        return os.path.join(self.parent_path, self.name)
+
+    @property
+    def procs_file(self):
+        """The pathname of the ``cgroup.procs`` interface file of the control group (a string)."""
+        return os.path.join(self.path, 'cgroup.procs')
+
+    @property
+    def pids(self):
+        """The process IDs of the processes in the control group and its descendants (a list of integers)."""
+        pids = []
+        if self.exists:
+            for directory, subdirectories, filenames in os.walk(self.path):
+                contents = read_interface_file(os.path.join(directory, 'cgroup.procs'))
+                pids.extend(int(token) for token in (contents or '').split())
+        return pids
+
+    @property
+    def statistics(self):
+        """
+        Resource usage of the control group (a dictionary).
+
+        The dictionary has the keys ``memory_peak`` (refer to
+        :attr:`memory_peak`) and ``cpu_stat`` (refer to :attr:`cpu_stat`).
+        """
+        return dict(cpu_stat=self.cpu_stat, memory_peak=self.memory_peak)
+
+    def create(self):
+        """
+        Create the control group and apply the configured limits.
+
+        :raises: :exc:`~exceptions.EnvironmentError` when the cgroup v2 file
+                 system is not mounted, the parent group is not writable or
+                 one of the limits can't be applied.
+
+        When :attr:`parent` is a :class:`ControlGroup` object it is created
+        first. This method does nothing (except applying limits) when the
+        control group already exists.
+        """
+        if isinstance(self.parent, ControlGroup):
+            self.parent.create()
+        if not self.exists:
+            logger.debug("Creating control group %s ..", self.path)
+            os.mkdir(self.path)
+        if self.controllers:
+            self.enable_controllers(self.controllers)
+        if self.cpu_max is not None:
+            value = self.cpu_max
+            if isinstance(value, (int, float)):
+                period = 100000
+                value = '%i %i' % (int(value * period), period)
+            self.write_file('cpu.max', value)
+        if self.io_max:
+            if isinstance(self.io_max, dict):
+                for device, limits in sorted(self.io_max.items()):
+                    self.write_file('io.max', '%s %s' % (device, limits))
+            else:
+                self.write_file('io.max', self.io_max)
+        if self.memory_max is not None:
+            self.write_file('memory.max', str(self.memory_max))
+
+    def enable_controllers(self, controllers):
+        """
+        Make controllers available in the control group.
+
+        :param controllers: A list of controller names (strings).
+
+        Controllers are enabled by writing to the ``cgroup.subtree_control``
+        file of the parent group. When :attr:`parent` is a
+        :class:`ControlGroup` object the controllers are enabled in the parent
+        first (because a controller can only be enabled in a group when it's
+        available in that group).
+        """
+        if isinstance(self.parent, ControlGroup):
+            self.parent.enable_controllers(controllers)
+        write_interface_file(
+            os.path.join(self.parent_path, 'cgroup.subtree_control'),
+            ' '.join('+%s' % name for name in controllers),
+        )
+
+    def join(self):
+        """
+        Move the current process into the control group.
+
+        :raises: :exc:`~exceptions.EnvironmentError` when the process can't be
+                 moved.
+
+        Because :attr:`path` may need to read ``/proc/self/mounts`` this
+        method shouldn't be called between :func:`os.fork()` and
+        :func:`os.execve()`, instead :func:`.create_preexec_fn()` resolves
+        :attr:`procs_file` in the parent process and the child process only
+        calls :func:`join_cgroup()`.
+        """
+        join_cgroup(self.procs_file)
+
+    def kill(self, timeout=KILL_TIMEOUT):
+        """
+        Forcefully kill all processes in the control group (including its descendants).
+
+        :param timeout: The number of seconds to wait for the processes to
+                        disappear (a number, defaults to :data:`KILL_TIMEOUT`).
+        :returns: :data:`True` if the control group is empty, :data:`False`
+                  otherwise.
+
+        On Linux 5.14 and later this uses ``cgroup.kill`` which atomically
+        kills all processes (even ones that are forking at the time), on older
+        kernels :func:`send_signal()` is used to send ``SIGKILL`` to each
+        process (repeatedly, to catch processes that were forked in the mean
+        time). Processes that have exited but haven't been reaped yet (zombies)
+        are no longer part of the control group, so this method can be used
+        before the main process of an external command is reaped.
+        """
+        kill_file = os.path.join(self.path, 'cgroup.kill')
+        use_kill_file = os.path.exists(kill_file)
+        deadline = time.time() + timeout
+        while self.pids:
+            if time.time() >= deadline:
+                logger.warning("Failed to kill processes in control group %s! (%s)", self.path, self.pids)
+                return False
+            if use_kill_file:
+                logger.debug("Killing processes in control group %s using cgroup.kill ..", self.path)
+                write_interface_file(kill_file, '1')
+            else:
+                self.send_signal(signal.SIGKILL)
+            time.sleep(0.1)
+        return True
+
+    def send_signal(self, number):
+        """
+        Send a signal to all processes in the control group (including its descendants).
+
+        :param number: The signal number (an integer).
+        """
+        logger.debug("Sending signal %i to processes in control group %s ..", number, self.path)
+        for pid in self.pids:
+            try:
+                os.kill(pid, number)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def destroy(self):
+        """
+        Remove the control group (and any descendant groups).
+
+        :returns: :data:`True` if the control group was removed, :data:`False`
+                  if it still contains processes.
+        """
+        if self.exists:
+            if self.pids:
+                logger.debug("Not removing control group %s because it still contains processes.", self.path)
+                return False
+            logger.debug("Removing control group %s ..", self.path)
+            for directory, subdirectories, filenames in os.walk(self.path, topdown=False):
+                os.rmdir(directory)
+        return True
+
+    def read_file(self, name):
+        """
+        Read one of the interface files of the control group.
+
+        :param name: The name of the interface file (a string).
+        :returns: The contents of the file (a string) or :data:`None` when
+                  the file doesn't exist.
+        """
+        return read_interface_file(os.path.join(self.path, name))
+
+    def write_file(self, name, value):
+        """
+        Write one of the interface files of the control group.
+
+        :param name: The name of the interface file (a string).
+        :param value: The value to write (a string).
+        """
+        logger.debug("Setting %s of control group %s to %r ..", name, self.path, value)
+        write_interface_file(os.path.join(self.path, name), value)
+
+    def __str__(self):
+        """Render the pathname of the control group."""
+        return self.path
+
+
+def coerce_cgroup(value):
+    """
+    Coerce a value to a :class:`ControlGroup` object.
+
+    :param value: A :class:`ControlGroup` object, a dictionary with keyword
+                  arguments for :class:`ControlGroup`, :data:`True` (to
+                  create a control group with default settings) or
+                  :data:`None`.
+    :returns: A :class:`ControlGroup` object or :data:`None`.
+    :raises: :exc:`~exceptions.ValueError` when the value can't be coerced.
+    """
+    if value is None or isinstance(value, ControlGroup):
+        return value
+    elif value is True:
+        return ControlGroup()
+    elif isinstance(value, dict):
+        return ControlGroup(**value)
+    else:
+        msg = "Expected a ControlGroup object, a dictionary, True or None, got %r instead!"
+        raise ValueError(msg % (value,))
+
+
+def find_cgroup_root():
+    """
+    Find the mount point of the cgroup v2 hierarchy.
+
+    :returns: The pathname of the mount point (a string) or :data:`None` when
+              the cgroup v2 file system is not mounted (for example because
+              the system uses cgroup v1 or isn't running Linux).
+    """
+    contents = read_interface_file('/proc/self/mounts')
+    for line in (contents or '').splitlines():
+        tokens = line.split()
+        if len(tokens) >= 3 and tokens[2] == CGROUP_FILESYSTEM_TYPE:
+            return tokens[1]
+
+
+def find_current_cgroup():
+    """
+    Find the control group of the current process.
+
+    :returns: The pathname of the control group in the cgroup v2 hierarchy
+              (a string) or :data:`None` when the cgroup v2 file system is not
+              mounted.
+
+    The control group is read from the ``0::`` entry in ``/proc/self/cgroup``.
+    When that entry is missing the root of the hierarchy is returned.
+    """
+    root = find_cgroup_root()
+    if root:
+        contents = read_interface_file('/proc/self/cgroup')
+        for line in (contents or '').splitlines():
+            hierarchy, _, path = line.partition('::')
+            if hierarchy == '0' and path.startswith('/'):
+                return os.path.join(root, path.lstrip('/')).rstrip('/')
+        return root
+
+
+def join_cgroup(procs_file):
+    """
+    Move the current process into a control group.
+
+    :param procs_file: The pathname of the ``cgroup.procs`` interface file of
+                       the control group (a string).
+
+    This only uses :func:`os.open()`, :func:`os.write()` and
+    :func:`os.close()` so that it's safe to call in a child process between
+    :func:`os.fork()` and :func:`os.execve()` (even when the parent process
+    is multithreaded).
+    """
+    fd = os.open(procs_file, os.O_WRONLY)
+    try:
+        os.write(fd, b'0')
+    finally:
+        os.close(fd)
+
+
+def read_interface_file(filename):
+    """
+    Read a file in the ``/proc`` or ``/sys`` file systems.
+
+    :param filename: The pathname of the file (a string).
+    :returns: The contents of the file without surrounding whitespace (a
+              string) or :data:`None` when the file doesn't exist.
+    """
+    try:
+        with open(filename) as handle:
+            return handle.read().strip()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def write_interface_file(filename, value):
+    """
+    Write a cgroup interface file.
+
+    :param filename: The pathname of the file (a string).
+    :param value: The value to write (a string).
+
+    This uses :func:`os.open()` and :func:`os.write()` to make sure the value
+    is written using a single system call (the kernel reports errors as the
+    result of the :func:`os.write()` call, which means buffered I/O would
+    report errors at an unexpected point).
+    """
+    fd = os.open(filename, os.O_WRONLY)
+    try:
+        os.write(fd, value.encode('ascii'))
+    finally:
+        os.close(fd)
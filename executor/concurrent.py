@@ -1,7 +1,7 @@
 # Programmer friendly subprocess wrapper.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: December 18, 2016
+# Last Change: October 19, 2026
 # URL: https://executor.readthedocs.io
 
 """
@@ -18,14 +18,26 @@ and :attr:`~.ExternalCommand.group_by` properties of the
 
 # Standard library modules.
 import logging
+import math
 import multiprocessing
 import os
 
 # External dependencies.
-from executor import ExternalCommandFailed
+from executor import ExternalCommandFailed, get_monotonic_time
 from executor import logger as parent_logger
-from humanfriendly import format, pluralize, Spinner, Timer
-from property_manager import PropertyManager, mutable_property
+from executor.cgroups import ControlGroup, coerce_cgroup
+from executor.limits import get_available_cpus, partition_cpus
+from executor.logs import (
+    COMPRESSION_METHODS,
+    LinePrefixer,
+    LogFile,
+    LogRelay,
+    coerce_log_sink,
+    validate_compression,
+)
+from executor.process import wait_for_processes
+from humanfriendly import format, format_timespan, pluralize, Spinner, Timer
+from property_manager import PropertyManager, mutable_property, set_property
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
@@ -50,13 +62,45 @@ class CommandPool(PropertyManager):
         """
         # Initialize instance variables.
         self.collected = set()
+        self.collected_commands = []
         self.commands = []
+        self.log_files = {}
+        self.log_relays = {}
+        self.pinned = set()
+        self.tick_durations = []
         # Transform `concurrency' from a positional into a keyword argument.
         if concurrency:
             options['concurrency'] = concurrency
         # Set writable properties based on keyword arguments.
         super(CommandPool, self).__init__(**options)
 
+    @mutable_property
+    def cgroup(self):
+        """
+        The control group of the pool (a :class:`.ControlGroup` object or :data:`None`).
+
+        When this property is set each command started by :func:`spawn()` is
+        placed in its own control group below the control group of the pool:
+
+        - Commands whose :attr:`~.ExternalCommand.cgroup` isn't set get a new
+          control group without limits (so that their resource usage can be
+          reported and their descendants can be reliably killed).
+
+        - Commands whose :attr:`~.ExternalCommand.cgroup` is set but doesn't
+          have a :attr:`~.ControlGroup.parent` are moved below the control
+          group of the pool.
+
+        The limits of the pool's control group apply to all commands in the
+        pool combined. After :func:`run()` has finished (or was aborted by an
+        exception) the control group of the pool is removed. Dictionaries and :data:`True` are accepted as well
+        (refer to :func:`.coerce_cgroup()`).
+        """
+
+    @cgroup.setter
+    def cgroup(self, value):
+        """Coerce and set the control group."""
+        set_property(self, 'cgroup', coerce_cgroup(value))
+
     @mutable_property
     def concurrency(self):
         """
@@ -73,6 +117,34 @@ class CommandPool(PropertyManager):
         """
         return multiprocessing.cpu_count()
 
+    @property
+    def concurrency_limit(self):
+        """
+        The number of external commands that :func:`spawn()` currently allows to run simultaneously (an integer).
+
+        This is the value of :attr:`concurrency`, subclasses can override this
+        property to adapt the concurrency while the pool is running (refer to
+        :class:`.RemoteCommandPool` for an example).
+        """
+        return self.concurrency
+
+    @mutable_property
+    def cpu_pinning(self):
+        """
+        Whether to pin commands to disjoint sets of CPUs (a boolean).
+
+        If this option is :data:`True` (not the default) the CPUs available to
+        the current process are divided into :attr:`concurrency` disjoint sets
+        and each command that is started by :func:`spawn()` is pinned (using
+        :attr:`.ExternalCommand.cpu_affinity`) to the set of CPUs that is
+        used by the least number of running commands. This avoids running
+        commands competing for the same CPUs and caches. Commands whose
+        :attr:`~.ExternalCommand.cpu_affinity` was set explicitly are left
+        alone, automatically assigned CPUs are cleared again by
+        :func:`collect()` (so a command that's run again is pinned again).
+        """
+        return False
+
     @mutable_property
     def delay_checks(self):
         """
@@ -86,6 +158,24 @@ class CommandPool(PropertyManager):
         """
         return False
 
+    @mutable_property
+    def live_output(self):
+        """
+        Whether to relay the output of running commands to the terminal (a boolean).
+
+        If this option is :data:`True` (not the default) the output of each
+        command is relayed to the terminal while the command is running, one
+        line at a time, with the identifier of the command as a prefix (refer
+        to :class:`.LinePrefixer`). The standard output and standard error
+        streams of commands are relayed to :data:`sys.stdout` and
+        :data:`sys.stderr` respectively. Because the output is relayed through
+        a pipe it isn't captured, so this option is ignored when
+        :attr:`logs_directory` or :attr:`logs_sink` is set. When
+        :attr:`spinner` is :data:`None` the spinner is disabled so that it
+        doesn't interfere with the output.
+        """
+        return False
+
     @mutable_property
     def logger(self):
         """
@@ -99,6 +189,31 @@ class CommandPool(PropertyManager):
         """
         return logger
 
+    @mutable_property
+    def logs_compression(self):
+        """
+        The compression method for log files (one of the strings 'gzip', 'bz2', 'lzma' or :data:`None`).
+
+        When this property and :attr:`logs_directory` are set the log files
+        are compressed while the external commands are running, and the
+        default log file names get the extension ``.gz``, ``.bz2`` or
+        ``.xz`` (refer to :data:`.COMPRESSION_METHODS`). Because compressed
+        files can't be handed to external commands directly, the output of
+        each running command is written to a pipe which is relayed to the log
+        file by a background thread (a :class:`.LogRelay`). The log files can
+        be inspected while commands are running using ``zcat``, ``bzcat`` or
+        ``xzcat`` (although the most recent output may not have been flushed
+        yet).
+
+        :raises: :exc:`~exceptions.ValueError` when the compression method
+                 isn't supported (refer to :func:`.validate_compression()`).
+        """
+
+    @logs_compression.setter
+    def logs_compression(self, value):
+        """Validate and set the compression method."""
+        set_property(self, 'logs_compression', validate_compression(value))
+
     @mutable_property
     def logs_directory(self):
         """
@@ -113,9 +228,48 @@ class CommandPool(PropertyManager):
         commands are finished, this enables `tail -f`_ to inspect the progress
         of commands that are still running and emitting output.
 
+        Refer to :attr:`logs_compression` and :attr:`logs_max_size` for ways
+        to limit the disk space used by the log files.
+
         .. _tail -f: https://en.wikipedia.org/wiki/Tail_(Unix)#File_monitoring
         """
 
+    @mutable_property
+    def logs_max_size(self):
+        """
+        The maximum number of bytes of output to store per log file (an integer or :data:`None`).
+
+        When this property and :attr:`logs_directory` are set only the first
+        :attr:`logs_max_size` bytes of (uncompressed) output of each command
+        are stored, the remaining output is discarded and a line is added to
+        the end of the log file that reports how many bytes were discarded
+        (refer to :data:`.TRUNCATION_MARKER`). Like :attr:`logs_compression`
+        this is implemented using a background thread per running command.
+        """
+
+    @mutable_property
+    def logs_sink(self):
+        """
+        A log sink that's shared by all commands in the pool (a :class:`.LogSink` object or :data:`None`).
+
+        When this property is set (before any external commands have been
+        started) the standard output and standard error streams of each
+        command are relayed to the log sink (by a :class:`.LogRelay` per
+        running command) instead of storing the output in one log file per
+        command (see :attr:`logs_directory`, which is ignored when
+        :attr:`logs_sink` is set). Use :func:`.LogSink.extract()` to get the
+        output of a single command. The pathname of a directory is accepted as
+        well (refer to :func:`.coerce_log_sink()`).
+
+        The log sink is flushed when :func:`run()` finishes but it isn't
+        closed, so that a log sink can be shared by multiple command pools.
+        """
+
+    @logs_sink.setter
+    def logs_sink(self, value):
+        """Coerce and set the log sink."""
+        set_property(self, 'logs_sink', coerce_log_sink(value))
+
     @property
     def is_finished(self):
         """:data:`True` if all commands in the pool have finished, :data:`False` otherwise."""
@@ -178,6 +332,40 @@ class CommandPool(PropertyManager):
         """
         return None
 
+    @property
+    def statistics(self):
+        """
+        Timing statistics about the commands in the pool (a dictionary).
+
+        The dictionary has the following keys:
+
+        ``runtime``
+         Percentiles of the :attr:`~.ExternalCommand.runtime` values of
+         finished commands.
+
+        ``queue_delay``
+         Percentiles of the :attr:`~.ExternalCommand.queue_delay` values of
+         started commands (the time between :func:`add()` and the moment the
+         command was started).
+
+        ``scheduler_overhead``
+         Percentiles of the time spent in :func:`spawn()` and :func:`collect()`
+         per iteration of the main loop in :func:`run()` (this excludes the
+         time spent sleeping between iterations).
+
+        Each value is a dictionary with the keys ``p50``, ``p95`` and ``p99``
+        whose values are numbers of seconds (floats) or :data:`None` when no
+        measurements are available yet. These statistics are intended to help
+        tune :attr:`concurrency` and the placement of commands.
+        """
+        runtimes = [cmd.runtime for id, cmd in self.commands if cmd.runtime is not None]
+        queue_delays = [cmd.queue_delay for id, cmd in self.commands if cmd.queue_delay is not None]
+        return dict(
+            runtime=summarize_timings(runtimes),
+            queue_delay=summarize_timings(queue_delays),
+            scheduler_overhead=summarize_timings(self.tick_durations),
+        )
+
     @property
     def unexpected_failures(self):
         """
@@ -199,7 +387,8 @@ class CommandPool(PropertyManager):
                            identifier is set to the number of commands in the
                            pool plus one (i.e. the first command gets id 1).
         :param log_file: Override the default log file name for the command
-                         (the identifier with ``.log`` appended) in case
+                         (the identifier with ``.log`` appended, followed by
+                         the extension for :attr:`logs_compression`) in case
                          :attr:`logs_directory` is set.
 
         When a command is added to a command pool the following options are
@@ -219,6 +408,8 @@ class CommandPool(PropertyManager):
         """
         # Configure the command to run asynchronously.
         command.async = True
+        # Remember when the command was queued for execution.
+        command.queued_time = get_monotonic_time()
         # Configure the command to run without a controlling terminal?
         if self.concurrency > 1:
             command.tty = False
@@ -229,16 +420,27 @@ class CommandPool(PropertyManager):
         if identifier is None:
             identifier = len(self.commands) + 1
         # Configure logging of command output?
-        if self.logs_directory:
+        if self.logs_sink is not None:
+            # The output is relayed to the log sink by start_relay() when the
+            # command is started.
+            self.log_files[identifier] = None
+        elif self.logs_directory:
             if log_file is None:
-                log_file = '%s.log' % identifier
+                log_file = '%s.log%s' % (identifier, COMPRESSION_METHODS.get(self.logs_compression, ''))
             pathname = os.path.join(self.logs_directory, log_file)
             directory = os.path.dirname(pathname)
             if not os.path.isdir(directory):
                 os.makedirs(directory)
-            handle = open(pathname, 'ab')
-            command.stdout_file = handle
-            command.stderr_file = handle
+            if self.logs_compression or self.logs_max_size is not None:
+                # The log file is opened by start_relay() when the command is started.
+                self.log_files[identifier] = pathname
+            else:
+                handle = open(pathname, 'ab')
+                command.stdout_file = handle
+                command.stderr_file = handle
+        elif self.live_output:
+            # The output is relayed to the terminal by start_relay().
+            self.log_files[identifier] = None
         # Add the command to the pool.
         self.commands.append((identifier, command))
 
@@ -256,50 +458,124 @@ class CommandPool(PropertyManager):
 
         If you're writing code where you want to own the main loop then
         consider calling :func:`spawn()` and :func:`collect()` directly instead
-        of using :func:`run()`.
+        of using :func:`run()`. If you want to process the results of commands
+        as soon as they finish then consider using :func:`iter_results()`.
 
         When :attr:`concurrency` is set to one, specific care is taken to make
         sure that the callbacks configured by :attr:`.start_event` and
         :attr:`.finish_event` are called in the expected (intuitive) order.
         """
+        for identifier, command in self.iter_results():
+            pass
+        return self.results
+
+    def iter_results(self):
+        """
+        Run the commands in the pool and yield the results as soon as commands finish.
+
+        :returns: A generator of tuples with two values each: The identifier
+                  of a command (refer to :func:`add()`) and the
+                  :class:`.ExternalCommand` object. The tuples are generated in
+                  the order in which the commands finished.
+        :raises: Any exceptions raised by :func:`collect()`. When
+                 :attr:`delay_checks` is :data:`True` this means that
+                 :exc:`CommandPoolFailed` is raised after the results of all
+                 commands have been generated.
+
+        This is the generator version of :func:`run()`: Instead of waiting for
+        all commands to finish, the results of commands are available to the
+        caller as soon as they have been collected, so that a few slow
+        commands don't hold back the processing of the results of the other
+        commands. When the caller stops consuming the generator before all
+        commands have finished (for example by breaking out of a loop), the
+        commands that are still running are terminated once the generator is
+        closed.
+        """
         # Start spawning processes to execute the commands.
         timer = Timer()
         logger.debug("Preparing to run %s with a concurrency of %i ..",
                      pluralize(self.num_commands, "command"),
                      self.concurrency)
+        num_generated = len(self.collected_commands)
+        interactive = False if (self.live_output and self.spinner is None) else self.spinner
         try:
-            with Spinner(interactive=self.spinner, timer=timer) as spinner:
-                num_started = 0
-                num_collected = 0
-                while not self.is_finished:
-                    # When concurrency is set to one (I know, initially it
-                    # sounds like a silly use case, bear with me) I want the
-                    # start_event and finish_event callbacks of external
-                    # commands to fire in the right order. The following
-                    # conditional is intended to accomplish this goal.
-                    if self.concurrency > (num_started - num_collected):
-                        num_started += self.spawn()
-                    num_collected += self.collect()
-                    spinner.step(label=format(
-                        "Waiting for %i/%i %s",
-                        self.num_commands - self.num_finished, self.num_commands,
-                        "command" if self.num_commands == 1 else "commands",
-                    ))
-                    spinner.sleep()
-        except Exception:
-            if self.num_running > 0:
-                logger.warning("Command pool raised exception, terminating running commands!")
-            # Terminate commands that are still running.
-            self.terminate()
-            # Re-raise the exception to the caller.
-            raise
-        # Collect the output and return code of any commands not yet collected.
-        self.collect()
+            try:
+                with Spinner(interactive=interactive, timer=timer) as spinner:
+                    num_started = 0
+                    num_collected = 0
+                    while not self.is_finished:
+                        tick_started = get_monotonic_time()
+                        # When concurrency is set to one (I know, initially it
+                        # sounds like a silly use case, bear with me) I want the
+                        # start_event and finish_event callbacks of external
+                        # commands to fire in the right order. The following
+                        # conditional is intended to accomplish this goal.
+                        if self.concurrency > (num_started - num_collected):
+                            num_started += self.spawn()
+                        try:
+                            num_collected += self.collect()
+                        except CommandPoolFailed:
+                            # The exception is raised again by the call to
+                            # collect() below (after all results have been
+                            # generated).
+                            pass
+                        # Keep track of the scheduler overhead per tick.
+                        self.tick_durations.append(get_monotonic_time() - tick_started)
+                        # Report the results of newly collected commands.
+                        while num_generated < len(self.collected_commands):
+                            yield self.collected_commands[num_generated]
+                            num_generated += 1
+                        spinner.step(label=format(
+                            "Waiting for %i/%i %s",
+                            self.num_commands - self.num_finished, self.num_commands,
+                            "command" if self.num_commands == 1 else "commands",
+                        ))
+                        # Wake up as soon as one of the running commands ends
+                        # (when possible) instead of sleeping unconditionally.
+                        running = [cmd for id, cmd in self.commands if cmd.is_running]
+                        if not running or wait_for_processes(running, timeout=spinner.interval) is None:
+                            spinner.sleep()
+            except GeneratorExit:
+                # The caller stopped consuming the results.
+                self.terminate()
+                raise
+            except Exception:
+                if self.num_running > 0:
+                    logger.warning("Command pool raised exception, terminating running commands!")
+                # Terminate commands that are still running.
+                self.terminate()
+                # Re-raise the exception to the caller.
+                raise
+            # Collect the output and return code of any commands not yet collected.
+            try:
+                self.collect()
+                pool_failed = None
+            except CommandPoolFailed as e:
+                pool_failed = e
+            # Report the results of any commands not yet reported.
+            while num_generated < len(self.collected_commands):
+                yield self.collected_commands[num_generated]
+                num_generated += 1
+            if pool_failed is not None:
+                raise pool_failed
+        finally:
+            # Remove the control group of the pool (also when commands were
+            # terminated because of an exception or the caller stopped
+            # consuming the results).
+            if self.cgroup is not None:
+                self.cgroup.destroy()
+        # Make sure the output in the log sink is written to disk.
+        if self.logs_sink is not None:
+            self.logs_sink.flush()
         logger.debug("Finished running %s in %s.",
                      pluralize(self.num_commands, "command"),
                      timer)
-        # Report the results to the caller.
-        return self.results
+        runtime = self.statistics['runtime']
+        if runtime['p50'] is not None:
+            logger.debug("Command runtime percentiles: p50=%s, p95=%s, p99=%s.",
+                         format_timespan(runtime['p50']),
+                         format_timespan(runtime['p95']),
+                         format_timespan(runtime['p99']))
 
     def spawn(self):
         """
@@ -314,11 +590,15 @@ class CommandPool(PropertyManager):
            :data:`False`.
         2. The command's :attr:`~.ExternalCommand.group_by` value is not
            present in :attr:`running_groups`.
-        3. The :attr:`~.ExternalCommand.is_finished` properties of all of the
-           command's :attr:`~.ExternalCommand.dependencies` are :data:`True`.
+        3. :func:`is_ready()` returns :data:`True` (by default this means the
+           :attr:`~.ExternalCommand.is_finished` properties of all of the
+           command's :attr:`~.ExternalCommand.dependencies` are :data:`True`).
+
+        At most :attr:`concurrency_limit` commands are allowed to run
+        simultaneously.
         """
         num_started = 0
-        limit = self.concurrency - self.num_running
+        limit = self.concurrency_limit - self.num_running
         if limit > 0:
             running_groups = self.running_groups
             for id, cmd in self.commands:
@@ -329,8 +609,19 @@ class CommandPool(PropertyManager):
                     if cmd.group_by not in running_groups:
                         # If a command has any dependencies we won't allow it
                         # to start until all of its dependencies have finished.
-                        if all(dependency.is_finished for dependency in cmd.dependencies):
-                            cmd.start()
+                        if self.is_ready(cmd):
+                            if self.cpu_pinning and cmd.cpu_affinity is None:
+                                cmd.cpu_affinity = self.select_cpus()
+                                self.pinned.add(id)
+                            if self.cgroup is not None:
+                                if cmd.cgroup is None:
+                                    cmd.cgroup = ControlGroup(parent=self.cgroup)
+                                elif cmd.cgroup.parent is None:
+                                    cmd.cgroup.parent = self.cgroup
+                            if id in self.log_files:
+                                self.start_relay(id, cmd)
+                            else:
+                                cmd.start()
                             num_started += 1
                             if cmd.group_by is not None:
                                 running_groups.add(cmd.group_by)
@@ -340,6 +631,67 @@ class CommandPool(PropertyManager):
             logger.debug("Spawned %s ..", pluralize(num_started, "external command"))
         return num_started
 
+    def is_ready(self, command):
+        """
+        Check whether an external command that hasn't been started yet can be started.
+
+        :param command: An :class:`.ExternalCommand` object.
+        :returns: :data:`True` if all of the command's
+                  :attr:`~.ExternalCommand.dependencies` have finished,
+                  :data:`False` otherwise.
+
+        This method is called by :func:`spawn()` right before a command is
+        started (it's not called when the command can't be started for other
+        reasons). Subclasses can override this method to hold back commands.
+        """
+        return all(dependency.is_finished for dependency in command.dependencies)
+
+    def start_relay(self, identifier, command):
+        """
+        Start an external command whose output is relayed to a log file.
+
+        :param identifier: The identifier of the command (refer to :func:`add()`).
+        :param command: The :class:`.ExternalCommand` object to start.
+
+        Refer to :attr:`logs_compression`, :attr:`logs_max_size`,
+        :attr:`logs_sink` and :attr:`live_output` for details. The relay is stopped by :func:`collect()`.
+        """
+        if self.logs_sink is not None:
+            relay = LogRelay(self.logs_sink.get_writer(identifier))
+            handles = [relay.create_pipe('stdout'), relay.create_pipe('stderr')]
+        elif self.log_files[identifier] is None:
+            relay = LogRelay(LinePrefixer('%s: ' % identifier))
+            handles = [relay.create_pipe('stdout'), relay.create_pipe('stderr')]
+        else:
+            relay = LogRelay(LogFile(
+                filename=self.log_files[identifier],
+                compression=self.logs_compression,
+                max_size=self.logs_max_size,
+            ))
+            handles = [relay.create_pipe('output')] * 2
+        command.stdout_file, command.stderr_file = handles
+        try:
+            command.start()
+        finally:
+            # Close our copies of the write ends of the pipes so that the
+            # relay sees the end of the output when the command exits.
+            for handle in handles:
+                handle.close()
+            relay.start()
+            self.log_relays[identifier] = relay
+
+    def select_cpus(self):
+        """
+        Select the set of CPUs for the next command started by :func:`spawn()`.
+
+        :returns: A list of CPU numbers (integers).
+
+        Refer to :attr:`cpu_pinning` for details.
+        """
+        partitions = partition_cpus(get_available_cpus(), self.concurrency)
+        in_use = [cmd.cpu_affinity for id, cmd in self.commands if cmd.is_running]
+        return min(partitions, key=lambda cpus: in_use.count(cpus))
+
     def collect(self):
         """
         Collect the exit codes and output of finished commands.
@@ -377,6 +729,15 @@ class CommandPool(PropertyManager):
                 finally:
                     # Update our bookkeeping even if wait() raised an exception.
                     self.collected.add(identifier)
+                    self.collected_commands.append((identifier, command))
+                    # Release CPUs that were assigned by cpu_pinning.
+                    if identifier in self.pinned:
+                        self.pinned.discard(identifier)
+                        command.cpu_affinity = None
+                    # Wait for the remaining output to be written to the log file.
+                    relay = self.log_relays.pop(identifier, None)
+                    if relay is not None:
+                        relay.join()
                 num_collected += 1
         if num_collected > 0:
             logger.debug("Collected %s ..", pluralize(num_collected, "external command"))
@@ -406,6 +767,36 @@ class CommandPool(PropertyManager):
         return num_terminated
 
 
+def percentile(values, percent):
+    """
+    Compute a percentile using the nearest-rank method.
+
+    :param values: A list of numbers.
+    :param percent: The percentile to compute (a number between 0 and 100).
+    :returns: The requested percentile (a number) or :data:`None` when
+              `values` is empty.
+    """
+    if values:
+        ordered = sorted(values)
+        rank = int(math.ceil(percent / 100.0 * len(ordered)))
+        return ordered[max(rank, 1) - 1]
+
+
+def summarize_timings(values):
+    """
+    Summarize a list of timings as percentiles.
+
+    :param values: A list of numbers (durations in seconds).
+    :returns: A dictionary with the keys ``p50``, ``p95`` and ``p99``
+              (refer to :func:`percentile()`).
+    """
+    return dict(
+        p50=percentile(values, 50),
+        p95=percentile(values, 95),
+        p99=percentile(values, 99),
+    )
+
+
 class CommandPoolFailed(Exception):
 
     """
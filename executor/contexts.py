@@ -1,7 +1,7 @@
 # Programmer friendly subprocess wrapper.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: January 21, 2018
+# Last Change: October 19, 2026
 # URL: https://executor.readthedocs.io
 
 r"""
@@ -66,11 +66,14 @@ integration tools developed using Python:
 
 # Standard library modules.
 import contextlib
+import io
 import logging
 import multiprocessing
 import os
+import posixpath
 import random
 import socket
+import stat
 
 # External dependencies.
 from property_manager import (
@@ -78,18 +81,61 @@ from property_manager import (
     lazy_property,
     mutable_property,
     required_property,
+    set_property,
     writable_property,
 )
 
 # Modules included in our package.
-from executor import DEFAULT_SHELL, ExternalCommand, quote
+from executor import (
+    DEFAULT_SHELL,
+    DEFAULT_WORKING_DIRECTORY,
+    ExternalCommand,
+    ExternalCommandFailed,
+    quote,
+    transfer,
+    which,
+)
 from executor.chroot import ChangeRootCommand
+from executor.facts import FACTS_SCRIPT, FactCache, parse_facts
 from executor.schroot import DEFAULT_NAMESPACE, SCHROOT_PROGRAM_NAME, SecureChangeRootCommand
+from executor.sessions import ShellSession
 from executor.ssh.client import RemoteAccount, RemoteCommand
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 1024 * 64
+"""The default size of the chunks read by :func:`AbstractContext.read_chunks()` (an integer, 64 KiB)."""
+
+STAT_BATCH_SIZE = 1000
+"""The maximum number of pathnames checked by a single command in :func:`AbstractContext.stat_many()` (an integer)."""
+
+STAT_MANY_SCRIPT = r'''
+for pathname do
+  flags=
+  for operator in e f d r w; do
+    if test -$operator "$pathname"; then flags=$flags$operator; else flags=$flags-; fi
+  done
+  printf '%s\0' "$flags"
+done
+printf '\n'
+stat -L --printf '%f %s %Y %u %g\0' -- "$@" 2>/dev/null
+exit 0
+'''
+"""
+The shell script used by :func:`AbstractContext.stat_many()` (a string).
+
+The script receives the pathnames as positional arguments. For each pathname
+it reports the results of ``test -e``, ``-f``, ``-d``, ``-r`` and ``-w`` (as
+a string like ``ef-rw``), followed by a newline and the output of GNU stat_
+for the existing pathnames (the mode, size, modification time, owner and
+group). The output of ``stat`` is optional (it's ignored when the ``stat``
+program doesn't support ``--printf``). All records are terminated by NUL
+bytes so that pathnames never need to be parsed.
+
+.. _stat: https://www.gnu.org/software/coreutils/manual/html_node/stat-invocation.html
+"""
+
 
 def create_context(**options):
     """
@@ -123,6 +169,22 @@ def create_context(**options):
         return LocalContext(**options)
 
 
+def get_nested_identity(parent, identity):
+    """
+    Get the identity of a context that's nested in a parent context.
+
+    :param parent: The parent context (a context object or :data:`None` for
+                   the local system).
+    :param identity: The identity of the nested context relative to its
+                     parent (a string).
+    :returns: A string or :data:`None` when the parent context doesn't have
+              an identity (refer to :attr:`AbstractContext.identity`).
+    """
+    parent_identity = parent.identity if parent is not None else LocalContext().identity
+    if parent_identity is not None:
+        return '%s/%s' % (parent_identity, identity)
+
+
 class AbstractContext(PropertyManager):
 
     """
@@ -174,6 +236,35 @@ class AbstractContext(PropertyManager):
     def options(self):
         """The options that are passed to commands created by the context (a dictionary)."""
 
+    @mutable_property
+    def persistent_shell(self):
+        """
+        Whether to execute commands in a persistent shell (a boolean, defaults to :data:`False`).
+
+        When this is :data:`True` the commands started by :func:`execute()`,
+        :func:`test()` and :func:`capture()` (and the methods built on top of
+        them, like :func:`exists()` and :func:`read_file()`) are executed by a
+        long running shell in the context (see :attr:`shell_session`) instead
+        of starting a new process for every command. For remote contexts this
+        means all commands share a single SSH connection and a single remote
+        shell, which makes lots of small commands very cheap.
+
+        Commands that use options that the shell session doesn't support (for
+        example :attr:`~executor.ExternalCommand.input` or
+        :attr:`~executor.ExternalCommand.async`, refer to
+        :data:`~executor.sessions.SUPPORTED_OPTIONS`) are still executed as
+        separate processes. The shell is stopped when the outermost
+        :keyword:`with` block using the context ends (shells of contexts that
+        aren't used as context managers are stopped when the context is
+        garbage collected or the Python interpreter exits).
+        """
+        return False
+
+    @lazy_property
+    def shell_session(self):
+        """The persistent shell used when :attr:`persistent_shell` is :data:`True` (a :class:`.ShellSession` object)."""
+        return ShellSession(context=self)
+
     @mutable_property
     def parent(self):
         """
@@ -309,8 +400,27 @@ class AbstractContext(PropertyManager):
                   have already ended. Asynchronous commands don't have this
                   limitation of course.
         """
+        return self.start_command(command, options)
+
+    def start_command(self, command, options):
+        """
+        Prepare and start a command (using the persistent shell when applicable).
+
+        :param command: A tuple of strings (the positional arguments to the
+                        initializer of the :attr:`command_type` class).
+        :param options: A dictionary (the keyword arguments to the initializer
+                        of the :attr:`command_type` class).
+        :returns: The :attr:`command_type` object.
+
+        This method is used by :func:`execute()`, :func:`test()` and
+        :func:`capture()` to implement :attr:`persistent_shell`.
+        """
+        use_session = self.persistent_shell and self.shell_session.supports(options)
         cmd = self.prepare_command(command, options)
-        cmd.start()
+        if use_session:
+            self.shell_session.run(cmd, command, options)
+        else:
+            cmd.start()
         return cmd
 
     def test(self, *command, **options):
@@ -327,9 +437,7 @@ class AbstractContext(PropertyManager):
         :data:`False` and :attr:`~.ExternalCommand.silent` to :data:`True`.
         """
         options.update(check=False, silent=True)
-        cmd = self.prepare_command(command, options)
-        cmd.start()
-        return cmd.succeeded
+        return self.start_command(command, options).succeeded
 
     def capture(self, *command, **options):
         """
@@ -342,9 +450,7 @@ class AbstractContext(PropertyManager):
         :returns: The value of :attr:`.ExternalCommand.output`.
         """
         options['capture'] = True
-        cmd = self.prepare_command(command, options)
-        cmd.start()
-        return cmd.output
+        return self.start_command(command, options).output
 
     def cleanup(self, *args, **kw):
         """
@@ -406,13 +512,79 @@ class AbstractContext(PropertyManager):
         cmd.start()
         return cmd
 
+    @mutable_property
+    def fact_cache(self):
+        """
+        A :class:`~executor.facts.FactCache` that persists :attr:`facts` between contexts (defaults to :data:`None`).
+
+        When this is set the facts of the system are loaded from the cache
+        (when they haven't expired yet) instead of being gathered by executing
+        a command, which avoids a round trip per fact per context object for
+        scripts that create new contexts for the same systems on every run.
+        Contexts whose :attr:`identity` is :data:`None` don't use the cache.
+        The value :data:`True` is accepted as well (it's coerced to a new
+        :class:`~executor.facts.FactCache` object).
+        """
+
+    @fact_cache.setter
+    def fact_cache(self, value):
+        """Coerce and set the fact cache."""
+        set_property(self, 'fact_cache', FactCache() if value is True else value)
+
+    @property
+    def identity(self):
+        """
+        A string that identifies the system behind the context (or :data:`None`).
+
+        This is used as the key of :attr:`fact_cache`. The default is
+        :data:`None` (which disables :attr:`fact_cache`), subclasses override
+        this property.
+        """
+        return None
+
+    @lazy_property
+    def facts(self):
+        """
+        The facts about the system that are gathered in a single round trip (a dictionary).
+
+        The first time one of :attr:`distributor_id`,
+        :attr:`distribution_codename`, :attr:`have_ionice` or
+        :attr:`cpu_count` is accessed all of them are loaded from
+        :attr:`fact_cache` or gathered using :func:`gather_facts()` (in which
+        case :attr:`fact_cache` is updated).
+        """
+        use_cache = self.fact_cache is not None and self.identity is not None
+        facts = self.fact_cache.load(self.identity) if use_cache else None
+        if facts is None:
+            facts = self.gather_facts()
+            if use_cache and facts:
+                self.fact_cache.save(self.identity, facts)
+        return facts
+
+    def gather_facts(self):
+        """
+        Gather the facts about the system by executing :data:`~executor.facts.FACTS_SCRIPT`.
+
+        :returns: A dictionary with facts (refer to
+                  :func:`~executor.facts.parse_facts()`). When the script
+                  can't be executed an empty dictionary is returned, in which
+                  case the properties that depend on :attr:`facts` fall back
+                  to executing their own commands.
+        """
+        try:
+            return parse_facts(self.capture(FACTS_SCRIPT, shell=True, check=False, silent=True))
+        except (EnvironmentError, ExternalCommandFailed):
+            return {}
+
     @lazy_property
     def distributor_id(self):
         """
         The distributor ID of the system (a lowercased string like ``debian`` or ``ubuntu``).
 
-        This is the lowercased output of ``lsb_release --short --id``.
+        This is the lowercased output of ``lsb_release --short --id`` (refer to :attr:`facts`).
         """
+        if 'distributor_id' in self.facts:
+            return self.facts['distributor_id']
         return self.capture('lsb_release', '--short', '--id', check=False, silent=True).lower()
 
     @lazy_property
@@ -420,15 +592,24 @@ class AbstractContext(PropertyManager):
         """
         The code name of the system's distribution (a lowercased string like ``precise`` or ``trusty``).
 
-        This is the lowercased output of ``lsb_release --short --codename``.
+        This is the lowercased output of ``lsb_release --short --codename`` (refer to :attr:`facts`).
         """
+        if 'distribution_codename' in self.facts:
+            return self.facts['distribution_codename']
         return self.capture('lsb_release', '--short', '--codename', check=False, silent=True).lower()
 
     @lazy_property
     def have_ionice(self):
-        """:data:`True` when ionice_ is installed, :data:`False` otherwise."""
+        """:data:`True` when ionice_ is installed, :data:`False` otherwise (refer to :attr:`facts`)."""
+        if 'have_ionice' in self.facts:
+            return self.facts['have_ionice']
         return bool(self.find_program('ionice'))
 
+    @lazy_property
+    def have_rsync(self):
+        """:data:`True` when rsync_ is installed, :data:`False` otherwise (used by :func:`prepare_rsync()`)."""
+        return bool(self.find_program('rsync'))
+
     @property
     def have_superuser_privileges(self):
         """:data:`True` if the context has superuser privileges, :data:`False` otherwise."""
@@ -456,6 +637,62 @@ class AbstractContext(PropertyManager):
         """
         return self.test('test', '-e', pathname)
 
+    def exists_many(self, pathnames):
+        """
+        Check whether multiple pathnames exist using a single command.
+
+        :param pathnames: An iterable of strings with pathnames.
+        :returns: A dictionary that maps the pathnames to booleans.
+
+        Refer to :func:`stat_many()` for details.
+        """
+        return dict((pathname, status.exists) for pathname, status in self.stat_many(pathnames).items())
+
+    def stat_many(self, pathnames):
+        """
+        Get the status of multiple pathnames using a single command.
+
+        :param pathnames: An iterable of strings with pathnames.
+        :returns: A dictionary that maps the pathnames to :class:`PathStatus` objects.
+
+        Calling :func:`exists()`, :func:`is_file()`, :func:`is_directory()`,
+        :func:`is_readable()` and :func:`is_writable()` for lots of pathnames
+        executes lots of commands (which is slow, especially in a
+        :class:`RemoteContext` where each command sets up an SSH connection).
+        This method instead runs :data:`STAT_MANY_SCRIPT` once per
+        :data:`STAT_BATCH_SIZE` pathnames and parses the results. Options like
+        :attr:`~.ExternalCommand.sudo` are respected.
+        """
+        pathnames = list(pathnames)
+        results = {}
+        for offset in range(0, len(pathnames), STAT_BATCH_SIZE):
+            batch = pathnames[offset:offset + STAT_BATCH_SIZE]
+            output = self.execute('sh', '-c', STAT_MANY_SCRIPT, 'stat_many', *batch, capture=True).stdout
+            flags, _, details = output.partition(b'\n')
+            flags = flags.decode('ascii').split('\0')
+            details = [d.decode('ascii').split() for d in details.split(b'\0') if d]
+            if len(details) != sum(f.startswith('e') for f in flags):
+                # The stat program isn't available (or a pathname was created
+                # or removed while the script was running).
+                details = []
+            details.reverse()
+            for pathname, result in zip(batch, flags):
+                info = details.pop() if details and result.startswith('e') else None
+                results[pathname] = PathStatus(
+                    pathname=pathname,
+                    exists=('e' in result),
+                    is_file=('f' in result),
+                    is_directory=('d' in result),
+                    is_readable=('r' in result),
+                    is_writable=('w' in result),
+                    mode=int(info[0], 16) if info else None,
+                    size=int(info[1]) if info else None,
+                    mtime=int(info[2]) if info else None,
+                    uid=int(info[3]) if info else None,
+                    gid=int(info[4]) if info else None,
+                )
+        return results
+
     def is_file(self, pathname):
         """
         Check whether the given pathname points to an existing file.
@@ -539,6 +776,64 @@ class AbstractContext(PropertyManager):
         """
         return self.execute('cat > %s' % quote(filename), shell=True, input=contents)
 
+    def open_read(self, filename):
+        """
+        Open a file for streaming reads.
+
+        :param filename: The pathname of the file to read (a string).
+        :returns: A binary file-like object (an :class:`io.BufferedReader`
+                  object that reads from a :class:`CommandReader`).
+
+        Contrary to :func:`read_file()` the contents of the file are never
+        loaded into memory as a whole, instead they're read from the
+        standard output stream of cat_ as they are needed (so options like
+        :attr:`~.ExternalCommand.sudo` are respected). When the end of the
+        file is reached and cat_ failed :exc:`~executor.ExternalCommandFailed`
+        is raised. The returned object can be used as a context manager:
+
+        >>> with context.open_read('/var/log/syslog') as handle:
+        ...     for line in handle:
+        ...         process(line)
+        """
+        command = self.prepare('cat', filename, async=True, buffered=False, capture=True,
+                               capture_head=None, capture_tail=None, input=None)
+        return io.BufferedReader(CommandReader(command), CHUNK_SIZE)
+
+    def open_write(self, filename):
+        """
+        Open a file for streaming writes.
+
+        :param filename: The pathname of the file to write (a string).
+        :returns: A binary file-like object (an :class:`io.BufferedWriter`
+                  object that writes to a :class:`CommandWriter`).
+
+        This is the streaming counterpart of :func:`write_file()`: The data
+        written to the returned object is passed to the standard input stream
+        of cat_ (with its output redirected to the file) without keeping the
+        contents of the file in memory. When the file object is closed the
+        command is waited for and :exc:`~executor.ExternalCommandFailed` is
+        raised if it failed.
+        """
+        command = self.prepare('cat > %s' % quote(filename), shell=True, async=True, buffered=False,
+                               capture_head=None, capture_tail=None, input=True)
+        return io.BufferedWriter(CommandWriter(command), CHUNK_SIZE)
+
+    def read_chunks(self, filename, chunk_size=CHUNK_SIZE):
+        """
+        Read the contents of a file in chunks.
+
+        :param filename: The pathname of the file to read (a string).
+        :param chunk_size: The maximum size of each chunk (an integer,
+                           defaults to :data:`CHUNK_SIZE`).
+        :returns: A generator of byte strings (refer to :func:`open_read()`).
+        """
+        with self.open_read(filename) as handle:
+            while True:
+                chunk = handle.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
     @contextlib.contextmanager
     def atomic_write(self, filename):
         """
@@ -568,6 +863,77 @@ class AbstractContext(PropertyManager):
         else:
             self.execute('mv', temporary_file, filename)
 
+    def upload(self, paths, directory, compression=None):
+        """
+        Upload local files and/or directories to the context.
+
+        :param paths: An iterable of strings with local pathnames (each
+                      file or directory is extracted under its base name).
+        :param directory: The pathname of the directory in the context where
+                          the files should be extracted (a string, the
+                          directory is created when it doesn't exist yet).
+        :param compression: One of the keys of
+                            :data:`~executor.transfer.TAR_COMPRESSION_OPTIONS`
+                            or :data:`None` (the default) to disable
+                            compression.
+        :raises: :exc:`~executor.ExternalCommandFailed` when the transfer fails.
+
+        Contrary to :func:`write_file()` all files are transferred in a
+        single tar stream (using a single command and for remote contexts a
+        single SSH connection) that doesn't pass through the Python process.
+        Refer to :func:`executor.transfer.upload()` for details.
+        """
+        transfer.upload(self, paths, directory, compression)
+
+    def download(self, paths, directory, compression=None):
+        """
+        Download files and/or directories from the context.
+
+        :param paths: An iterable of strings with pathnames in the context
+                      (each file or directory is extracted under its base name).
+        :param directory: The pathname of the local directory where the files
+                          should be extracted (a string, the directory is
+                          created when it doesn't exist yet).
+        :param compression: Refer to :func:`upload()`.
+        :raises: :exc:`~executor.ExternalCommandFailed` when the transfer fails.
+
+        This is the counterpart of :func:`upload()` and
+        :func:`read_file()`, refer to :func:`executor.transfer.download()`
+        for details.
+        """
+        transfer.download(self, paths, directory, compression)
+
+    def sync(self, source_directory, target_directory, compression=None):
+        """
+        Copy the contents of a local directory to a directory in the context.
+
+        :param source_directory: The pathname of the local directory (a string).
+        :param target_directory: The pathname of the directory in the context (a string).
+        :param compression: Refer to :func:`upload()`.
+        :raises: :exc:`~executor.ExternalCommandFailed` when the transfer fails.
+
+        When rsync_ is available (refer to :func:`prepare_rsync()`) only the
+        differences are transferred, otherwise the contents of the source
+        directory are streamed using ``tar``. Refer to
+        :func:`executor.transfer.sync()` for details.
+
+        .. _rsync: https://rsync.samba.org/
+        """
+        transfer.sync(self, source_directory, target_directory, compression)
+
+    def prepare_rsync(self, source_directory, target_directory, compress=False):
+        """
+        Prepare to copy a local directory to the context using rsync_.
+
+        :param source_directory: The pathname of the local directory (a string).
+        :param target_directory: The pathname of the directory in the context (a string).
+        :param compress: :data:`True` to enable the ``--compress`` option of rsync_.
+        :returns: An :class:`~executor.ExternalCommand` object or :data:`None`
+                  when rsync_ can't be used (this is the default, subclasses
+                  that support rsync_ override this method).
+        """
+        return None
+
     def list_entries(self, directory):
         """
         List the entries in a directory.
@@ -626,7 +992,12 @@ class AbstractContext(PropertyManager):
         return self
 
     def __exit__(self, exc_type=None, exc_value=None, traceback=None):
-        """Execute any commands on the "undo stack" (refer to :func:`cleanup()`)."""
+        """
+        Execute any commands on the "undo stack" (refer to :func:`cleanup()`).
+
+        When the outermost :keyword:`with` block ends the persistent shell is
+        stopped (refer to :attr:`persistent_shell`).
+        """
         old_scope = self.undo_stack.pop()
         while old_scope:
             args, kw = old_scope.pop()
@@ -636,6 +1007,8 @@ class AbstractContext(PropertyManager):
                 function(*args, **kw)
             else:
                 self.execute(*args, **kw)
+        if not self.undo_stack and self.persistent_shell:
+            self.shell_session.close()
 
 
 class LocalContext(AbstractContext):
@@ -645,6 +1018,13 @@ class LocalContext(AbstractContext):
 
     Please refer to the base class :class:`AbstractContext` for details about
     initialization of :class:`LocalContext` objects.
+
+    When :attr:`native_access` is :data:`True` the methods :func:`exists()`,
+    :func:`is_file()`, :func:`is_directory()`, :func:`is_readable()`,
+    :func:`is_writable()`, :func:`read_file()`, :func:`list_entries()`,
+    :func:`find_program()` and :func:`stat_many()` are implemented in Python
+    instead of spawning ``test``, ``cat``, ``find`` and ``which`` (this avoids
+    the overhead of starting a process for every call).
     """
 
     @property
@@ -661,6 +1041,272 @@ class LocalContext(AbstractContext):
         """
         return multiprocessing.cpu_count()
 
+    @property
+    def native_access(self):
+        """
+        :data:`True` if the file system can be accessed directly from Python, :data:`False` otherwise.
+
+        This is :data:`True` when none of the :attr:`~.ExternalCommand.fakeroot`,
+        :attr:`~.ExternalCommand.sudo`, :attr:`~.ExternalCommand.uid`,
+        :attr:`~.ExternalCommand.user` and
+        :attr:`~.ExternalCommand.virtual_environment` options are set, because
+        in that case commands executed in the context have the same privileges
+        (and see the same file system and search path) as the current process.
+        The methods listed in the documentation of :class:`LocalContext` use
+        this to avoid spawning external commands.
+        """
+        options = self.get_options()
+        return not (options.get('fakeroot') or options.get('sudo') or
+                    options.get('uid') is not None or options.get('user') or
+                    options.get('virtual_environment'))
+
+    def get_native_path(self, pathname):
+        """
+        Resolve a pathname relative to the working directory of the context.
+
+        :param pathname: A pathname (a string).
+        :returns: The pathname joined to the :attr:`~.ExternalCommand.directory`
+                  option of the context (if any).
+        """
+        return os.path.join(self.get_options().get('directory') or os.curdir, pathname)
+
+    def exists(self, pathname):
+        """
+        Check whether the given pathname exists.
+
+        :param pathname: The pathname to check (a string).
+        :returns: :data:`True` if the pathname exists, :data:`False` otherwise.
+
+        Uses :func:`os.path.exists()` when :attr:`native_access` is
+        :data:`True`, otherwise :func:`AbstractContext.exists()`.
+        """
+        if self.native_access:
+            return os.path.exists(self.get_native_path(pathname))
+        return super(LocalContext, self).exists(pathname)
+
+    def is_file(self, pathname):
+        """
+        Check whether the given pathname points to an existing file.
+
+        :param pathname: The pathname to check (a string).
+        :returns: :data:`True` if the pathname points to an existing file,
+                  :data:`False` otherwise.
+
+        Uses :func:`os.path.isfile()` when :attr:`native_access` is
+        :data:`True`, otherwise :func:`AbstractContext.is_file()`.
+        """
+        if self.native_access:
+            return os.path.isfile(self.get_native_path(pathname))
+        return super(LocalContext, self).is_file(pathname)
+
+    def is_directory(self, pathname):
+        """
+        Check whether the given pathname points to an existing directory.
+
+        :param pathname: The pathname to check (a string).
+        :returns: :data:`True` if the pathname points to an existing directory,
+                  :data:`False` otherwise.
+
+        Uses :func:`os.path.isdir()` when :attr:`native_access` is
+        :data:`True`, otherwise :func:`AbstractContext.is_directory()`.
+        """
+        if self.native_access:
+            return os.path.isdir(self.get_native_path(pathname))
+        return super(LocalContext, self).is_directory(pathname)
+
+    def is_readable(self, pathname):
+        """
+        Check whether the given pathname exists and is readable.
+
+        :param pathname: The pathname to check (a string).
+        :returns: :data:`True` if the pathname exists and is readable,
+                  :data:`False` otherwise.
+
+        Uses :func:`os.access()` when :attr:`native_access` is
+        :data:`True`, otherwise :func:`AbstractContext.is_readable()`.
+        """
+        if self.native_access:
+            return os.access(self.get_native_path(pathname), os.R_OK)
+        return super(LocalContext, self).is_readable(pathname)
+
+    def is_writable(self, pathname):
+        """
+        Check whether the given pathname exists and is writable.
+
+        :param pathname: The pathname to check (a string).
+        :returns: :data:`True` if the pathname exists and is writable,
+                  :data:`False` otherwise.
+
+        Uses :func:`os.access()` when :attr:`native_access` is
+        :data:`True`, otherwise :func:`AbstractContext.is_writable()`.
+        """
+        if self.native_access:
+            return os.access(self.get_native_path(pathname), os.W_OK)
+        return super(LocalContext, self).is_writable(pathname)
+
+    def read_file(self, filename):
+        """
+        Read the contents of a file.
+
+        :param filename: The pathname of the file to read (a string).
+        :returns: The contents of the file (a byte string).
+
+        When :attr:`native_access` is :data:`True` the file is read directly.
+        If that fails (or :attr:`native_access` is :data:`False`)
+        :func:`AbstractContext.read_file()` is used, so that errors are
+        reported in the same way (as :exc:`~executor.ExternalCommandFailed`).
+        """
+        if self.native_access:
+            try:
+                with open(self.get_native_path(filename), 'rb') as handle:
+                    return handle.read()
+            except EnvironmentError:
+                pass
+        return super(LocalContext, self).read_file(filename)
+
+    def open_read(self, filename):
+        """
+        Open a file for streaming reads.
+
+        :param filename: The pathname of the file to read (a string).
+        :returns: A binary file-like object.
+
+        When :attr:`native_access` is :data:`True` the file is opened
+        directly. If that fails (or :attr:`native_access` is :data:`False`)
+        :func:`AbstractContext.open_read()` is used.
+        """
+        if self.native_access:
+            try:
+                return io.open(self.get_native_path(filename), 'rb', buffering=CHUNK_SIZE)
+            except EnvironmentError:
+                pass
+        return super(LocalContext, self).open_read(filename)
+
+    def open_write(self, filename):
+        """
+        Open a file for streaming writes.
+
+        :param filename: The pathname of the file to write (a string).
+        :returns: A binary file-like object.
+
+        When :attr:`native_access` is :data:`True` the file is opened
+        directly. If that fails (or :attr:`native_access` is :data:`False`)
+        :func:`AbstractContext.open_write()` is used.
+        """
+        if self.native_access:
+            try:
+                return io.open(self.get_native_path(filename), 'wb', buffering=CHUNK_SIZE)
+            except EnvironmentError:
+                pass
+        return super(LocalContext, self).open_write(filename)
+
+    def list_entries(self, directory):
+        """
+        List the entries in a directory.
+
+        :param directory: The pathname of the directory (a string).
+        :returns: A list of strings with the names of the directory entries.
+
+        When :attr:`native_access` is :data:`True` this uses
+        :func:`os.listdir()`. If that fails (or :attr:`native_access` is
+        :data:`False`) :func:`AbstractContext.list_entries()` is used, so that
+        errors are reported in the same way.
+        """
+        if self.native_access:
+            try:
+                return os.listdir(self.get_native_path(directory))
+            except EnvironmentError:
+                pass
+        return super(LocalContext, self).list_entries(directory)
+
+    def find_program(self, program_name, *args):
+        """
+        Find the absolute pathname(s) of one or more programs.
+
+        :param program_name: Each of the positional arguments is expected to
+                             be a string containing the name of a program to
+                             search for in the ``$PATH``. At least one is
+                             required.
+        :returns: A list of strings with absolute pathnames.
+
+        When :attr:`native_access` is :data:`True` this uses
+        :func:`executor.which()` (respecting ``$PATH`` in the
+        :attr:`~.ExternalCommand.environment` option of the context),
+        otherwise :func:`AbstractContext.find_program()` is used. Just like
+        ``which`` only the first match for each program is reported.
+        """
+        if not self.native_access:
+            return super(LocalContext, self).find_program(program_name, *args)
+        search_path = (self.get_options().get('environment') or {}).get('PATH')
+        matches = []
+        for name in (program_name,) + args:
+            matches.extend(which(name, path=search_path)[:1])
+        return matches
+
+    def prepare_rsync(self, source_directory, target_directory, compress=False):
+        """
+        Prepare to copy a local directory to another local directory using rsync_.
+
+        :param source_directory: The pathname of the source directory (a string).
+        :param target_directory: The pathname of the target directory (a string).
+        :param compress: Ignored (compression doesn't help local copies).
+        :returns: An :class:`~executor.ExternalCommand` object or :data:`None`
+                  when rsync_ isn't installed.
+
+        The rsync_ command is created using :func:`~AbstractContext.prepare()`
+        so that options like :attr:`~.ExternalCommand.sudo` are respected. A
+        relative target directory is interpreted relative to the
+        :attr:`~.ExternalCommand.directory` option of the context (because
+        that's where rsync_ runs) while a relative source directory is
+        interpreted relative to the working directory of the Python process.
+        """
+        if self.have_rsync:
+            return self.prepare(
+                'sh', '-c', 'mkdir -p "$2" && exec rsync --archive "$1/" "$2/"', 'rsync',
+                os.path.abspath(source_directory), target_directory, shell=False,
+            )
+
+    def stat_many(self, pathnames):
+        """
+        Get the status of multiple pathnames.
+
+        :param pathnames: An iterable of strings with pathnames.
+        :returns: A dictionary that maps the pathnames to :class:`PathStatus` objects.
+
+        When :attr:`native_access` is :data:`True` this uses :func:`os.stat()`
+        and :func:`os.access()` instead of executing a command, otherwise
+        :func:`AbstractContext.stat_many()` is used.
+        """
+        if not self.native_access:
+            return super(LocalContext, self).stat_many(pathnames)
+        results = {}
+        for pathname in pathnames:
+            native_path = self.get_native_path(pathname)
+            try:
+                info = os.stat(native_path)
+            except OSError:
+                results[pathname] = PathStatus(pathname=pathname, exists=False)
+            else:
+                results[pathname] = PathStatus(
+                    pathname=pathname,
+                    exists=True,
+                    is_file=stat.S_ISREG(info.st_mode),
+                    is_directory=stat.S_ISDIR(info.st_mode),
+                    is_readable=os.access(native_path, os.R_OK),
+                    is_writable=os.access(native_path, os.W_OK),
+                    mode=info.st_mode,
+                    size=info.st_size,
+                    mtime=int(info.st_mtime),
+                    uid=info.st_uid,
+                    gid=info.st_gid,
+                )
+        return results
+
+    @property
+    def identity(self):
+        """A string that identifies the local system (used as the key of :attr:`~AbstractContext.fact_cache`)."""
+        return 'local://%s' % socket.gethostname()
+
     def __str__(self):
         """Render a human friendly string representation of the context."""
         return "local system (%s)" % socket.gethostname()
@@ -711,6 +1357,11 @@ class ChangeRootContext(AbstractContext):
         """
         return multiprocessing.cpu_count()
 
+    @property
+    def identity(self):
+        """A string that identifies the chroot (used as the key of :attr:`~AbstractContext.fact_cache`)."""
+        return get_nested_identity(self.parent, 'chroot:%s' % self.chroot)
+
     def get_options(self):
         """The :attr:`~AbstractContext.options` including :attr:`chroot`."""
         options = dict(self.options)
@@ -767,6 +1418,11 @@ class SecureChangeRootContext(AbstractContext):
         """
         return multiprocessing.cpu_count()
 
+    @property
+    def identity(self):
+        """A string that identifies the chroot (used as the key of :attr:`~AbstractContext.fact_cache`)."""
+        return get_nested_identity(self.parent, 'schroot:%s' % self.chroot_name)
+
     def get_options(self):
         """The :attr:`~AbstractContext.options` including :attr:`chroot_name`."""
         options = dict(self.options)
@@ -800,15 +1456,65 @@ class RemoteContext(RemoteAccount, AbstractContext):
 
         This property's value is computed by executing the remote command
         nproc_. If that command fails :attr:`cpu_count` falls back to the
-        command ``grep -ci '^processor\s*:' /proc/cpuinfo``.
+        command ``grep -ci '^processor\s*:' /proc/cpuinfo``. Both commands
+        are part of :attr:`~AbstractContext.facts`.
 
         .. _nproc: http://linux.die.net/man/1/nproc
         """
+        if 'cpu_count' in self.facts:
+            return self.facts['cpu_count']
         try:
             return int(self.capture('nproc', shell=False, silent=True))
         except Exception:
             return int(self.capture('grep', '-ci', '^processor\s*:', '/proc/cpuinfo'))
 
+    def prepare_rsync(self, source_directory, target_directory, compress=False):
+        """
+        Prepare to copy a local directory to the remote system using rsync_.
+
+        :param source_directory: The pathname of the local directory (a string).
+        :param target_directory: The pathname of the directory on the remote system (a string).
+        :param compress: :data:`True` to enable the ``--compress`` option of rsync_.
+        :returns: An :class:`~executor.ExternalCommand` object that runs
+                  rsync_ on the local system or :data:`None` when rsync_
+                  isn't installed on both systems.
+
+        The SSH client options of the context are passed to rsync_ (using
+        ``--rsh``) and when :attr:`~.ExternalCommand.sudo` is enabled the
+        remote rsync_ is started using ``sudo``. A relative target directory
+        is interpreted relative to the :attr:`~.ExternalCommand.directory`
+        option of the context (just like the pathnames given to the
+        context's other commands).
+        """
+        if which('rsync') and self.have_rsync:
+            prototype = self.prepare('true')
+            if prototype.remote_directory != DEFAULT_WORKING_DIRECTORY and not posixpath.isabs(target_directory):
+                target_directory = posixpath.join(prototype.remote_directory, target_directory)
+            command_line = ['rsync', '--archive', '--rsh=%s' % quote(prototype.ssh_client_command)]
+            if compress:
+                command_line.append('--compress')
+            remote_rsync = 'mkdir -p %s && rsync' % quote(target_directory)
+            if prototype.sudo:
+                remote_rsync = 'sudo sh -c %s' % quote(remote_rsync + ' "$@"') + ' rsync'
+            command_line.append('--rsync-path=%s' % remote_rsync)
+            command_line.append('%s/' % source_directory)
+            command_line.append('%s:%s/' % (self.ssh_alias, target_directory))
+            return ExternalCommand(*command_line)
+
+    @property
+    def identity(self):
+        """
+        A string that identifies the remote system (used as the key of :attr:`~AbstractContext.fact_cache`).
+
+        The string is based on the SSH alias, the remote username and the
+        port number (e.g. ``ssh://user@server:2222``).
+        """
+        return 'ssh://%s%s%s' % (
+            '%s@' % self.ssh_user if self.ssh_user else '',
+            self.ssh_alias,
+            ':%s' % self.options['port'] if self.options.get('port') else '',
+        )
+
     def get_options(self):
         """The :attr:`~AbstractContext.options` including the SSH alias and remote user."""
         options = dict(self.options)
@@ -818,3 +1524,169 @@ class RemoteContext(RemoteAccount, AbstractContext):
     def __str__(self):
         """Render a human friendly string representation of the context."""
         return "remote system (%s)" % self.ssh_alias
+
+
+class CommandReader(io.RawIOBase):
+
+    """
+    Unbuffered file-like object that reads the standard output stream of an external command.
+
+    Used by :func:`AbstractContext.open_read()` (wrapped in an
+    :class:`io.BufferedReader` object).
+    """
+
+    def __init__(self, command):
+        """
+        Initialize a :class:`CommandReader` object.
+
+        :param command: An :class:`~executor.ExternalCommand` object with
+                        :attr:`~executor.ExternalCommand.async` and
+                        :attr:`~executor.ExternalCommand.capture` enabled and
+                        :attr:`~executor.ExternalCommand.buffered` disabled
+                        (the command is started when it hasn't been started
+                        yet).
+        """
+        super(CommandReader, self).__init__()
+        self.command = command
+        self.finished = False
+        if not command.was_started:
+            command.start()
+
+    def readable(self):
+        """:data:`True` (refer to :func:`io.IOBase.readable()`)."""
+        return True
+
+    def readinto(self, buffer):
+        """
+        Read from the standard output stream of the external command.
+
+        :param buffer: A writable buffer (e.g. a :class:`bytearray` object).
+        :returns: The number of bytes read (an integer, 0 at the end of the output).
+        :raises: :exc:`~executor.ExternalCommandFailed` when the end of the
+                 output is reached and the external command failed.
+        """
+        if self.finished:
+            return 0
+        data = os.read(self.command.stdout.fileno(), len(buffer))
+        if not data:
+            self.finished = True
+            self.command.stdout.close()
+            self.command.wait()
+            return 0
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        """
+        Close the standard output stream and wait for the external command to end.
+
+        When the file is closed before the end of the output was reached, the
+        external command is expected to die of a broken pipe, so the exit
+        status of the external command is ignored.
+        """
+        if not self.closed:
+            try:
+                if not self.finished:
+                    self.finished = True
+                    self.command.stdout.close()
+                    self.command.wait(check=False)
+            finally:
+                super(CommandReader, self).close()
+
+
+class CommandWriter(io.RawIOBase):
+
+    """
+    Unbuffered file-like object that writes to the standard input stream of an external command.
+
+    Used by :func:`AbstractContext.open_write()` (wrapped in an
+    :class:`io.BufferedWriter` object).
+    """
+
+    def __init__(self, command):
+        """
+        Initialize a :class:`CommandWriter` object.
+
+        :param command: An :class:`~executor.ExternalCommand` object with
+                        :attr:`~executor.ExternalCommand.async` enabled,
+                        :attr:`~executor.ExternalCommand.buffered` disabled
+                        and :attr:`~executor.ExternalCommand.input` set to
+                        :data:`True` (the command is started when it hasn't
+                        been started yet).
+        """
+        super(CommandWriter, self).__init__()
+        self.command = command
+        if not command.was_started:
+            command.start()
+
+    def writable(self):
+        """:data:`True` (refer to :func:`io.IOBase.writable()`)."""
+        return True
+
+    def write(self, data):
+        """
+        Write to the standard input stream of the external command.
+
+        :param data: A byte string (or another object supporting the buffer protocol).
+        :returns: The number of bytes written (an integer).
+        """
+        return os.write(self.command.stdin.fileno(), data)
+
+    def close(self):
+        """
+        Close the standard input stream and wait for the external command to end.
+
+        :raises: :exc:`~executor.ExternalCommandFailed` when the external command failed.
+        """
+        if not self.closed:
+            try:
+                self.command.stdin.close()
+                self.command.wait()
+            finally:
+                super(CommandWriter, self).close()
+
+
+class PathStatus(object):
+
+    """The status of a pathname (as reported by :func:`AbstractContext.stat_many()`)."""
+
+    def __init__(self, pathname, exists, is_file=False, is_directory=False, is_readable=False,
+                 is_writable=False, mode=None, size=None, mtime=None, uid=None, gid=None):
+        """
+        Initialize a :class:`PathStatus` object.
+
+        :param pathname: The pathname (a string).
+        :param exists: :data:`True` if the pathname exists, :data:`False` otherwise.
+        :param is_file: :data:`True` if the pathname points to a regular file.
+        :param is_directory: :data:`True` if the pathname points to a directory.
+        :param is_readable: :data:`True` if the pathname is readable.
+        :param is_writable: :data:`True` if the pathname is writable.
+        :param mode: The mode of the pathname (an integer or :data:`None`).
+        :param size: The size in bytes (an integer or :data:`None`).
+        :param mtime: The modification time (an integer number of seconds
+                      since the UNIX epoch or :data:`None`).
+        :param uid: The user ID of the owner (an integer or :data:`None`).
+        :param gid: The group ID of the owner (an integer or :data:`None`).
+
+        Symbolic links are followed (just like ``test`` does). The values
+        that are :data:`None` weren't available (because the pathname doesn't
+        exist or because GNU ``stat`` isn't installed).
+        """
+        self.pathname = pathname
+        self.exists = exists
+        self.is_file = is_file
+        self.is_directory = is_directory
+        self.is_readable = is_readable
+        self.is_writable = is_writable
+        self.mode = mode
+        self.size = size
+        self.mtime = mtime
+        self.uid = uid
+        self.gid = gid
+
+    def __repr__(self):
+        """Render a human friendly representation of the status."""
+        return '%s(pathname=%r, exists=%r, is_file=%r, is_directory=%r, size=%r)' % (
+            type(self).__name__, self.pathname, self.exists,
+            self.is_file, self.is_directory, self.size,
+        )
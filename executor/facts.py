@@ -0,0 +1,184 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Persistent caching of facts about the systems behind command execution contexts.
+
+Command execution contexts expose a few facts about the system they run
+commands on (like :attr:`~executor.contexts.AbstractContext.distributor_id`
+and :attr:`~executor.contexts.AbstractContext.cpu_count`). Each of these facts
+used to cost one or two commands (and for remote contexts as many SSH round
+trips) for every new context object. The :mod:`executor.facts` module
+defines :data:`FACTS_SCRIPT` which gathers all facts in a single command and
+the :class:`FactCache` class which stores the gathered facts on disk (keyed
+by :attr:`~executor.contexts.AbstractContext.identity`) so that scripts that
+create new contexts for the same hosts on every run don't need to gather the
+facts again until they expire:
+
+>>> from executor.contexts import RemoteContext
+>>> from executor.facts import FactCache
+>>> context = RemoteContext('server', fact_cache=FactCache(ttl=60 * 60))
+>>> context.distribution_codename
+'bionic'
+"""
+
+# Standard library modules.
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+# External dependencies.
+from humanfriendly import format_timespan
+from property_manager import PropertyManager, mutable_property
+
+# Initialize a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60 * 60 * 24
+"""The default number of seconds that cached facts remain valid (an integer, one day)."""
+
+FACTS_SCRIPT = r'''
+printf 'distributor_id=%s\n' "$(lsb_release --short --id 2>/dev/null)"
+printf 'distribution_codename=%s\n' "$(lsb_release --short --codename 2>/dev/null)"
+printf 'have_ionice=%s\n' "$(which ionice 2>/dev/null)"
+printf 'cpu_count=%s\n' "$(nproc 2>/dev/null || grep -ci '^processor\s*:' /proc/cpuinfo 2>/dev/null)"
+'''
+"""
+The shell script that gathers all facts in a single command (a string).
+
+The script prints one ``name=value`` line per fact, refer to :func:`parse_facts()`.
+"""
+
+
+def parse_facts(output):
+    """
+    Parse the output of :data:`FACTS_SCRIPT`.
+
+    :param output: The output of :data:`FACTS_SCRIPT` (a string).
+    :returns: A dictionary with the facts that were reported by the script.
+              The distributor ID and codename are lowercased (just like
+              :attr:`~executor.contexts.AbstractContext.distributor_id`),
+              ``have_ionice`` is a boolean and ``cpu_count`` is an integer
+              (it's omitted when it couldn't be determined).
+    """
+    values = {}
+    for line in output.splitlines():
+        name, delimiter, value = line.partition('=')
+        if delimiter:
+            values[name.strip()] = value.strip()
+    facts = {}
+    for name in 'distributor_id', 'distribution_codename':
+        if name in values:
+            facts[name] = values[name].lower()
+    if 'have_ionice' in values:
+        facts['have_ionice'] = bool(values['have_ionice'])
+    if values.get('cpu_count', '').isdigit() and int(values['cpu_count']) > 0:
+        facts['cpu_count'] = int(values['cpu_count'])
+    return facts
+
+
+class FactCache(PropertyManager):
+
+    """
+    On-disk cache of facts about the systems behind command execution contexts.
+
+    Each system's facts are stored as a JSON file in :attr:`directory` whose
+    name is derived from the identity of the context (refer to
+    :func:`get_filename()`). A single :class:`FactCache` object can (and
+    should) be shared between many contexts.
+    """
+
+    @mutable_property
+    def directory(self):
+        """
+        The directory where cached facts are stored (a string).
+
+        Defaults to ``$XDG_CACHE_HOME/executor/facts`` (where
+        ``$XDG_CACHE_HOME`` defaults to ``~/.cache``). The directory is
+        created when facts are first saved.
+        """
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(cache_home, 'executor', 'facts')
+
+    @mutable_property
+    def ttl(self):
+        """
+        The number of seconds that cached facts remain valid (a number, defaults to :data:`DEFAULT_TTL`).
+
+        Facts that are older than this are ignored by :func:`load()` (which
+        means they're gathered again and the cache is updated).
+        """
+        return DEFAULT_TTL
+
+    def get_filename(self, key):
+        """
+        Get the pathname of the file that stores the facts of a system.
+
+        :param key: The identity of a context (a string).
+        :returns: The pathname of a JSON file (a string).
+        """
+        return os.path.join(self.directory, '%s.json' % hashlib.sha1(key.encode('UTF-8')).hexdigest())
+
+    def load(self, key):
+        """
+        Load the cached facts of a system.
+
+        :param key: The identity of a context (a string).
+        :returns: A dictionary with facts or :data:`None` when no facts are
+                  cached, they have expired or the cache file is corrupt.
+        """
+        filename = self.get_filename(key)
+        try:
+            with open(filename) as handle:
+                record = json.load(handle)
+            age = time.time() - record['time']
+            if record['key'] != key:
+                return None
+        except Exception:
+            return None
+        if not (0 <= age < self.ttl):
+            logger.debug("Ignoring expired facts of %s (%s old).", key, format_timespan(age))
+            return None
+        logger.debug("Loaded cached facts of %s (%s old).", key, format_timespan(age))
+        return record['facts']
+
+    def save(self, key, facts):
+        """
+        Store the facts of a system in the cache.
+
+        :param key: The identity of a context (a string).
+        :param facts: A dictionary with facts (the values need to be
+                      serializable to JSON).
+
+        The facts are written to a temporary file that is then renamed, so
+        concurrent processes never see partially written files. Failure to
+        update the cache is logged but not propagated.
+        """
+        filename = self.get_filename(key)
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, temporary_file = tempfile.mkstemp(dir=self.directory, prefix='.facts-', suffix='.tmp')
+            with os.fdopen(fd, 'w') as handle:
+                json.dump(dict(key=key, time=time.time(), facts=facts), handle)
+            os.rename(temporary_file, filename)
+            logger.debug("Saved facts of %s to %s.", key, filename)
+        except EnvironmentError as e:
+            logger.warning("Failed to save facts of %s to %s! (%s)", key, filename, e)
+
+    def invalidate(self, key):
+        """
+        Remove the cached facts of a system.
+
+        :param key: The identity of a context (a string).
+        """
+        try:
+            os.unlink(self.get_filename(key))
+        except EnvironmentError:
+            pass
@@ -0,0 +1,259 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 19, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Native resource limits for external commands.
+
+The :mod:`executor.limits` module implements the logic behind the
+:attr:`~executor.ExternalCommand.nice`,
+:attr:`~executor.ExternalCommand.cpu_affinity`,
+:attr:`~executor.ExternalCommand.rlimits`,
+:attr:`~executor.ExternalCommand.ioprio`,
+:attr:`~executor.ExternalCommand.cgroup` and
+:attr:`~executor.ExternalCommand.process_group` options. These options are applied in
+the child process between :func:`os.fork()` and :func:`os.execve()` (using the
+``preexec_fn`` argument of :class:`subprocess.Popen`) which means no wrapper
+programs like ``nice``, ``taskset``, ``prlimit`` or ``ionice`` are needed.
+
+Because the functions returned by :func:`create_preexec_fn()` run in the child
+process after :func:`os.fork()` they avoid logging and only use values that
+were prepared in the parent process.
+"""
+
+# Standard library modules.
+import logging
+import multiprocessing
+import os
+import platform
+import signal
+
+# Modules included in our package.
+from executor.cgroups import join_cgroup
+
+# Initialize a logger for this module.
+logger = logging.getLogger(__name__)
+
+IOPRIO_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+"""A dictionary that maps I/O scheduling class names to the numbers used by the Linux kernel."""
+
+IOPRIO_CLASS_SHIFT = 13
+"""The number of bits that the I/O scheduling class is shifted by in an I/O priority value (an integer)."""
+
+IOPRIO_DEFAULT_LEVEL = 4
+"""The priority level used for the 'realtime' and 'best-effort' classes (an integer, same default as ``ionice``)."""
+
+IOPRIO_SYSCALL_NUMBERS = {
+    'aarch64': 30,
+    'armv7l': 314,
+    'i386': 289,
+    'i686': 289,
+    'ppc64le': 273,
+    'riscv64': 30,
+    's390x': 282,
+    'x86_64': 251,
+}
+"""A dictionary that maps machine types to the system call number of ``ioprio_set()``."""
+
+IOPRIO_WHO_PROCESS = 1
+"""The ``which`` argument to ``ioprio_set()`` that selects a single process (an integer)."""
+
+RESTORED_SIGNALS = ('SIGPIPE', 'SIGXFZ', 'SIGXFSZ')
+"""
+The names of the signals whose default action is restored in child processes (a tuple of strings).
+
+These are the signals that Python ignores and that :class:`subprocess.Popen`
+restores to their default action in child processes on Python 3.2 and later
+(refer to the ``restore_signals`` argument). Refer to :func:`create_preexec_fn()`.
+"""
+
+RLIMIT_ALIASES = {
+    'address_space': 'as',
+    'cpu_seconds': 'cpu',
+    'open_files': 'nofile',
+}
+"""A dictionary with human friendly aliases for resource names accepted by :func:`validate_rlimits()`."""
+
+
+def create_preexec_fn(nice=None, cpu_affinity=None, rlimits=None, ioprio=None, cgroup=None, process_group=None,
+                      restore_signals=False):
+    """
+    Create a function that applies resource limits in a child process.
+
+    :param process_group: The string 'group' (to create a new process group),
+                          'session' (to create a new session) or
+                          :data:`None`.
+    :param cgroup: A :class:`.ControlGroup` object or :data:`None`.
+    :param nice: The niceness increment (an integer or :data:`None`).
+    :param cpu_affinity: A list of CPU numbers (integers) or :data:`None`.
+    :param rlimits: A dictionary as returned by :func:`validate_rlimits()` or
+                    :data:`None`.
+    :param ioprio: The name of an I/O scheduling class (one of the keys of
+                   :data:`IOPRIO_CLASSES`) or :data:`None`.
+    :param restore_signals: :data:`True` to restore the default action of the
+                            signals in :data:`RESTORED_SIGNALS` (this emulates
+                            the ``restore_signals`` argument of
+                            :class:`subprocess.Popen` on Python < 3.2, so
+                            that for example commands in a pipeline are
+                            killed by :data:`signal.SIGPIPE` when the next
+                            command exits).
+    :returns: A callable that can be used as the ``preexec_fn`` argument of
+              :class:`subprocess.Popen` or :data:`None` when no resource
+              limits were given.
+
+    Options that aren't supported on the current platform are logged and
+    ignored, similar to how :func:`.AbstractContext.merge_options()` ignores
+    the :attr:`~executor.ExternalCommand.ionice` option when ``ionice`` isn't
+    installed.
+    """
+    actions = []
+    if restore_signals:
+        for name in RESTORED_SIGNALS:
+            if hasattr(signal, name):
+                actions.append((signal.signal, (getattr(signal, name), signal.SIG_DFL)))
+    if process_group == 'session':
+        actions.append((os.setsid, ()))
+    elif process_group == 'group':
+        actions.append((os.setpgid, (0, 0)))
+    if cgroup is not None:
+        # Resolve the pathname in the parent process (refer to ControlGroup.join()).
+        actions.append((join_cgroup, (cgroup.procs_file,)))
+    if nice:
+        actions.append((os.nice, (nice,)))
+    if cpu_affinity:
+        if hasattr(os, 'sched_setaffinity'):
+            actions.append((os.sched_setaffinity, (0, set(cpu_affinity))))
+        else:
+            logger.warning("Ignoring `cpu_affinity' option because it's not supported on this platform!")
+    if rlimits:
+        import resource
+        for number, limits in sorted(rlimits.items()):
+            actions.append((resource.setrlimit, (number, limits)))
+    if ioprio:
+        function = get_ioprio_function()
+        if function:
+            level = 0 if ioprio == 'idle' else IOPRIO_DEFAULT_LEVEL
+            actions.append((function, (IOPRIO_WHO_PROCESS, 0, (IOPRIO_CLASSES[ioprio] << IOPRIO_CLASS_SHIFT) | level)))
+        else:
+            logger.warning("Ignoring `ioprio' option because it's not supported on this platform!")
+    if actions:
+        def apply_resource_limits():
+            """Apply the resource limits to the current (child) process."""
+            for function, arguments in actions:
+                function(*arguments)
+        return apply_resource_limits
+
+
+def get_ioprio_function():
+    """
+    Get a function that calls the Linux ``ioprio_set()`` system call.
+
+    :returns: A callable that takes three integer arguments (the ``which``,
+              ``who`` and ``ioprio`` arguments of the system call and
+              raises :exc:`~exceptions.OSError` when the system call fails),
+              or :data:`None` when the system call isn't available (because
+              we're not running on Linux or the system call number for the
+              current machine type isn't known).
+    """
+    number = IOPRIO_SYSCALL_NUMBERS.get(platform.machine())
+    if number is not None and platform.system() == 'Linux':
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        except Exception:
+            logger.debug("Failed to load the C library, ioprio_set() is not available!", exc_info=True)
+        else:
+            def ioprio_set(which, who, ioprio):
+                """Call ``ioprio_set()`` and translate errors into exceptions."""
+                if libc.syscall(number, which, who, ioprio) == -1:
+                    error_number = ctypes.get_errno()
+                    raise OSError(error_number, os.strerror(error_number))
+            return ioprio_set
+
+
+def get_available_cpus():
+    """
+    Get the CPUs that the current process is allowed to run on.
+
+    :returns: A sorted list of integers.
+
+    This uses :func:`os.sched_getaffinity()` when available and otherwise
+    falls back to :func:`multiprocessing.cpu_count()`.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def partition_cpus(cpus, count):
+    """
+    Divide a list of CPUs into disjoint sets.
+
+    :param cpus: A list of CPU numbers (integers).
+    :param count: The desired number of CPU sets (an integer).
+    :returns: A list of lists of CPU numbers. When there are less CPUs
+              than the requested number of sets, one set per CPU is
+              returned.
+
+    Neighbouring CPU numbers are kept together because they are more likely
+    to share caches.
+    """
+    count = max(1, min(count, len(cpus)))
+    size, remainder = divmod(len(cpus), count)
+    partitions = []
+    offset = 0
+    for i in range(count):
+        end = offset + size + (1 if i < remainder else 0)
+        partitions.append(cpus[offset:end])
+        offset = end
+    return partitions
+
+
+def validate_cpu_affinity(value):
+    """
+    Validate a CPU affinity option.
+
+    :param value: An iterable of CPU numbers (integers).
+    :returns: A sorted list of unique CPU numbers.
+    :raises: :exc:`~exceptions.ValueError` when the value is empty or
+             contains something other than non-negative integers.
+    """
+    cpus = sorted(set(value))
+    if not cpus or not all(isinstance(cpu, int) and cpu >= 0 for cpu in cpus):
+        msg = "Invalid CPU affinity! (expected a nonempty list of CPU numbers, got %r)"
+        raise ValueError(msg % (value,))
+    return cpus
+
+
+def validate_rlimits(value):
+    """
+    Validate and normalize resource limits.
+
+    :param value: A dictionary whose keys are resource names and whose values
+                  are numbers (used as both the soft and hard limit) or tuples
+                  with two numbers (the soft and hard limit). Resource names
+                  are the names of the ``RLIMIT_*`` constants in the
+                  :mod:`resource` module without the prefix (case insensitive,
+                  for example 'as', 'nofile' or 'cpu') or one of the aliases
+                  in :data:`RLIMIT_ALIASES`.
+    :returns: A dictionary that maps ``RLIMIT_*`` constants (integers) to
+              tuples with two integers.
+    :raises: :exc:`~exceptions.ValueError` when an unknown resource name or an
+             invalid limit is given.
+    """
+    import resource
+    normalized = {}
+    for name, limits in value.items():
+        key = RLIMIT_ALIASES.get(name, name).upper()
+        number = getattr(resource, 'RLIMIT_%s' % key, None)
+        if number is None:
+            raise ValueError("Unsupported resource limit! (%r)" % name)
+        if not isinstance(limits, (list, tuple)):
+            limits = (limits, limits)
+        if len(limits) != 2:
+            raise ValueError("Invalid resource limit for %r! (expected a number or two numbers)" % name)
+        normalized[number] = tuple(resource.RLIM_INFINITY if limit is None else int(limit) for limit in limits)
+    return normalized
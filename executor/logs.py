@@ -0,0 +1,559 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 19, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Relaying of command output to (compressed) log files, shared log sinks and the terminal.
+
+The :mod:`executor.logs` module implements the logic behind the
+:attr:`~executor.concurrent.CommandPool.logs_compression`,
+:attr:`~executor.concurrent.CommandPool.logs_max_size`,
+:attr:`~executor.concurrent.CommandPool.logs_sink` and
+:attr:`~executor.concurrent.CommandPool.live_output` options. A file object
+that compresses its contents doesn't have a file descriptor that can be handed
+to an external command, so instead the output of the external command is
+written to a pipe and a :class:`LogRelay` thread copies the output from the
+pipe to a :class:`LogFile`, :class:`LogSink` or :class:`LinePrefixer` object.
+"""
+
+# Standard library modules.
+import io
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+# Modules included in our package.
+from executor.process import create_pipe, wait_for_readable
+
+# Initialize a logger for this module.
+logger = logging.getLogger(__name__)
+
+COMPRESSION_METHODS = dict(bz2='.bz2', gzip='.gz', lzma='.xz')
+"""A dictionary that maps supported compression methods to filename extensions."""
+
+DEFAULT_SEGMENT_SIZE = 1024 * 1024 * 64
+"""The default maximum size of a :class:`LogSink` segment in bytes (an integer, 64 MiB)."""
+
+RECORD_HEADER = struct.Struct('!dHHI')
+"""
+The header of the records in :class:`LogSink` segments (a :class:`struct.Struct` object).
+
+The header contains the timestamp (a float), the length of the command
+identifier, the length of the stream name and the length of the output. It's
+followed by the identifier, the stream name (both encoded as UTF-8) and the
+output.
+"""
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d+)\.log$')
+"""A compiled regular expression that matches the filenames of :class:`LogSink` segments."""
+
+TRUNCATION_MARKER = b'\n[... %i bytes of output omitted ...]\n'
+"""The line added to truncated log files (a byte string with a ``%i`` placeholder for the number of bytes)."""
+
+
+class LogFile(object):
+
+    """A log file that's optionally compressed and/or truncated."""
+
+    def __init__(self, filename, compression=None, max_size=None):
+        """
+        Initialize a :class:`LogFile` object.
+
+        :param filename: The pathname of the log file (a string).
+        :param compression: One of the keys of :data:`COMPRESSION_METHODS` or
+                            :data:`None` (to disable compression).
+        :param max_size: The maximum number of bytes to write to the log file
+                         (an integer or :data:`None`). Any output beyond this
+                         limit is discarded and counted.
+
+        Log files are opened in append mode. Compressed log files that are
+        appended to contain multiple compressed streams, which the command
+        line programs ``zcat``, ``bzcat`` and ``xzcat`` handle transparently.
+        """
+        self.filename = filename
+        self.handle = open_log_file(filename, compression)
+        self.max_size = max_size
+        self.num_discarded = 0
+        self.num_written = 0
+
+    def write(self, stream, data):
+        """
+        Write output to the log file.
+
+        :param stream: The name of the stream that produced the output (a
+                       string, ignored because log files contain merged
+                       output).
+        :param data: The output (a byte string).
+        """
+        if self.max_size is not None:
+            available = max(0, self.max_size - self.num_written)
+            self.num_discarded += max(0, len(data) - available)
+            data = data[:available]
+        if data:
+            self.handle.write(data)
+            self.num_written += len(data)
+
+    def close(self):
+        """Mark the log file as truncated (if applicable) and close it."""
+        if self.num_discarded:
+            self.handle.write(TRUNCATION_MARKER % self.num_discarded)
+        self.handle.close()
+
+
+class LogRelay(object):
+
+    """Copy output from one or more pipes to a log writer in a background thread."""
+
+    def __init__(self, writer):
+        """
+        Initialize a :class:`LogRelay` object.
+
+        :param writer: An object with ``write(stream, data)`` and ``close()``
+                       methods (like :class:`LogFile`).
+        """
+        self.pipes = {}
+        self.thread = None
+        self.writer = writer
+
+    def create_pipe(self, stream):
+        """
+        Create a pipe that's relayed to the log writer.
+
+        :param stream: The name of the stream (a string, passed on to the
+                       ``write()`` method of the log writer).
+        :returns: The write end of the pipe (a file object that can be used
+                  as :attr:`~executor.ExternalCommand.stdout_file` and/or
+                  :attr:`~executor.ExternalCommand.stderr_file`). The caller
+                  is responsible for closing the file object after the
+                  external command has been started.
+        """
+        read_fd, write_fd = create_pipe()
+        self.pipes[read_fd] = stream
+        return os.fdopen(write_fd, 'wb')
+
+    def start(self):
+        """Start the background thread that relays output (until all pipes are closed)."""
+        self.thread = threading.Thread(target=self.relay_output)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def relay_output(self):
+        """Copy output from the pipes to the log writer (runs in the background thread)."""
+        try:
+            while self.pipes:
+                for fd in wait_for_readable(self.pipes):
+                    chunk = os.read(fd, 65536)
+                    if chunk:
+                        self.writer.write(self.pipes[fd], chunk)
+                    else:
+                        os.close(fd)
+                        del self.pipes[fd]
+        except Exception:
+            logger.warning("Failed to relay output to log writer!", exc_info=True)
+            for fd in self.pipes:
+                os.close(fd)
+            self.pipes.clear()
+        finally:
+            self.writer.close()
+
+    def join(self):
+        """Wait for the background thread to finish (after the external command closed its output streams)."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+class BZ2Appender(object):
+
+    """
+    Append a compressed stream to a bzip2 file.
+
+    Before Python 3.3 :class:`bz2.BZ2File` doesn't support append mode, so
+    :func:`open_log_file()` uses this class instead. The output is compressed
+    using :class:`bz2.BZ2Compressor` and the resulting stream is appended to
+    the file (which is opened in binary append mode). Just like with
+    :class:`bz2.BZ2File` in append mode, a file that is appended to multiple
+    times contains multiple compressed streams.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize a :class:`BZ2Appender` object.
+
+        :param filename: The pathname of the compressed file (a string).
+        """
+        import bz2
+        self.compressor = bz2.BZ2Compressor()
+        self.handle = open(filename, 'ab')
+
+    def write(self, data):
+        """
+        Compress data and write it to the file.
+
+        :param data: The data to compress (a byte string).
+        """
+        self.handle.write(self.compressor.compress(data))
+
+    def close(self):
+        """Finish the compressed stream and close the file."""
+        if not self.handle.closed:
+            self.handle.write(self.compressor.flush())
+            self.handle.close()
+
+
+class LogSink(object):
+
+    """
+    A log sink that multiplexes the output of many commands into a few segmented log files.
+
+    Instead of using one log file per command (which requires one inode and
+    one open file per command) all output is written to a sequence of segment
+    files in a single directory. Each chunk of output is framed as a record
+    (see :data:`RECORD_HEADER`) that identifies the command, the stream and
+    the time when the output was received. When a segment would grow beyond
+    :attr:`max_segment_size` a new segment is started and when
+    :attr:`max_segments` is set the oldest segments are removed.
+
+    Each segment has an index file next to it (refer to
+    :func:`get_index_filename()`) that contains one line per record (a JSON
+    list with the command identifier and the offset of the record in the
+    segment) so that :func:`extract()` can find the output of a single command
+    without reading all records. Index files are removed together with their
+    segments, so the disk space used by the index is bounded by
+    :attr:`max_segments` just like the segments themselves.
+    """
+
+    def __init__(self, directory, max_segment_size=DEFAULT_SEGMENT_SIZE, max_segments=None):
+        """
+        Initialize a :class:`LogSink` object.
+
+        :param directory: The pathname of the directory that contains the
+                          segments (a string, the directory is created if it
+                          doesn't exist yet).
+        :param max_segment_size: The maximum size of a segment in bytes (an
+                                 integer, defaults to :data:`DEFAULT_SEGMENT_SIZE`).
+        :param max_segments: The maximum number of segments to keep (an integer
+                             or :data:`None` to keep all segments).
+
+        When the directory already contains segments a new segment is started
+        after the existing segments (existing records are left alone).
+        """
+        self.directory = directory
+        self.max_segment_size = max_segment_size
+        self.max_segments = max_segments
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        existing = self.segments
+        self.segment_number = existing[-1] + 1 if existing else 1
+        self.index = None
+        self.segment = None
+        self.segment_size = 0
+
+    @property
+    def segments(self):
+        """The numbers of the segments in :attr:`directory` (a sorted list of integers)."""
+        return sorted(int(m.group(1)) for m in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if m)
+
+    def get_segment_filename(self, number):
+        """
+        Get the pathname of a segment.
+
+        :param number: The number of the segment (an integer).
+        :returns: The pathname of the segment (a string).
+        """
+        return os.path.join(self.directory, 'segment-%06i.log' % number)
+
+    def get_index_filename(self, number):
+        """
+        Get the pathname of the index of a segment.
+
+        :param number: The number of the segment (an integer).
+        :returns: The pathname of the index file (a string).
+        """
+        return os.path.join(self.directory, 'segment-%06i.idx' % number)
+
+    def get_writer(self, identifier):
+        """
+        Get a log writer for a :class:`LogRelay`.
+
+        :param identifier: The identifier of the command (any value, it's
+                           converted to a string).
+        :returns: A :class:`LogSinkWriter` object.
+        """
+        return LogSinkWriter(self, identifier)
+
+    def write_record(self, identifier, stream, data):
+        """
+        Write a record to the current segment.
+
+        :param identifier: The identifier of the command (any value, it's
+                           converted to a string).
+        :param stream: The name of the stream (a string).
+        :param data: The output (a byte string).
+
+        This method is thread safe.
+        """
+        identifier = u'%s' % identifier
+        encoded_identifier = identifier.encode('UTF-8')
+        encoded_stream = stream.encode('UTF-8')
+        header = RECORD_HEADER.pack(time.time(), len(encoded_identifier), len(encoded_stream), len(data))
+        record = header + encoded_identifier + encoded_stream + data
+        with self.lock:
+            if self.segment is None or (self.segment_size > 0 and
+                                        self.segment_size + len(record) > self.max_segment_size):
+                self.rotate()
+            self.index.write(json.dumps([identifier, self.segment_size]) + '\n')
+            self.segment.write(record)
+            self.segment_size += len(record)
+
+    def rotate(self):
+        """Start a new segment (and remove old segments and their indexes if :attr:`max_segments` is set)."""
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.segment_number += 1
+        filename = self.get_segment_filename(self.segment_number)
+        logger.debug("Starting log sink segment %s ..", filename)
+        self.segment = open(filename, 'wb')
+        self.index = open(self.get_index_filename(self.segment_number), 'w')
+        self.segment_size = 0
+        if self.max_segments is not None:
+            for number in self.segments[:-self.max_segments]:
+                os.unlink(self.get_segment_filename(number))
+                try:
+                    os.unlink(self.get_index_filename(number))
+                except EnvironmentError:
+                    pass
+
+    def flush(self):
+        """Flush buffered records and index entries to disk."""
+        with self.lock:
+            if self.segment is not None:
+                self.segment.flush()
+                self.index.flush()
+
+    def close(self):
+        """Close the current segment and its index."""
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.index.close()
+                self.segment = None
+                self.index = None
+                self.segment_number += 1
+
+    def iter_records(self, identifier=None):
+        """
+        Iterate over the records in the log sink.
+
+        :param identifier: The identifier of a command (any value, it's
+                           converted to a string) or :data:`None` to iterate
+                           over all records.
+        :returns: A generator of tuples with four values each: The identifier
+                  (a string), the stream name (a string), the timestamp (a
+                  float) and the output (a byte string).
+
+        Only the indexes of the segments that still exist are scanned
+        (segments that have been removed because of :attr:`max_segments`
+        are skipped).
+        """
+        self.flush()
+        selected = None if identifier is None else u'%s' % identifier
+        for number in self.segments:
+            try:
+                index = open(self.get_index_filename(number))
+            except EnvironmentError:
+                # The segment was removed after we listed the directory.
+                continue
+            with index:
+                try:
+                    handle = open(self.get_segment_filename(number), 'rb')
+                except EnvironmentError:
+                    continue
+                with handle:
+                    for line in index:
+                        record_identifier, offset = json.loads(line)
+                        if selected is None or record_identifier == selected:
+                            handle.seek(offset)
+                            timestamp, id_length, stream_length, data_length = \
+                                RECORD_HEADER.unpack(handle.read(RECORD_HEADER.size))
+                            handle.read(id_length)
+                            stream = handle.read(stream_length).decode('UTF-8')
+                            yield record_identifier, stream, timestamp, handle.read(data_length)
+
+    def extract(self, identifier, streams=None):
+        """
+        Extract the output of a single command.
+
+        :param identifier: The identifier of the command (any value, it's
+                           converted to a string).
+        :param streams: A list of stream names to include (defaults to
+                        :data:`None` which means all streams are included).
+        :returns: The output of the command (a byte string).
+        """
+        return b''.join(data for record_identifier, stream, timestamp, data in self.iter_records(identifier)
+                        if streams is None or stream in streams)
+
+    def __enter__(self):
+        """Enable the use of log sinks as context managers."""
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        """Close the log sink when leaving the context."""
+        self.close()
+
+
+class LogSinkWriter(object):
+
+    """Log writer that writes the output of a single command to a :class:`LogSink`."""
+
+    def __init__(self, sink, identifier):
+        """
+        Initialize a :class:`LogSinkWriter` object.
+
+        :param sink: A :class:`LogSink` object.
+        :param identifier: The identifier of the command (any value).
+        """
+        self.identifier = identifier
+        self.sink = sink
+
+    def write(self, stream, data):
+        """
+        Write output to the log sink.
+
+        :param stream: The name of the stream (a string).
+        :param data: The output (a byte string).
+        """
+        self.sink.write_record(self.identifier, stream, data)
+
+    def close(self):
+        """Do nothing (the log sink is shared between commands)."""
+
+
+class LinePrefixer(object):
+
+    """Log writer that writes complete lines of output to the terminal with a prefix."""
+
+    lock = threading.Lock()
+    """A lock shared by all :class:`LinePrefixer` objects so that lines of output are never interleaved."""
+
+    def __init__(self, prefix, streams=None):
+        """
+        Initialize a :class:`LinePrefixer` object.
+
+        :param prefix: The text to write before each line of output (a string).
+        :param streams: A dictionary that maps stream names to file objects.
+                        Defaults to :data:`None` which means the output of the
+                        streams 'stdout' and 'stderr' is written to
+                        :data:`sys.stdout` and :data:`sys.stderr`.
+        """
+        self.buffers = {}
+        self.prefix = prefix.encode('UTF-8')
+        self.streams = streams
+
+    def write(self, stream, data):
+        """
+        Write the complete lines of output to the terminal.
+
+        :param stream: The name of the stream (a string).
+        :param data: The output (a byte string). Incomplete lines are buffered
+                     until the rest of the line is received (or the writer is
+                     closed).
+        """
+        lines = (self.buffers.pop(stream, b'') + data).split(b'\n')
+        if lines[-1]:
+            self.buffers[stream] = lines[-1]
+        self.write_lines(stream, lines[:-1])
+
+    def write_lines(self, stream, lines):
+        """
+        Write lines of output to the terminal.
+
+        :param stream: The name of the stream (a string).
+        :param lines: A list of byte strings (without trailing newlines).
+        """
+        if lines:
+            if self.streams is not None:
+                handle = self.streams[stream]
+            else:
+                handle = sys.stderr if stream == 'stderr' else sys.stdout
+            data = b''.join(self.prefix + line + b'\n' for line in lines)
+            with self.lock:
+                if hasattr(handle, 'buffer'):
+                    handle.buffer.write(data)
+                elif isinstance(handle, io.TextIOBase):
+                    handle.write(data.decode('UTF-8', 'replace'))
+                else:
+                    handle.write(data)
+                handle.flush()
+
+    def close(self):
+        """Write any incomplete lines of output to the terminal."""
+        for stream, data in sorted(self.buffers.items()):
+            self.write_lines(stream, [data])
+        self.buffers.clear()
+
+
+def coerce_log_sink(value):
+    """
+    Coerce a value to a :class:`LogSink` object.
+
+    :param value: A :class:`LogSink` object, the pathname of a directory (a
+                  string) or :data:`None`.
+    :returns: A :class:`LogSink` object or :data:`None`.
+    """
+    if value is not None and not isinstance(value, LogSink):
+        value = LogSink(value)
+    return value
+
+
+def open_log_file(filename, compression=None):
+    """
+    Open a (compressed) log file in append mode.
+
+    :param filename: The pathname of the log file (a string).
+    :param compression: One of the keys of :data:`COMPRESSION_METHODS` or :data:`None`.
+    :returns: A writable binary file object (a :class:`BZ2Appender` object
+              when bzip2 compression is requested on Python < 3.3).
+    """
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(filename, 'ab')
+    elif compression == 'bz2':
+        if sys.version_info[:2] < (3, 3):
+            return BZ2Appender(filename)
+        import bz2
+        return bz2.BZ2File(filename, 'a')
+    elif compression == 'lzma':
+        import lzma
+        return lzma.open(filename, 'ab')
+    return open(filename, 'ab')
+
+
+def validate_compression(value):
+    """
+    Validate a log compression method.
+
+    :param value: One of the keys of :data:`COMPRESSION_METHODS` or :data:`None`.
+    :returns: The validated value.
+    :raises: :exc:`~exceptions.ValueError` when the compression method isn't
+             supported or the Python module that implements it isn't available
+             (the :mod:`lzma` module requires Python 3.3 or newer).
+    """
+    if value is not None:
+        if value not in COMPRESSION_METHODS:
+            msg = "Invalid compression method! (expected one of %s, got %r)"
+            raise ValueError(msg % (', '.join(sorted(COMPRESSION_METHODS)), value))
+        try:
+            __import__(value)
+        except ImportError:
+            raise ValueError("The %r compression method isn't available in this Python installation!" % value)
+    return value
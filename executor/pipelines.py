@@ -0,0 +1,242 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 19, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Pipelines of external commands connected by operating system pipes.
+
+The :mod:`executor.pipelines` module defines the :class:`Pipeline` class which
+connects the standard output stream of each external command to the standard
+input stream of the next external command using
+:func:`~executor.process.create_pipe()`. The data flowing through the pipeline
+never passes through the Python process, so the throughput of a pipeline is
+limited by the external commands and not by Python. Pipelines are usually
+created using the ``|`` operator:
+
+>>> from executor import ExternalCommand
+>>> pipeline = ExternalCommand('seq', '20') | ExternalCommand('grep', '5') | ExternalCommand('wc', '-l', capture=True)
+>>> pipeline.wait()
+>>> pipeline.output
+u'2'
+
+Contrary to the shell the external commands in a pipeline are started without
+involving a shell, which means no quoting is required.
+"""
+
+# Standard library modules.
+import logging
+import os
+import signal
+
+# External dependencies.
+from property_manager import PropertyManager, mutable_property
+
+# Modules included in our package.
+from executor.process import create_pipe
+
+# Initialize a logger for this module.
+logger = logging.getLogger(__name__)
+
+
+class Pipeline(PropertyManager):
+
+    """
+    A sequence of external commands whose output and input streams are connected.
+
+    When the pipeline is started the :attr:`~executor.ExternalCommand.stdout_file`
+    property of each command (except the last) and the
+    :attr:`~executor.ExternalCommand.input` property of each command (except the
+    first) are set to the two ends of a pipe. All commands are started
+    asynchronously (refer to :func:`start()` for details). The standard input
+    stream of the first command and the standard output stream of the last
+    command can be configured as usual, for example to capture the output of
+    the pipeline.
+    """
+
+    def __init__(self, *commands, **options):
+        """
+        Initialize a :class:`Pipeline` object.
+
+        :param commands: One or more :class:`~executor.ExternalCommand` and/or
+                         :class:`Pipeline` objects (pipelines are flattened).
+        :param options: Any keyword arguments are used to initialize the
+                        properties of the :class:`Pipeline` object.
+        """
+        flattened = []
+        for value in commands:
+            if isinstance(value, Pipeline):
+                flattened.extend(value.commands)
+            else:
+                flattened.append(value)
+        options.setdefault('commands', flattened)
+        super(Pipeline, self).__init__(**options)
+
+    @mutable_property
+    def commands(self):
+        """The external commands in the pipeline (a list of :class:`~executor.ExternalCommand` objects)."""
+        return []
+
+    @property
+    def failed_commands(self):
+        """
+        The external commands in the pipeline that failed (a list of :class:`~executor.ExternalCommand` objects).
+
+        Commands (other than the last command) that were killed by
+        :data:`signal.SIGPIPE` are not considered to have failed, because this
+        is the expected result when a command further down the pipeline exits
+        before consuming all of its input (think ``head``).
+        """
+        return [cmd for cmd in self.commands if cmd.failed and not self.is_broken_pipe(cmd)]
+
+    @property
+    def is_finished(self):
+        """:data:`True` if all of the external commands in the pipeline have finished, :data:`False` otherwise."""
+        return all(cmd.is_finished for cmd in self.commands)
+
+    @property
+    def is_running(self):
+        """:data:`True` if any of the external commands in the pipeline are running, :data:`False` otherwise."""
+        return any(cmd.is_running for cmd in self.commands)
+
+    @property
+    def output(self):
+        """The value of :attr:`~executor.ExternalCommand.output` for the last command in the pipeline."""
+        return self.commands[-1].output if self.commands else None
+
+    @property
+    def returncode(self):
+        """The value of :attr:`~executor.ExternalCommand.returncode` for the last command in the pipeline."""
+        return self.commands[-1].returncode if self.commands else None
+
+    @property
+    def returncodes(self):
+        """The return codes of the external commands in the pipeline (a list of integers and/or :data:`None`)."""
+        return [cmd.returncode for cmd in self.commands]
+
+    @property
+    def stdout(self):
+        """The value of :attr:`~executor.ExternalCommand.stdout` for the last command in the pipeline."""
+        return self.commands[-1].stdout if self.commands else None
+
+    @property
+    def succeeded(self):
+        """:data:`True` if all external commands finished and none of them failed, :data:`False` otherwise."""
+        return self.is_finished and not self.failed_commands
+
+    def is_broken_pipe(self, command):
+        """
+        Check whether an external command was killed because its output was no longer being read.
+
+        :param command: One of the :class:`~executor.ExternalCommand` objects in :attr:`commands`.
+        :returns: :data:`True` if the command isn't the last command in the
+                  pipeline and it was killed by :data:`signal.SIGPIPE`,
+                  :data:`False` otherwise.
+        """
+        return command is not self.commands[-1] and command.returncode == -signal.SIGPIPE
+
+    def start(self):
+        """
+        Connect the external commands using pipes and start them.
+
+        :raises: :exc:`~exceptions.ValueError` when :attr:`commands` is empty.
+                 When :func:`~executor.ExternalCommand.start()` raises an
+                 exception for one of the commands, the commands that were
+                 already started are terminated (and waited for) before the
+                 exception is propagated.
+
+        The commands are started one by one and the parent process closes its
+        copies of the two ends of each pipe as soon as the commands on both
+        sides have been started. This makes sure that commands see the end of
+        their input as soon as the previous command exits (and that commands
+        are killed by :data:`signal.SIGPIPE` when the next command exits).
+        """
+        if not self.commands:
+            raise ValueError("Can't start a pipeline without commands!")
+        logger.debug("Starting pipeline: %s", self)
+        read_end = None
+        for index, command in enumerate(self.commands):
+            if read_end is not None:
+                command.input = read_end
+            if command is not self.commands[-1]:
+                read_fd, write_fd = create_pipe()
+                command.stdout_file = os.fdopen(write_fd, 'wb')
+            command.async = True
+            try:
+                command.start()
+            except Exception:
+                if command is not self.commands[-1]:
+                    os.close(read_fd)
+                # Don't leave the commands that were already started running
+                # as orphans that hold on to the other ends of the pipes.
+                for started_command in self.commands[:index]:
+                    started_command.terminate()
+                    started_command.wait(check=False)
+                raise
+            finally:
+                # Close the parent's copies of the pipe ends that are now
+                # owned by the external command(s).
+                if read_end is not None:
+                    read_end.close()
+                    read_end = None
+                if command is not self.commands[-1]:
+                    command.stdout_file.close()
+            if command is not self.commands[-1]:
+                read_end = os.fdopen(read_fd, 'rb')
+
+    def wait(self, check=None):
+        """
+        Wait for the external commands in the pipeline to finish.
+
+        :param check: Override the value of :attr:`~executor.ExternalCommand.check`
+                      of the individual commands for the duration of this call.
+                      Defaults to :data:`None` which means the values aren't
+                      overridden.
+        :raises: :exc:`.ExternalCommandFailed` (or a subclass) for the first
+                 command in :attr:`failed_commands` whose
+                 :attr:`~executor.ExternalCommand.check` is enabled.
+
+        If the pipeline hasn't been started yet :func:`start()` is called.
+        """
+        if not any(cmd.was_started for cmd in self.commands):
+            self.start()
+        for command in self.commands:
+            command.wait(check=False)
+        for command in self.failed_commands:
+            command.check_errors(check=check)
+
+    def __enter__(self):
+        """
+        Start the pipeline if it hasn't already been started.
+
+        :returns: The :class:`Pipeline` object.
+        """
+        if not any(cmd.was_started for cmd in self.commands):
+            self.start()
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        """Terminate the external commands that are still running and wait for all commands to finish."""
+        for command in self.commands:
+            if command.is_running:
+                command.terminate()
+        if exc_type is None:
+            self.wait()
+        else:
+            for command in self.commands:
+                command.wait(check=False)
+
+    def __or__(self, other):
+        """
+        Create a new pipeline that extends this pipeline.
+
+        :param other: An :class:`~executor.ExternalCommand` or :class:`Pipeline` object.
+        :returns: A :class:`Pipeline` object.
+        """
+        return Pipeline(self, other)
+
+    def __str__(self):
+        """Render a human friendly representation of the pipeline (using shell syntax)."""
+        from executor import quote
+        return ' | '.join(quote(cmd.command_line) for cmd in self.commands)
@@ -1,7 +1,7 @@
 # Programmer friendly subprocess wrapper.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: January 10, 2017
+# Last Change: October 19, 2026
 # URL: https://executor.readthedocs.io
 
 """
@@ -17,7 +17,12 @@ packages, see for example the :class:`proc.core.Process` class.
 """
 
 # Standard library modules.
+import errno
 import logging
+import os
+import platform
+import select
+import time
 
 # External dependencies.
 from humanfriendly import Spinner, Timer
@@ -29,6 +34,9 @@ logger = logging.getLogger(__name__)
 DEFAULT_TIMEOUT = 10
 """The default timeout used to wait for process termination (number of seconds)."""
 
+PIDFD_OPEN_SYSCALL = 434
+"""The system call number of ``pidfd_open()`` on Linux (the same on all architectures, an integer)."""
+
 
 class ControllableProcess(PropertyManager):
 
@@ -81,6 +89,21 @@ class ControllableProcess(PropertyManager):
         """
         raise NotImplementedError("You need to implement the `is_running' property!")
 
+    @property
+    def is_group_running(self):
+        """
+        :data:`True` if the process or other members of its process group are running, :data:`False` otherwise.
+
+        This property is used by :func:`terminate()` and :func:`kill()` to
+        decide whether signals need to be sent and whether escalation is
+        needed. The default implementation returns the value of
+        :attr:`is_running`, subclasses that signal process groups (from
+        :func:`terminate_helper()` and :func:`kill_helper()`) can override
+        this property to take the other members of the process group into
+        account.
+        """
+        return self.is_running
+
     @mutable_property
     def logger(self):
         """
@@ -108,7 +131,7 @@ class ControllableProcess(PropertyManager):
           representation of a :class:`ControllableProcess` object.
         """
 
-    def wait_for_process(self, timeout=0, use_spinner=None):
+    def wait_for_process(self, timeout=0, use_spinner=None, group=False):
         """
         Wait until the process ends or the timeout expires.
 
@@ -124,16 +147,28 @@ class ControllableProcess(PropertyManager):
                             - :data:`None` (the default) means the spinner is
                               enabled when the program is connected to an
                               interactive terminal, otherwise it's disabled.
+        :param group: :data:`True` to wait until :attr:`is_group_running` is
+                      :data:`False`, :data:`False` (the default) to wait until
+                      :attr:`is_running` is :data:`False`.
         :returns: A :class:`~humanfriendly.Timer` object telling you how long
                   it took to wait for the process.
+
+        On Linux 5.3 and later :func:`wait_for_processes()` is used to wake up
+        the moment the process ends, elsewhere :attr:`is_running` is polled in
+        between redraws of the spinner.
         """
         with Timer(resumable=True) as timer:
             with Spinner(interactive=use_spinner, timer=timer) as spinner:
-                while self.is_running:
+                while (self.is_group_running if group else self.is_running):
                     if timeout and timer.elapsed_time >= timeout:
                         break
                     spinner.step(label="Waiting for process %i to terminate" % self.pid)
-                    spinner.sleep()
+                    # Wake up as soon as the process ends (when possible).
+                    interval = spinner.interval
+                    if timeout:
+                        interval = max(0, min(interval, timeout - timer.elapsed_time))
+                    if not self.is_running or wait_for_processes([self], timeout=interval) is None:
+                        spinner.sleep()
             return timer
 
     def terminate(self, wait=True, timeout=DEFAULT_TIMEOUT, use_spinner=None):
@@ -168,20 +203,20 @@ class ControllableProcess(PropertyManager):
            using :func:`kill()` (the value of `timeout` that was given to
            :func:`terminate()` will be passed on to :func:`kill()`).
 
-        This method does nothing when :attr:`is_running` is :data:`False`.
+        This method does nothing when :attr:`is_group_running` is :data:`False`.
         """
-        if self.is_running:
+        if self.is_group_running:
             self.logger.info("Gracefully terminating process %s ..", self)
             self.terminate_helper()
             if wait:
-                timer = self.wait_for_process(timeout=timeout, use_spinner=use_spinner)
-                if self.is_running:
+                timer = self.wait_for_process(timeout=timeout, use_spinner=use_spinner, group=True)
+                if self.is_group_running:
                     self.logger.warning("Failed to gracefully terminate process! (waited %s)", timer)
                     return self.kill(wait=True, timeout=timeout)
                 else:
                     self.logger.info("Successfully terminated process in %s.", timer)
                     return True
-            return not self.is_running
+            return not self.is_group_running
         else:
             return False
 
@@ -208,20 +243,20 @@ class ControllableProcess(PropertyManager):
                    running after :func:`kill_helper()` and
                    :func:`wait_for_process()` have been called.
 
-        This method does nothing when :attr:`is_running` is :data:`False`.
+        This method does nothing when :attr:`is_group_running` is :data:`False`.
         """
-        if self.is_running:
+        if self.is_group_running:
             self.logger.info("Forcefully killing process %s ..", self)
             self.kill_helper()
             if wait:
-                timer = self.wait_for_process(timeout=timeout, use_spinner=use_spinner)
-                if self.is_running:
+                timer = self.wait_for_process(timeout=timeout, use_spinner=use_spinner, group=True)
+                if self.is_group_running:
                     self.logger.warning("Failed to forcefully kill process! (waited %s)", timer)
                     raise ProcessTerminationFailed(process=self, message="Failed to kill process! (%s)" % self)
                 else:
                     self.logger.info("Successfully killed process in %s.", timer)
                     return True
-            return not self.is_running
+            return not self.is_group_running
         else:
             return False
 
@@ -251,6 +286,166 @@ class ControllableProcess(PropertyManager):
         return " ".join(text)
 
 
+def create_pipe():
+    """
+    Create a pipe whose file descriptors aren't inherited by external commands.
+
+    :returns: A tuple with two file descriptors (integers): The read end and
+              the write end of the pipe (refer to :func:`os.pipe()`).
+
+    The close-on-exec flag is set on both ends of the pipe because on Python
+    2 the file descriptors created by :func:`os.pipe()` are inherited by all
+    child processes, which means an external command could keep a pipe open
+    that it isn't supposed to use (for example a command in a pipeline that
+    holds on to the read end of its own output stream will never be killed
+    by :data:`signal.SIGPIPE`). When one end of the pipe is connected to
+    the standard input or output stream of an external command the file
+    descriptor is duplicated by :class:`subprocess.Popen` and the duplicate
+    doesn't have the close-on-exec flag.
+    """
+    import fcntl
+    descriptors = os.pipe()
+    for fd in descriptors:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+        fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    return descriptors
+
+
+def open_pidfd(pid):
+    """
+    Get a file descriptor that refers to a process.
+
+    :param pid: The process ID (an integer).
+    :returns: A process file descriptor (an integer) that becomes readable
+              when the process ends, or :data:`None` when process file
+              descriptors aren't supported (because we're not running on
+              Linux 5.3 or later) or the process doesn't exist.
+
+    This uses :func:`os.pidfd_open()` when available (Python 3.9 and later)
+    and otherwise calls the ``pidfd_open()`` system call using :mod:`ctypes`.
+    The caller is responsible for closing the file descriptor.
+    """
+    if hasattr(os, 'pidfd_open'):
+        try:
+            return os.pidfd_open(pid)
+        except OSError:
+            return None
+    function = get_pidfd_open_function()
+    if function:
+        fd = function(pid, 0)
+        if fd >= 0:
+            return fd
+
+
+def get_pidfd_open_function():
+    """
+    Get a function that calls the Linux ``pidfd_open()`` system call using :mod:`ctypes`.
+
+    :returns: A callable that takes two integer arguments (the ``pid`` and
+              ``flags`` arguments of the system call) and returns an integer
+              (a file descriptor or -1), or :data:`None` when we're not running
+              on Linux. The result is cached.
+    """
+    if not hasattr(get_pidfd_open_function, 'cached_result'):
+        function = None
+        if platform.system() == 'Linux':
+            try:
+                import ctypes
+                import ctypes.util
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+                def pidfd_open(pid, flags):
+                    """Call ``pidfd_open()``."""
+                    return libc.syscall(PIDFD_OPEN_SYSCALL, pid, flags)
+                function = pidfd_open
+            except Exception:
+                logger.debug("Failed to load the C library, pidfd_open() is not available!", exc_info=True)
+        get_pidfd_open_function.cached_result = function
+    return get_pidfd_open_function.cached_result
+
+
+def wait_for_processes(processes, timeout=None):
+    """
+    Wait until at least one process ends or the timeout expires.
+
+    :param processes: An iterable of :class:`ControllableProcess` objects.
+    :param timeout: The maximum number of seconds to wait (a number) or
+                    :data:`None` to wait indefinitely.
+    :returns: A list with the :class:`ControllableProcess` objects that are
+              no longer running (empty when the timeout expired) or
+              :data:`None` when process file descriptors aren't supported
+              for one or more of the given processes (in which case the
+              caller should fall back to polling :attr:`~ControllableProcess.is_running`).
+
+    A process file descriptor (see :func:`open_pidfd()`) is opened for each
+    running process and all of them are waited on using a single
+    :func:`select.poll()` call, so that the caller wakes up the moment the
+    first process ends.
+    """
+    processes = list(processes)
+    finished = [process for process in processes if not process.is_running]
+    if finished or not hasattr(select, 'poll'):
+        return finished or None
+    descriptors = []
+    try:
+        for process in processes:
+            fd = open_pidfd(process.pid) if process.pid else None
+            if fd is None:
+                return None
+            descriptors.append(fd)
+        poller = select.poll()
+        for fd in descriptors:
+            poller.register(fd, select.POLLIN)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                poller.poll(None if deadline is None else max(0, deadline - time.time()) * 1000)
+                break
+            except (IOError, OSError, select.error) as e:
+                # Retry when poll() is interrupted by a signal (Python < 3.5).
+                if getattr(e, 'errno', e.args[0]) != errno.EINTR:
+                    raise
+        return [process for process in processes if not process.is_running]
+    finally:
+        for fd in descriptors:
+            os.close(fd)
+
+
+def wait_for_readable(descriptors, timeout=None):
+    """
+    Wait until at least one file descriptor is readable.
+
+    :param descriptors: An iterable of file descriptors (integers).
+    :param timeout: The maximum number of seconds to wait (a number) or
+                    :data:`None` to wait indefinitely.
+    :returns: A list with the file descriptors that are readable (empty
+              when the timeout expired). File descriptors whose other end
+              was closed are considered readable (reading from them reports
+              the end of the stream).
+
+    This uses :func:`select.poll()` when available because
+    :func:`select.select()` can't handle file descriptors with numbers of
+    1024 and above (which are common in processes that manage lots of
+    external commands), otherwise it falls back to :func:`select.select()`.
+    """
+    descriptors = list(descriptors)
+    while True:
+        try:
+            if hasattr(select, 'poll'):
+                poller = select.poll()
+                for fd in descriptors:
+                    poller.register(fd, select.POLLIN)
+                events = poller.poll(None if timeout is None else timeout * 1000)
+                ready = set(fd for fd, event in events)
+                return [fd for fd in descriptors if fd in ready]
+            readable, writable, exceptional = select.select(descriptors, [], [], timeout)
+            return readable
+        except (IOError, OSError, select.error) as e:
+            # Retry when poll() is interrupted by a signal (Python < 3.5).
+            if getattr(e, 'errno', e.args[0]) != errno.EINTR:
+                raise
+
+
 class ProcessTerminationFailed(PropertyManager, Exception):
 
     """Raised when process termination fails."""
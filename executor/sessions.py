@@ -0,0 +1,302 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 19, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Persistent shell sessions for command execution contexts.
+
+The :mod:`executor.sessions` module defines the :class:`ShellSession` class
+which implements the :attr:`~executor.contexts.AbstractContext.persistent_shell`
+option of command execution contexts. Instead of starting a new process (and
+for remote contexts a new SSH connection) for every command, a single shell
+is started in the context and commands are written to the standard input of
+that shell. After each command the shell prints a unique sentinel with the
+exit status of the command to its standard output and error streams, which
+is how the output and exit status of each command are read back. This makes
+it cheap to run hundreds of tiny commands (think ``test -e`` and ``cat``) in
+a context, for example on a remote system:
+
+>>> from executor.contexts import RemoteContext
+>>> context = RemoteContext('server', persistent_shell=True)
+>>> context.exists('/etc/hostname')
+True
+
+Each command is executed in a subshell with its standard input connected to
+:data:`os.devnull` so that commands can't change the state of the persistent
+shell (for example by changing its working directory or exiting) and can't
+consume the commands meant for the persistent shell.
+
+Shells that aren't stopped explicitly (using :func:`ShellSession.close()` or
+by leaving the :keyword:`with` block of the context) are stopped when their
+:class:`ShellSession` object is garbage collected or when the Python
+interpreter exits (refer to :func:`stop_shells()`).
+"""
+
+# Standard library modules.
+import atexit
+import logging
+import os
+import re
+import threading
+import uuid
+import weakref
+
+# External dependencies.
+from property_manager import PropertyManager, mutable_property, required_property
+
+# Modules included in our package.
+from executor import DEFAULT_SHELL, DEFAULT_WORKING_DIRECTORY, ExternalCommand, quote
+from executor.process import wait_for_readable
+
+# Initialize a logger for this module.
+logger = logging.getLogger(__name__)
+
+COMMAND_LINE_OPTIONS = ('fakeroot', 'ionice', 'shell', 'sudo', 'uid', 'user', 'virtual_environment')
+"""The names of the command options that are applied by the command line of commands run in a :class:`ShellSession`."""
+
+SUPPORTED_OPTIONS = COMMAND_LINE_OPTIONS + (
+    'capture', 'capture_stderr', 'check', 'directory', 'encoding',
+    'environment', 'logger', 'merge_streams', 'silent',
+)
+"""
+The names of the command options supported by :class:`ShellSession` (a tuple of strings).
+
+Commands with other options (for example :attr:`~executor.ExternalCommand.async`
+or :attr:`~executor.ExternalCommand.input`) are started as separate processes.
+"""
+
+RUNNING_SHELLS = {}
+"""
+The shells that are currently running (a dictionary).
+
+The keys are weak references to :class:`ShellSession` objects and the values
+are the :class:`~executor.ExternalCommand` objects that run the shells. Weak
+references are used so that the shell of a session that is garbage collected
+can be stopped (refer to :func:`forget_session()`) without keeping the session
+(and its context) alive.
+"""
+
+
+class ShellSession(PropertyManager):
+
+    """A long running shell in a command execution context that executes commands sent to it."""
+
+    def __init__(self, context, **options):
+        """
+        Initialize a :class:`ShellSession` object.
+
+        :param context: The command execution context (an
+                        :class:`~executor.contexts.AbstractContext` object).
+        :param options: Any keyword arguments are used to initialize the
+                        properties of the :class:`ShellSession` object.
+        """
+        # Initialize instance variables.
+        self.lock = threading.RLock()
+        self.reference = None
+        # Initialize the superclass.
+        options['context'] = context
+        super(ShellSession, self).__init__(**options)
+
+    @required_property
+    def context(self):
+        """The command execution context of the shell (an :class:`~executor.contexts.AbstractContext` object)."""
+
+    @mutable_property
+    def process(self):
+        """The :class:`~executor.ExternalCommand` object that runs the shell (or :data:`None`)."""
+
+    @property
+    def is_running(self):
+        """:data:`True` if the shell is running, :data:`False` otherwise."""
+        return self.process is not None and self.process.is_running
+
+    def supports(self, options):
+        """
+        Check whether a command can be executed in the shell session.
+
+        :param options: The keyword arguments given to
+                        :func:`~executor.contexts.AbstractContext.execute()` (a
+                        dictionary, before the options of the context have been
+                        merged in).
+        :returns: :data:`True` if all options are in :data:`SUPPORTED_OPTIONS`,
+                  :data:`False` otherwise.
+        """
+        return all(name in SUPPORTED_OPTIONS for name in options)
+
+    def start(self):
+        """
+        Start the shell (if it isn't already running).
+
+        The shell is started using :func:`~executor.contexts.AbstractContext.prepare()`
+        which means it runs wherever the context runs commands (on a remote
+        system, inside a chroot, etc.). Options that apply to individual
+        commands (like :attr:`~executor.ExternalCommand.sudo`) are disabled
+        for the shell itself because they are applied to the commands that
+        are sent to the shell instead.
+        """
+        with self.lock:
+            if not self.is_running:
+                self.forget()
+                self.process = self.context.prepare(
+                    DEFAULT_SHELL, async=True, buffered=False, capture=True, capture_head=None,
+                    capture_stderr=True, capture_tail=None, check=False, environment={}, fakeroot=False,
+                    input=True, ionice=None, shell=False,
+                    sudo=False, tty=False, uid=None, user=None, virtual_environment=None,
+                )
+                self.process.start()
+                self.reference = weakref.ref(self, forget_session)
+                RUNNING_SHELLS[self.reference] = self.process
+                logger.debug("Started persistent shell in %s (process %i).", self.context, self.process.pid)
+
+    def run(self, command, arguments, options):
+        """
+        Execute a command in the shell and record its result.
+
+        :param command: The :class:`~executor.ExternalCommand` object created
+                        by the context (it's not started, its result is
+                        recorded using :func:`~executor.ExternalCommand.record_result()`).
+        :param arguments: The positional arguments that were used to create the command.
+        :param options: The keyword arguments that were used to create the
+                        command (a dictionary, after the options of the context
+                        have been merged in).
+        :raises: Refer to :func:`~executor.ExternalCommand.record_result()`.
+
+        This method is thread safe: The shell executes one command at a time,
+        so concurrent callers wait for each other (otherwise their commands
+        and sentinels would be interleaved).
+        """
+        script = self.prepare_script(arguments, options, merge_streams=command.merge_streams)
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.start()
+            command.logger.debug("Executing command in persistent shell: %s", script)
+            self.process.stdin.write(''.join([
+                script, '\n',
+                # Report the exit status on stdout and mark the end of stderr.
+                "printf '\\n%s %%i\\n' $?\n" % token,
+                "printf '\\n%s\\n' >&2\n" % token,
+            ]).encode(command.encoding))
+            self.process.stdin.flush()
+            buffers = self.read_until_sentinels(token)
+            if buffers is None:
+                # The shell died before reporting the exit status.
+                self.process.wait(check=False)
+                returncode = self.process.returncode
+        if buffers is None:
+            logger.warning("Persistent shell in %s exited unexpectedly!", self.context)
+            command.record_result(returncode or 1)
+            return
+        stdout, status = buffers['stdout']
+        stderr, _ = buffers['stderr']
+        command.record_result(int(status), stdout, stderr)
+
+    def prepare_script(self, arguments, options, merge_streams=False):
+        """
+        Prepare the shell script that executes a command.
+
+        :param arguments: The positional arguments that were used to create the command.
+        :param options: The keyword arguments that were used to create the command.
+        :param merge_streams: :data:`True` to redirect the standard error
+                              stream to the standard output stream.
+        :returns: The shell script (a string).
+        """
+        command_line = ExternalCommand(*arguments, **dict(
+            (name, value) for name, value in options.items()
+            if name in COMMAND_LINE_OPTIONS
+        )).command_line
+        statements = []
+        directory = options.get('directory')
+        if directory and directory != DEFAULT_WORKING_DIRECTORY:
+            statements.append('cd %s' % quote(directory))
+        for name, value in sorted((options.get('environment') or {}).items()):
+            statements.append('export %s=%s' % (name, quote(value)))
+        statements.append(quote(command_line))
+        return '(%s) < /dev/null%s' % (' && '.join(statements), ' 2>&1' if merge_streams else '')
+
+    def read_until_sentinels(self, token):
+        """
+        Read output from the shell until the sentinels have been received on both streams.
+
+        :param token: The unique token used in the sentinels (a string).
+        :returns: A dictionary with the keys 'stdout' and 'stderr' whose
+                  values are tuples with two values: The output (a byte
+                  string) and the text after the token (a string). When the
+                  shell exits before the sentinels are received :data:`None`
+                  is returned.
+        """
+        patterns = dict(
+            stdout=re.compile(b'\n' + token.encode('ascii') + b' (-?\\d+)\n$'),
+            stderr=re.compile(b'\n' + token.encode('ascii') + b'()\n$'),
+        )
+        # The sentinels are always at the end of the output, so we only
+        # search the last part of the output (the sentinel plus some room
+        # for the exit status) to avoid rescanning all of the output.
+        window = len(token) + 32
+        pipes = dict((name, getattr(self.process, name).fileno()) for name in patterns)
+        buffers = dict((name, bytearray()) for name in patterns)
+        results = {}
+        while len(results) < len(patterns):
+            readable = wait_for_readable(fd for name, fd in pipes.items() if name not in results)
+            for name, fd in pipes.items():
+                if fd in readable:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        return None
+                    buffer = buffers[name]
+                    buffer.extend(chunk)
+                    offset = max(0, len(buffer) - window)
+                    match = patterns[name].search(bytes(buffer[offset:]))
+                    if match:
+                        results[name] = (bytes(buffer[:offset + match.start()]), match.group(1).decode('ascii'))
+        return results
+
+    def forget(self):
+        """Remove the shell from :data:`RUNNING_SHELLS` (without stopping it)."""
+        if self.reference is not None:
+            RUNNING_SHELLS.pop(self.reference, None)
+            self.reference = None
+
+    def close(self):
+        """Stop the shell (if it's running)."""
+        with self.lock:
+            self.forget()
+            if self.process is not None:
+                stop_shell(self.process)
+                self.process = None
+
+
+def forget_session(reference):
+    """
+    Stop the shell of a :class:`ShellSession` that was garbage collected.
+
+    :param reference: The weak reference to the session (a key of :data:`RUNNING_SHELLS`).
+
+    This function is used as the callback of the weak references in
+    :data:`RUNNING_SHELLS`.
+    """
+    process = RUNNING_SHELLS.pop(reference, None)
+    if process is not None:
+        stop_shell(process)
+
+
+def stop_shell(process):
+    """
+    Stop a shell by closing its standard input stream.
+
+    :param process: The :class:`~executor.ExternalCommand` object that runs the shell.
+    """
+    if process.is_running:
+        process.stdin.close()
+        process.wait(check=False)
+
+
+def stop_shells():
+    """Stop the shells that are still running when the Python interpreter exits."""
+    for reference, process in list(RUNNING_SHELLS.items()):
+        RUNNING_SHELLS.pop(reference, None)
+        stop_shell(process)
+
+
+atexit.register(stop_shells)
@@ -1,7 +1,7 @@
 # Programmer friendly subprocess wrapper.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: February 25, 2018
+# Last Change: October 19, 2026
 # URL: https://executor.readthedocs.io
 
 """
@@ -13,12 +13,23 @@ in parallel on multiple remote hosts using SSH. The :func:`foreach()` function
 also serves as a simple example of how to use
 :class:`~executor.concurrent.CommandPool` and :class:`RemoteCommand` objects
 (it's just 16 lines of code if you squint in the right way and that includes
-logging :-).
+logging :-). The :func:`iter_foreach()` function is the streaming variant of
+:func:`foreach()` that generates the results of hosts as soon as they finish,
+which is useful on large groups of hosts where a few slow hosts would
+otherwise hold back all results. The :class:`ConnectionPool` class enables SSH connection
+multiplexing, so that consecutive remote commands to the same host can reuse
+a single SSH connection.
 """
 
 # Standard library modules.
+import hashlib
 import logging
 import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
 
 # External dependencies.
 from humanfriendly import Timer, concatenate, pluralize
@@ -27,6 +38,7 @@ from property_manager import (
     mutable_property,
     required_property,
     set_property,
+    writable_property,
 )
 
 # Modules included in our package.
@@ -56,6 +68,42 @@ The default :attr:`~.RemoteCommand.connect_timeout` value to use for
 :class:`RemoteCommand` objects.
 """
 
+DEFAULT_CHECK_INTERVAL = 10
+"""
+The default :attr:`~ConnectionPool.check_interval` value to use for
+:class:`ConnectionPool` objects (a number of seconds).
+"""
+
+DEFAULT_CONTROL_PERSIST = 60
+"""
+The default :attr:`~ConnectionPool.persist` value to use for
+:class:`ConnectionPool` objects (a number of seconds).
+"""
+
+DEFAULT_MASTER_TIMEOUT = 0
+"""
+The default :attr:`~ConnectionPool.master_timeout` value to use for
+:class:`ConnectionPool` objects (a number of seconds).
+"""
+
+DEFAULT_FAILURE_THRESHOLD = 3
+"""
+The default :attr:`~HealthTracker.failure_threshold` value to use for
+:class:`HealthTracker` objects (an integer).
+"""
+
+DEFAULT_PREFIX_FAILURE_THRESHOLD = 5
+"""
+The default :attr:`~HealthTracker.prefix_failure_threshold` value to use for
+:class:`HealthTracker` objects (an integer).
+"""
+
+DEFAULT_RESET_TIMEOUT = 60
+"""
+The default :attr:`~HealthTracker.reset_timeout` value to use for
+:class:`HealthTracker` objects (a number of seconds).
+"""
+
 SSH_PROGRAM_NAME = 'ssh'
 """The name of the SSH client executable (a string)."""
 
@@ -128,36 +176,134 @@ def foreach(hosts, *command, **options):
               arguments ``check=False`` and/or ``delay_checks=False`` to opt
               out of "doing the right thing" ;-)
     """
+    timer = Timer()
+    pool = create_foreach_pool(hosts, *command, **options)
+    # Run all commands in the pool.
+    pool.run()
+    # Report the results to the caller.
+    logger.debug("Finished running remote command on %s in %s.", pluralize(pool.num_commands, "host"), timer)
+    return dict(pool.commands).values()
+
+
+def iter_foreach(hosts, *command, **options):
+    """
+    Execute a command simultaneously on a group of remote hosts and generate the results as hosts finish.
+
+    :param hosts: An iterable of strings with SSH host aliases.
+    :param command: Refer to :func:`foreach()`.
+    :param live_output: :data:`True` to relay the output of the remote
+                        commands to the terminal while they're running, with
+                        the SSH alias as a prefix for each line of output
+                        (refer to :attr:`.CommandPool.live_output`, defaults
+                        to :data:`False`). Enabling this option disables
+                        output capturing by default.
+    :param options: Refer to :func:`foreach()`.
+    :returns: A generator of :class:`RemoteCommand` objects in the order in
+              which they finished.
+    :raises: The same exceptions as :func:`foreach()`, however when
+             :attr:`.delay_checks` is enabled (the default)
+             :exc:`.CommandPoolFailed` is only raised after all results have
+             been generated.
+
+    Contrary to :func:`foreach()` the results of remote commands are
+    available as soon as each host completes, so that a handful of slow
+    hosts don't hold back the processing of all other results. When all
+    remote commands have finished a summary is logged (refer to
+    :func:`format_summary()`). When the caller stops consuming the generator
+    early the remote commands that are still running are terminated.
+    """
+    timer = Timer()
+    pool = create_foreach_pool(hosts, *command, **options)
+    try:
+        for ssh_alias, cmd in pool.iter_results():
+            yield cmd
+    finally:
+        logger.info("%s (took %s).", format_summary(cmd for ssh_alias, cmd in pool.commands), timer)
+
+
+def create_foreach_pool(hosts, *command, **options):
+    """
+    Create the command pool used by :func:`foreach()` and :func:`iter_foreach()`.
+
+    :param hosts: An iterable of strings with SSH host aliases.
+    :param command: Refer to :func:`foreach()`.
+    :param options: Refer to :func:`foreach()` and :func:`iter_foreach()`.
+    :returns: A :class:`RemoteCommandPool` object with a :class:`RemoteCommand`
+              for each host (whose identifier is the SSH alias).
+    """
     hosts = list(hosts)
     # Separate command pool options from command options.
     concurrency = options.pop('concurrency', DEFAULT_CONCURRENCY)
     delay_checks = options.pop('delay_checks', True)
+    live_output = options.pop('live_output', False)
     logs_directory = options.pop('logs_directory', None)
-    # Capture the output of remote commands by default
-    # (unless the caller requested capture=False).
-    if options.get('capture') is not False:
+    # Capture the output of remote commands by default (unless the
+    # caller requested capture=False or the output is relayed).
+    if options.get('capture') is not False and not live_output:
         options['capture'] = True
     # Enable error checking of remote commands by default
     # (unless the caller requested check=False).
     if options.get('check') is not False:
         options['check'] = True
     # Create a command pool.
-    timer = Timer()
     pool = RemoteCommandPool(concurrency=concurrency,
                              delay_checks=delay_checks,
+                             live_output=live_output,
                              logs_directory=logs_directory)
-    hosts_pluralized = pluralize(len(hosts), "host")
     logger.debug("Preparing to run remote command on %s (%s) with a concurrency of %i: %s",
-                 hosts_pluralized, concatenate(hosts), concurrency, quote(command))
+                 pluralize(len(hosts), "host"), concatenate(hosts), concurrency, quote(command))
     # Populate the pool with remote commands to execute.
     for ssh_alias in hosts:
         pool.add(identifier=ssh_alias,
                  command=RemoteCommand(ssh_alias, *command, **options))
-    # Run all commands in the pool.
-    pool.run()
-    # Report the results to the caller.
-    logger.debug("Finished running remote command on %s in %s.", hosts_pluralized, timer)
-    return dict(pool.commands).values()
+    return pool
+
+
+def summarize_results(commands):
+    """
+    Summarize the results of remote commands per host.
+
+    :param commands: An iterable of :class:`RemoteCommand` objects.
+    :returns: A dictionary with the keys 'succeeded', 'failed',
+              'connect_failed' and 'unfinished'. The values are sorted lists
+              with the SSH aliases of the hosts where the remote command
+              succeeded, where the remote command failed, where the SSH
+              connection failed and where the remote command hasn't finished
+              (yet).
+    """
+    summary = dict(succeeded=[], failed=[], connect_failed=[], unfinished=[])
+    for cmd in commands:
+        if not cmd.is_finished:
+            summary['unfinished'].append(cmd.ssh_alias)
+        elif cmd.succeeded:
+            summary['succeeded'].append(cmd.ssh_alias)
+        elif cmd.returncode == SSH_ERROR_STATUS:
+            summary['connect_failed'].append(cmd.ssh_alias)
+        else:
+            summary['failed'].append(cmd.ssh_alias)
+    for aliases in summary.values():
+        aliases.sort()
+    return summary
+
+
+def format_summary(commands):
+    """
+    Render a human friendly summary of the results of remote commands.
+
+    :param commands: An iterable of :class:`RemoteCommand` objects.
+    :returns: A string like "Remote command succeeded on 8 hosts, failed
+              on 1 host (db3) and couldn't connect to 1 host (db7)".
+
+    Refer to :func:`summarize_results()` for details.
+    """
+    summary = summarize_results(commands)
+    parts = ["succeeded on %s" % pluralize(len(summary['succeeded']), "host")]
+    for key, label in (('failed', "failed on %s (%s)"),
+                       ('connect_failed', "couldn't connect to %s (%s)"),
+                       ('unfinished', "didn't finish on %s (%s)")):
+        if summary[key]:
+            parts.append(label % (pluralize(len(summary[key]), "host"), concatenate(summary[key])))
+    return "Remote command %s" % concatenate(parts)
 
 
 def remote(ssh_alias, *command, **options):
@@ -284,7 +430,8 @@ class RemoteCommand(RemoteAccount, ExternalCommand):
                      and :class:`.ExternalCommand` classes.
         :param options: Keyword arguments can be used to conveniently override
                         the values of :attr:`batch_mode`,
-                        :attr:`connect_timeout`, :attr:`identity_file`,
+                        :attr:`connect_timeout`, :attr:`connection_pool`,
+                        :attr:`control_path`, :attr:`identity_file`,
                         :attr:`ignore_known_hosts`, :attr:`log_level`,
                         :attr:`port`, :attr:`strict_host_key_checking`,
                         :attr:`known_hosts_file`, :attr:`ssh_command` and the
@@ -356,6 +503,33 @@ class RemoteCommand(RemoteAccount, ExternalCommand):
         This is a list of strings with the SSH client command to connect to the
         remote host and execute :attr:`~.ExternalCommand.command`.
         """
+        ssh_command = self.ssh_client_command
+        if self.control_path:
+            ssh_command.extend(('-o', 'ControlMaster=no'))
+            ssh_command.extend(('-o', 'ControlPath=%s' % self.control_path))
+        if self.tty:
+            ssh_command.append('-t')
+        ssh_command.append(self.ssh_alias)
+        remote_command = quote(super(RemoteCommand, self).command_line)
+        if remote_command:
+            if self.remote_directory != DEFAULT_WORKING_DIRECTORY:
+                cd_command = 'cd %s' % quote(self.remote_directory)
+                remote_command = quote(self.prefix_shell_command(cd_command, remote_command))
+            ssh_command.append(remote_command)
+        return ssh_command
+
+    @property
+    def ssh_client_command(self):
+        """
+        The SSH client command including options but without the SSH alias and remote command.
+
+        This is a list of strings based on :attr:`ssh_command`,
+        :attr:`identity_file`, :attr:`.ssh_user`, :attr:`port`,
+        :attr:`batch_mode`, :attr:`connect_timeout`, :attr:`log_level`,
+        :attr:`strict_host_key_checking` and :attr:`known_hosts_file`. It's
+        used by :attr:`command_line` and by :class:`ConnectionPool` (to start
+        master connections with the same options).
+        """
         ssh_command = list(self.ssh_command)
         if self.identity_file:
             ssh_command.extend(('-i', self.identity_file))
@@ -371,15 +545,6 @@ class RemoteCommand(RemoteAccount, ExternalCommand):
         else:
             ssh_command.extend(('-o', 'StrictHostKeyChecking=%s' % ('yes' if self.strict_host_key_checking else 'no')))
         ssh_command.extend(('-o', 'UserKnownHostsFile=%s' % self.known_hosts_file))
-        if self.tty:
-            ssh_command.append('-t')
-        ssh_command.append(self.ssh_alias)
-        remote_command = quote(super(RemoteCommand, self).command_line)
-        if remote_command:
-            if self.remote_directory != DEFAULT_WORKING_DIRECTORY:
-                cd_command = 'cd %s' % quote(self.remote_directory)
-                remote_command = quote(self.prefix_shell_command(cd_command, remote_command))
-            ssh_command.append(remote_command)
         return ssh_command
 
     @mutable_property
@@ -400,6 +565,38 @@ class RemoteCommand(RemoteAccount, ExternalCommand):
         """
         return DEFAULT_CONNECT_TIMEOUT
 
+    @mutable_property
+    def connection_pool(self):
+        """
+        The :class:`ConnectionPool` used to share SSH connections (defaults to :data:`None`).
+
+        When this property is set :func:`start()` asks the connection pool for
+        a master connection to the remote host (which is started in the
+        background when it doesn't exist yet) and sets :attr:`control_path` so
+        that the remote command is executed over the existing connection
+        instead of creating a new TCP connection and going through key
+        exchange and authentication again. When no master connection is
+        available (yet) the remote command connects by itself (as if
+        :attr:`connection_pool` wasn't set).
+
+        Because :class:`.RemoteContext` objects pass their options on to the
+        remote commands they create, you can set this option on a remote
+        context to make all of the context's commands share one connection.
+        """
+
+    @mutable_property
+    def control_path(self):
+        """
+        The pathname of the control socket of a master connection (a string or :data:`None`).
+
+        When this property is set the options ``ControlMaster=no`` and
+        ``ControlPath`` are added to :attr:`command_line` so that the remote
+        command is executed over an existing master connection. This property
+        is set automatically by :func:`start()` when :attr:`connection_pool`
+        is set. When the control socket doesn't exist the SSH client program
+        silently falls back to a new connection.
+        """
+
     @property
     def directory(self):
         """
@@ -561,6 +758,16 @@ class RemoteCommand(RemoteAccount, ExternalCommand):
         """
         return False
 
+    def start(self):
+        """
+        Start the remote command (using a shared SSH connection when :attr:`connection_pool` is set).
+
+        Refer to :func:`.ExternalCommand.start()` for details.
+        """
+        if self.connection_pool is not None:
+            self.control_path = self.connection_pool.connect(self)
+        super(RemoteCommand, self).start()
+
     @mutable_property
     def known_hosts_file(self, value=None):
         """
@@ -580,6 +787,296 @@ class RemoteCommand(RemoteAccount, ExternalCommand):
         return value
 
 
+class ConnectionPool(PropertyManager):
+
+    """
+    Manage shared SSH connections (SSH connection multiplexing).
+
+    A :class:`ConnectionPool` starts one SSH master connection per remote
+    account (the combination of :attr:`~RemoteAccount.ssh_user`,
+    :attr:`~RemoteAccount.ssh_alias` and :attr:`~RemoteCommand.port`) using
+    the SSH client options ``ControlMaster``, ``ControlPath`` and
+    ``ControlPersist``. Remote commands whose :attr:`~RemoteCommand.connection_pool`
+    is set open a new channel on the existing connection, which avoids the
+    overhead of a new TCP connection, key exchange and authentication for
+    every remote command. Here's an example:
+
+    >>> from executor.ssh.client import ConnectionPool
+    >>> from executor.contexts import RemoteContext
+    >>> with ConnectionPool() as pool:
+    ...     context = RemoteContext('server', connection_pool=pool)
+    ...     print(context.exists('/etc/hostname'), context.cpu_count)
+    ...
+    True 4
+
+    The master connections are started explicitly (instead of letting the
+    first remote command become the master using ``ControlMaster=auto``) so
+    that the output streams of remote commands are never inherited by a
+    background master process. Master connections are started
+    asynchronously: Remote commands that are started while the master
+    connection to their host is still being established don't wait for it
+    (unless :attr:`master_timeout` is set), instead they connect by
+    themselves. This way a slow or unreachable host never blocks remote
+    commands for other hosts (for example in
+    :func:`~executor.concurrent.CommandPool.spawn()`). Master connections
+    are checked using ``ssh -O check`` (at most once every
+    :attr:`check_interval` seconds) and restarted when they're gone. The
+    master connections are stopped and the control sockets are removed by
+    :func:`close()`.
+    """
+
+    def __init__(self, **options):
+        """
+        Initialize a :class:`ConnectionPool` object.
+
+        :param options: Any keyword arguments are used to initialize the
+                        properties of the :class:`ConnectionPool` object.
+        """
+        # Initialize instance variables.
+        self.checked = {}
+        self.is_temporary_directory = False
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.masters = {}
+        self.pending = {}
+        # Initialize the superclass.
+        super(ConnectionPool, self).__init__(**options)
+
+    @mutable_property
+    def check_interval(self):
+        """
+        The number of seconds between health checks of a master connection (a number).
+
+        Defaults to :data:`DEFAULT_CHECK_INTERVAL`.
+        """
+        return DEFAULT_CHECK_INTERVAL
+
+    @writable_property(cached=True)
+    def directory(self):
+        """
+        The directory where control sockets are created (a string).
+
+        Defaults to a new private temporary directory (which is removed by
+        :func:`close()` and created again when needed). The pathnames of control sockets are limited to
+        around 100 characters so this directory should have a short pathname.
+        """
+        self.is_temporary_directory = True
+        return tempfile.mkdtemp(prefix='executor-ssh-')
+
+    @mutable_property
+    def master_timeout(self):
+        """
+        The number of seconds that :func:`connect()` waits for a master connection that's being started (a number).
+
+        Defaults to :data:`DEFAULT_MASTER_TIMEOUT` which means remote commands
+        never wait for a master connection: While the master connection is
+        being established remote commands use separate connections.
+        """
+        return DEFAULT_MASTER_TIMEOUT
+
+    @mutable_property
+    def persist(self):
+        """
+        The value of the SSH client option ``ControlPersist`` for master connections (a number of seconds).
+
+        Master connections exit by themselves after they've been idle for this
+        many seconds, so that master connections don't outlive the Python
+        process by long when :func:`close()` isn't called. Defaults to
+        :data:`DEFAULT_CONTROL_PERSIST`.
+        """
+        return DEFAULT_CONTROL_PERSIST
+
+    def get_control_path(self, command):
+        """
+        Get the pathname of the control socket for a remote command.
+
+        :param command: A :class:`RemoteCommand` object.
+        :returns: The pathname of the control socket (a string).
+
+        The filename is a hash of the remote username, SSH alias and port
+        number because control socket pathnames must be short.
+        """
+        key = '%s@%s:%s' % (command.ssh_user or '', command.ssh_alias, command.port or '')
+        return os.path.join(self.directory, hashlib.sha1(key.encode('UTF-8')).hexdigest()[:16])
+
+    def get_lock(self, control_path):
+        """
+        Get the lock that serializes access to a master connection.
+
+        :param control_path: The pathname of the control socket (a string).
+        :returns: A :class:`threading.Lock` object.
+
+        The lock of a master connection is only held while the master
+        connection is checked, started or registered, so that connecting to
+        one remote host never waits for another remote host.
+        """
+        with self.lock:
+            return self.locks.setdefault(control_path, threading.Lock())
+
+    def connect(self, command):
+        """
+        Make sure a master connection for a remote command exists.
+
+        :param command: A :class:`RemoteCommand` object.
+        :returns: The pathname of the control socket (a string) or :data:`None`
+                  when the master connection isn't available (because it's
+                  still being established or it couldn't be established).
+        """
+        control_path = self.get_control_path(command)
+        with self.get_lock(control_path):
+            with self.lock:
+                is_pending = control_path in self.pending
+                last_checked = self.checked.get(control_path)
+            if not is_pending:
+                if last_checked is not None and time.time() - last_checked <= self.check_interval:
+                    return control_path
+                is_alive = self.is_alive(command, control_path)
+                with self.lock:
+                    if is_alive:
+                        self.checked[control_path] = time.time()
+                    else:
+                        self.checked.pop(control_path, None)
+                if is_alive:
+                    return control_path
+                self.start_master(command, control_path)
+            return control_path if self.finish_master(control_path) else None
+
+    def is_alive(self, command, control_path):
+        """
+        Check whether a master connection is alive.
+
+        :param command: A :class:`RemoteCommand` object.
+        :param control_path: The pathname of the control socket (a string).
+        :returns: :data:`True` if the master connection responds to ``ssh -O
+                  check``, :data:`False` otherwise.
+        """
+        if not os.path.exists(control_path):
+            return False
+        check_command = ExternalCommand(*self.get_control_command(command, control_path, 'check'),
+                                        check=False, silent=True)
+        check_command.wait()
+        return check_command.succeeded
+
+    def start_master(self, command, control_path):
+        """
+        Start a master connection in the background.
+
+        :param command: A :class:`RemoteCommand` object (whose SSH client
+                        options are used for the master connection).
+        :param control_path: The pathname of the control socket (a string).
+        :returns: The :class:`.ExternalCommand` object that establishes the
+                  master connection (it's started asynchronously and
+                  :func:`finish_master()` checks whether it has finished).
+
+        Because of the ``-f`` option the SSH client program exits as soon as
+        the master connection has been established (leaving the master
+        connection running in the background).
+        """
+        logger.debug("Starting SSH master connection to %s ..", command.ssh_alias)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+        master = ExternalCommand(
+            *(command.ssh_client_command + [
+                '-o', 'ControlMaster=yes',
+                '-o', 'ControlPath=%s' % control_path,
+                '-o', 'ControlPersist=%i' % self.persist,
+                '-N', '-f', command.ssh_alias,
+            ]),
+            async=True, check=False, silent=True
+        )
+        master.start()
+        with self.lock:
+            self.pending[control_path] = (command, master)
+        return master
+
+    def finish_master(self, control_path):
+        """
+        Check whether a master connection that's being started is ready.
+
+        :param control_path: The pathname of the control socket (a string).
+        :returns: :data:`True` if the master connection has been established,
+                  :data:`False` if it's still being established (even after
+                  waiting for :attr:`master_timeout` seconds), it failed or
+                  the pool was closed in the mean time.
+        """
+        with self.lock:
+            entry = self.pending.get(control_path)
+        if entry is None:
+            return False
+        command, master = entry
+        if self.master_timeout and master.is_running:
+            master.wait_for_process(timeout=self.master_timeout, use_spinner=False)
+        if master.is_running:
+            logger.debug("SSH master connection to %s isn't ready yet (using a separate connection).",
+                         command.ssh_alias)
+            return False
+        master.wait(check=False)
+        with self.lock:
+            # Don't register the master connection when close() has already
+            # taken responsibility for it.
+            if self.pending.get(control_path) is not entry:
+                return False
+            del self.pending[control_path]
+            if master.succeeded:
+                self.masters[control_path] = command
+                self.checked[control_path] = time.time()
+        if master.succeeded:
+            return True
+        logger.warning("Failed to start SSH master connection to %s! (falling back to separate connections)",
+                       command.ssh_alias)
+        return False
+
+    def get_control_command(self, command, control_path, operation):
+        """
+        Get the command line to control a master connection.
+
+        :param command: A :class:`RemoteCommand` object.
+        :param control_path: The pathname of the control socket (a string).
+        :param operation: The argument to ``ssh -O`` (a string like 'check' or 'exit').
+        :returns: A list of strings.
+        """
+        return command.ssh_command + ['-o', 'ControlPath=%s' % control_path, '-O', operation, command.ssh_alias]
+
+    def close(self):
+        """
+        Stop the master connections (including those still being started) and remove the control sockets.
+
+        The shared state is copied (and cleared) while holding the lock of the
+        pool, but the external commands are waited for after releasing the
+        lock, so that other threads using the pool aren't blocked by hosts
+        that are slow to respond.
+        """
+        with self.lock:
+            pending = list(self.pending.items())
+            self.pending.clear()
+        for control_path, (command, master) in pending:
+            if master.is_running:
+                master.terminate()
+            master.wait(check=False)
+            if master.succeeded:
+                with self.lock:
+                    self.masters[control_path] = command
+        with self.lock:
+            masters = list(self.masters.items())
+            self.masters.clear()
+            self.checked.clear()
+        for control_path, command in masters:
+            if os.path.exists(control_path):
+                logger.debug("Stopping SSH master connection to %s ..", command.ssh_alias)
+                ExternalCommand(*self.get_control_command(command, control_path, 'exit'),
+                                check=False, silent=True).wait()
+        if self.is_temporary_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        """Enable the use of connection pools as context managers."""
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        """Close the connection pool when leaving the context."""
+        self.close()
+
+
 class RemoteCommandPool(CommandPool):
 
     """
@@ -589,9 +1086,9 @@ class RemoteCommandPool(CommandPool):
     to it using :func:`~executor.concurrent.CommandPool.add()` and when you're
     ready to run the commands you call :func:`~executor.concurrent.CommandPool.run()`.
 
-    .. note:: The only difference between :class:`.CommandPool` and
-              :class:`RemoteCommandPool` is the default concurrency. This may
-              of course change in the future.
+    The differences between :class:`.CommandPool` and :class:`RemoteCommandPool`
+    are the default concurrency and the :attr:`connection_pool` and
+    :attr:`health_tracker` options.
     """
 
     def __init__(self, concurrency=DEFAULT_CONCURRENCY, **options):
@@ -604,8 +1101,397 @@ class RemoteCommandPool(CommandPool):
         :param options: Any additional keyword arguments are passed on
                         to the :class:`.CommandPool` constructor.
         """
+        self.adaptive_concurrency = None
+        self.num_tracked = 0
+        self.rejected = set()
         super(RemoteCommandPool, self).__init__(concurrency, **options)
 
+    @property
+    def concurrency_limit(self):
+        """
+        The number of remote commands that are currently allowed to run simultaneously (an integer).
+
+        When :attr:`health_tracker` is set this number adapts to the health of
+        the SSH connections: It starts at :attr:`~.CommandPool.concurrency`,
+        it's halved every time an SSH connection fails (the exit status is
+        :data:`SSH_ERROR_STATUS`, which includes connection timeouts) and it
+        grows by one for every remote command that did connect, up to
+        :attr:`~.CommandPool.concurrency`. This avoids tying up all slots with
+        connection attempts that are timing out when a network link degrades.
+        """
+        if self.adaptive_concurrency is not None:
+            return min(self.adaptive_concurrency, self.concurrency)
+        return self.concurrency
+
+    @mutable_property
+    def connection_pool(self):
+        """
+        A :class:`ConnectionPool` to share SSH connections between the commands in the pool (defaults to :data:`None`).
+
+        When this property is set :func:`add()` sets the
+        :attr:`~RemoteCommand.connection_pool` of remote commands that don't
+        have a connection pool yet, so that commands to the same remote host
+        share a single SSH connection. The connection pool isn't closed when
+        :func:`~executor.concurrent.CommandPool.run()` finishes, so that it can
+        be reused by other remote commands (call :func:`ConnectionPool.close()`
+        when you're done).
+        """
+
+    @mutable_property
+    def health_tracker(self):
+        """
+        A :class:`HealthTracker` to enable circuit breaking and adaptive concurrency (defaults to :data:`None`).
+
+        When this property is set:
+
+        - Remote commands for hosts (or network prefixes) whose circuit breaker
+          is open aren't started, instead they fail immediately with the exit
+          status :data:`SSH_ERROR_STATUS` (as if the SSH connection failed).
+
+        - The concurrency of the pool adapts to the health of the SSH
+          connections (refer to :attr:`concurrency_limit`).
+
+        A health tracker can be shared between pools so that the health of
+        hosts is remembered between runs. The value :data:`True` is accepted
+        as well (it's coerced to a new :class:`HealthTracker` object).
+        """
+
+    @health_tracker.setter
+    def health_tracker(self, value):
+        """Coerce and set the health tracker."""
+        set_property(self, 'health_tracker', HealthTracker() if value is True else value)
+
+    def add(self, command, identifier=None, log_file=None):
+        """
+        Add a remote command to the pool.
+
+        :param command: The remote command to add to the pool (a
+                        :class:`RemoteCommand` object, other
+                        :class:`.ExternalCommand` objects are accepted
+                        as well).
+        :param identifier: Refer to :func:`.CommandPool.add()`.
+        :param log_file: Refer to :func:`.CommandPool.add()`.
+
+        If :attr:`connection_pool` is set it's used as the default
+        :attr:`~RemoteCommand.connection_pool` of remote commands.
+        """
+        if self.connection_pool is not None and isinstance(command, RemoteCommand):
+            if command.connection_pool is None:
+                command.connection_pool = self.connection_pool
+        super(RemoteCommandPool, self).add(command, identifier=identifier, log_file=log_file)
+
+    def spawn(self):
+        """
+        Fail remote commands for unhealthy hosts and spawn additional remote commands.
+
+        :returns: Refer to :func:`.CommandPool.spawn()`.
+
+        When :attr:`health_tracker` is set, remote commands that haven't been
+        started yet and whose circuit breaker is open fail immediately (they
+        are reported as failed SSH connections without running ``ssh``).
+        """
+        if self.health_tracker is not None:
+            for identifier, command in self.commands:
+                if not command.was_started and isinstance(command, RemoteCommand):
+                    if self.health_tracker.is_open(command.ssh_alias):
+                        self.rejected.add(identifier)
+                        command.record_result(
+                            SSH_ERROR_STATUS, check=False,
+                            stderr=b"Circuit breaker is open, not connecting to unhealthy host.\n",
+                        )
+        return super(RemoteCommandPool, self).spawn()
+
+    def is_ready(self, command):
+        """
+        Check whether a remote command can be started.
+
+        :param command: An :class:`.ExternalCommand` object.
+        :returns: :data:`True` if :func:`.CommandPool.is_ready()` returns
+                  :data:`True` and :attr:`health_tracker` (if set) allows a
+                  connection to the host, :data:`False` otherwise.
+        """
+        if not super(RemoteCommandPool, self).is_ready(command):
+            return False
+        if self.health_tracker is not None and isinstance(command, RemoteCommand):
+            return self.health_tracker.allow(command.ssh_alias)
+        return True
+
+    def collect(self):
+        """
+        Collect finished remote commands and update the health of hosts.
+
+        :returns: Refer to :func:`.CommandPool.collect()`.
+        :raises: Refer to :func:`.CommandPool.collect()`.
+
+        When :attr:`health_tracker` is set the results of the collected
+        remote commands are reported to the health tracker and
+        :attr:`concurrency_limit` is adjusted.
+        """
+        try:
+            return super(RemoteCommandPool, self).collect()
+        finally:
+            if self.health_tracker is not None:
+                self.update_health()
+
+    def update_health(self):
+        """Report the results of newly collected remote commands to :attr:`health_tracker`."""
+        while self.num_tracked < len(self.collected_commands):
+            identifier, command = self.collected_commands[self.num_tracked]
+            self.num_tracked += 1
+            if identifier not in self.rejected and isinstance(command, RemoteCommand):
+                connect_failed = (command.returncode == SSH_ERROR_STATUS)
+                self.health_tracker.record(command.ssh_alias, connect_failed)
+                limit = self.concurrency_limit
+                self.adaptive_concurrency = max(1, limit // 2) if connect_failed else limit + 1
+
+
+class HealthTracker(PropertyManager):
+
+    """
+    Track the health of SSH connections per host and per network prefix.
+
+    Each host and network prefix (refer to :attr:`prefix_function`) has a
+    :class:`CircuitBreaker`. When the SSH connections to a host or network
+    prefix fail repeatedly (the exit status is :data:`SSH_ERROR_STATUS`) the
+    circuit breaker opens and remote commands for the affected hosts fail
+    fast instead of waiting for connection timeouts. After
+    :attr:`reset_timeout` seconds a single remote command is allowed to try
+    again: If it connects the circuit breaker closes, otherwise it opens again.
+    Health trackers are used by :attr:`RemoteCommandPool.health_tracker`
+    and they're thread safe, so one health tracker can be shared by pools
+    that run in different threads.
+    """
+
+    def __init__(self, **options):
+        """
+        Initialize a :class:`HealthTracker` object.
+
+        :param options: Any keyword arguments are used to initialize the
+                        properties of the :class:`HealthTracker` object.
+        """
+        # Initialize instance variables.
+        self.breakers = {}
+        self.lock = threading.RLock()
+        self.prefixes = {}
+        # Initialize the superclass.
+        super(HealthTracker, self).__init__(**options)
+
+    @mutable_property
+    def failure_threshold(self):
+        """The number of consecutive connection failures after which the breaker of a host opens (an integer)."""
+        return DEFAULT_FAILURE_THRESHOLD
+
+    @mutable_property
+    def prefix_failure_threshold(self):
+        """
+        The number of consecutive connection failures after which the circuit breaker of a network prefix opens.
+
+        Failures to connect to different hosts in the same network prefix add
+        up, so that a degraded datacenter link is detected before the circuit
+        breakers of the individual hosts open (an integer).
+        """
+        return DEFAULT_PREFIX_FAILURE_THRESHOLD
+
+    @mutable_property
+    def prefix_function(self):
+        """
+        The function that groups remote hosts into network prefixes (a callable or :data:`None`).
+
+        The function is called with an SSH alias (a string) and should return
+        a string with the network prefix of the host or :data:`None` (when
+        the host doesn't belong to a known network prefix). Hosts with the
+        same network prefix share a circuit breaker (refer to
+        :attr:`prefix_failure_threshold`). Defaults to
+        :func:`get_network_prefix()`, you can set this to a function that
+        knows the network topology (for example one that maps host names to
+        datacenters) or to :data:`None` to disable the circuit breakers of
+        network prefixes.
+        """
+        return get_network_prefix
+
+    @mutable_property
+    def reset_timeout(self):
+        """The number of seconds after which an open circuit breaker allows a connection attempt (a number)."""
+        return DEFAULT_RESET_TIMEOUT
+
+    def get_breakers(self, ssh_alias):
+        """
+        Get the circuit breakers that apply to a remote host.
+
+        :param ssh_alias: The SSH alias of the remote host (a string).
+        :returns: A list of :class:`CircuitBreaker` objects (for the host and
+                  for its network prefix, if known).
+        """
+        with self.lock:
+            keys = [('host', ssh_alias, self.failure_threshold)]
+            if ssh_alias not in self.prefixes:
+                self.prefixes[ssh_alias] = self.prefix_function(ssh_alias) if self.prefix_function else None
+            prefix = self.prefixes[ssh_alias]
+            if prefix:
+                keys.append(('prefix', prefix, self.prefix_failure_threshold))
+            breakers = []
+            for kind, name, threshold in keys:
+                if (kind, name) not in self.breakers:
+                    self.breakers[(kind, name)] = CircuitBreaker(
+                        name=name, threshold=threshold,
+                        reset_timeout=self.reset_timeout,
+                    )
+                breakers.append(self.breakers[(kind, name)])
+            return breakers
+
+    def is_open(self, ssh_alias):
+        """
+        Check whether connections to a remote host should fail fast.
+
+        :param ssh_alias: The SSH alias of the remote host (a string).
+        :returns: :data:`True` if one of the circuit breakers of the host is
+                  open (and its :attr:`reset_timeout` hasn't passed yet),
+                  :data:`False` otherwise.
+        """
+        with self.lock:
+            return any(b.state == 'open' for b in self.get_breakers(ssh_alias))
+
+    def allow(self, ssh_alias):
+        """
+        Check whether a connection to a remote host can be attempted now.
+
+        :param ssh_alias: The SSH alias of the remote host (a string).
+        :returns: :data:`True` if the connection can be attempted,
+                  :data:`False` otherwise.
+
+        When a circuit breaker is half-open only a single connection attempt
+        is allowed until its result has been recorded using :func:`record()`.
+        Because of this the caller is expected to actually attempt the
+        connection when this method returns :data:`True`.
+        """
+        with self.lock:
+            breakers = self.get_breakers(ssh_alias)
+            if any(b.state == 'open' or b.probing for b in breakers):
+                return False
+            for b in breakers:
+                if b.state == 'half-open':
+                    b.probing = True
+            return True
+
+    def record(self, ssh_alias, connect_failed):
+        """
+        Record the result of a connection attempt.
+
+        :param ssh_alias: The SSH alias of the remote host (a string).
+        :param connect_failed: :data:`True` if the connection failed,
+                               :data:`False` if it succeeded.
+        """
+        with self.lock:
+            for b in self.get_breakers(ssh_alias):
+                if connect_failed:
+                    if b.record_failure():
+                        logger.warning("Circuit breaker for %s opened after %s.",
+                                       b.name, pluralize(b.failures, "connection failure"))
+                else:
+                    b.record_success()
+
+
+class CircuitBreaker(object):
+
+    """The circuit breaker of a remote host or network prefix (used by :class:`HealthTracker`)."""
+
+    def __init__(self, name, threshold, reset_timeout):
+        """
+        Initialize a :class:`CircuitBreaker` object.
+
+        :param name: The SSH alias or network prefix (a string).
+        :param threshold: The number of consecutive failures after which the
+                          circuit breaker opens (an integer).
+        :param reset_timeout: The number of seconds after which an open
+                              circuit breaker becomes half-open (a number).
+        """
+        self.failures = 0
+        self.name = name
+        self.opened_time = None
+        self.probing = False
+        self.reset_timeout = reset_timeout
+        self.threshold = threshold
+
+    @property
+    def state(self):
+        """
+        The state of the circuit breaker (a string).
+
+        One of the strings 'closed' (connections are allowed), 'open'
+        (connections fail fast) or 'half-open' (a connection attempt is
+        allowed to find out whether the host has recovered).
+        """
+        if self.opened_time is None:
+            return 'closed'
+        elif time.time() - self.opened_time < self.reset_timeout:
+            return 'open'
+        else:
+            return 'half-open'
+
+    def record_failure(self):
+        """
+        Record a failed connection attempt.
+
+        :returns: :data:`True` if the circuit breaker opened,
+                  :data:`False` otherwise.
+        """
+        was_closed = self.state == 'closed'
+        self.failures += 1
+        self.probing = False
+        if not was_closed or self.failures >= self.threshold:
+            self.opened_time = time.time()
+            return was_closed
+        return False
+
+    def record_success(self):
+        """Record a successful connection attempt (this closes the circuit breaker)."""
+        self.failures = 0
+        self.opened_time = None
+        self.probing = False
+
+
+def get_network_prefix(ssh_alias):
+    """
+    Get the network prefix of a remote host.
+
+    :param ssh_alias: The SSH alias of the remote host (a string).
+    :returns: A string with the network prefix or :data:`None`.
+
+    This is the default :attr:`~HealthTracker.prefix_function`. Hosts are
+    grouped as follows:
+
+    - For IPv4 addresses the /24 network is used and for IPv6 addresses the
+      /64 network.
+
+    - For host names with at least three labels the parent domain (everything
+      after the first label) is used, so ``web1.dc1.example.com`` and
+      ``web2.dc1.example.com`` share the prefix ``dc1.example.com`` while
+      ``web1.dc2.example.com`` doesn't. Host names are never resolved because
+      resolving host names just to group them would be too slow.
+
+    - Host names with less than three labels (like ``localhost`` or
+      ``example.com``) don't get a prefix, because grouping them by their
+      top level domain would make unrelated hosts share a circuit breaker.
+
+    Note that all hosts directly below a domain share a prefix (for example
+    ``web1.example.com`` and ``db1.example.com`` share ``example.com``), so
+    when the naming of your hosts doesn't reflect the network topology you
+    should set :attr:`~HealthTracker.prefix_function` to a custom function.
+    """
+    try:
+        packed = socket.inet_pton(socket.AF_INET, ssh_alias)
+        return '%s/24' % socket.inet_ntop(socket.AF_INET, packed[:3] + b'\x00')
+    except (socket.error, ValueError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ssh_alias)
+        return '%s/64' % socket.inet_ntop(socket.AF_INET6, packed[:8] + b'\x00' * 8)
+    except (socket.error, ValueError):
+        pass
+    labels = ssh_alias.rstrip('.').split('.')
+    if len(labels) >= 3 and all(labels):
+        return '.'.join(labels[1:])
+
 
 class RemoteConnectFailed(ExternalCommandFailed):
 
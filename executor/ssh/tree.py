@@ -0,0 +1,324 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 19, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Hierarchical (tree) fan-out of remote commands through relay hosts.
+
+The :func:`~executor.ssh.client.foreach()` function runs one SSH client per
+remote host on the controller (the host running Python), which means the
+number of remote hosts that can be reached in a reasonable amount of time is
+limited by the CPU and network capacity of the controller. The
+:func:`tree_foreach()` function defined in the :mod:`executor.ssh.tree` module
+instead divides the remote hosts into at most :data:`DEFAULT_FANOUT` groups
+and uses the first host of each group as a relay: A small Python program
+(:data:`RELAY_RUNNER`) is started on the relay over SSH, it executes the
+command on the relay itself and divides the remaining hosts of the group in
+the same way. Each relay streams the results of its subtree back to its parent
+in a compact framed format (refer to :data:`FRAME_HEADER`), so the number of
+tiers (and the time to reach all hosts) grows logarithmically with the number
+of hosts while each host runs at most :data:`DEFAULT_FANOUT` SSH clients.
+
+Relay hosts need a Python interpreter (any version from 2.6 onwards) and must
+be able to connect to the hosts in their subtree using the same SSH client
+options as the controller (for example by using agent forwarding or a shared
+SSH client configuration).
+"""
+
+# Standard library modules.
+import io
+import json
+import logging
+import struct
+import sys
+
+# External dependencies.
+from humanfriendly import Timer, pluralize
+
+# Modules included in our package.
+from executor import ExternalCommand, quote
+from executor.concurrent import CommandPoolFailed
+from executor.ssh.client import SSH_ERROR_STATUS, RemoteCommand, RemoteCommandPool, format_summary
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+DEFAULT_FANOUT = 32
+"""
+The default maximum number of SSH clients per host used by :func:`tree_foreach()` (an integer).
+
+This is both the maximum number of relays that a host talks to and the
+maximum number of hosts that a relay executes the command on directly. With
+a fan-out of 32, three tiers of relays reach more than 30,000 hosts.
+"""
+
+DEFAULT_RELAY_PYTHON = 'python3'
+"""The default name of the Python interpreter used to start :data:`RELAY_RUNNER` on relay hosts (a string)."""
+
+FRAME_HEADER = struct.Struct('!HiII')
+"""
+The header of the frames that report the results of remote commands (a :class:`struct.Struct` object).
+
+The header contains the length of the SSH alias, the exit status of the
+remote command (a signed integer) and the lengths of the standard output and
+standard error streams. It's followed by the SSH alias (encoded as UTF-8) and
+the output of both streams.
+"""
+
+RELAY_RUNNER = r'''
+import json, os, struct, subprocess, sys, tempfile, threading
+
+FRAME_HEADER = struct.Struct('!HiII')
+LOCK = threading.Lock()
+OUTPUT = getattr(sys.stdout, 'buffer', sys.stdout)
+
+
+def emit(frame):
+    LOCK.acquire()
+    try:
+        OUTPUT.write(frame)
+        OUTPUT.flush()
+    finally:
+        LOCK.release()
+
+
+def report(alias, returncode, stdout, stderr):
+    encoded = alias.encode('UTF-8')
+    emit(FRAME_HEADER.pack(len(encoded), returncode, len(stdout), len(stderr)) + encoded + stdout + stderr)
+
+
+def read_exactly(handle, size):
+    data = b''
+    while len(data) < size:
+        chunk = handle.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def execute(alias, command_line):
+    try:
+        process = subprocess.Popen(command_line, stdin=open(os.devnull, 'rb'),
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        report(alias, process.returncode, stdout, stderr)
+    except Exception as e:
+        report(alias, 255, b'', str(e).encode('UTF-8'))
+
+
+def relay(job, hosts):
+    reported = set()
+    returncode = 255
+    stderr = b''
+    try:
+        errors = tempfile.TemporaryFile()
+        process = subprocess.Popen(hosts[0][1] + [job['relay_command']],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errors)
+        subtree = dict(job, hosts=hosts, relay=True)
+        process.stdin.write(json.dumps(subtree).encode('UTF-8'))
+        process.stdin.close()
+        while True:
+            header = read_exactly(process.stdout, FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                break
+            alias_size, status, stdout_size, stderr_size = FRAME_HEADER.unpack(header)
+            body = read_exactly(process.stdout, alias_size + stdout_size + stderr_size)
+            emit(header + body)
+            reported.add(body[:alias_size].decode('UTF-8'))
+        returncode = process.wait()
+        errors.seek(0)
+        stderr = errors.read()
+    except Exception as e:
+        stderr = str(e).encode('UTF-8')
+    message = ('Relay through %s failed (exit status %i).\n' % (hosts[0][0], returncode)).encode('UTF-8')
+    for alias, command_line in hosts:
+        if alias not in reported:
+            report(alias, 255, b'', message + stderr)
+
+
+def dispatch(job, hosts):
+    fanout = job['fanout']
+    threads = []
+    if len(hosts) <= fanout:
+        for alias, command_line in hosts:
+            threads.append(threading.Thread(target=execute, args=(alias, command_line + [job['command']])))
+    else:
+        size = (len(hosts) + fanout - 1) // fanout
+        for offset in range(0, len(hosts), size):
+            threads.append(threading.Thread(target=relay, args=(job, hosts[offset:offset + size])))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    job = json.loads(sys.stdin.read())
+    hosts = job['hosts']
+    threads = []
+    if job.get('relay'):
+        alias = hosts.pop(0)[0]
+        threads.append(threading.Thread(target=execute, args=(alias, ['sh', '-c', job['command']])))
+        threads[-1].start()
+    dispatch(job, hosts)
+    for thread in threads:
+        thread.join()
+
+
+main()
+'''
+"""
+The source code of the Python program that runs on the controller and on relay hosts (a string).
+
+The program reads a job description (a JSON object) from its standard input
+and writes a frame (refer to :data:`FRAME_HEADER`) to its standard output for
+each host in the job. The job contains the remote command, the SSH client
+command line for each host, the fan-out and the command line that starts the
+program on a relay. When a relay fails before reporting the results of its
+subtree, the hosts that weren't reported get the exit status
+:data:`~executor.ssh.client.SSH_ERROR_STATUS` (the same exit status as a
+failed SSH connection) with an explanation on the standard error stream.
+"""
+
+
+def tree_foreach(hosts, *command, **options):
+    """
+    Execute a command on a group of remote hosts using a tree of relay hosts.
+
+    :param hosts: An iterable of strings with SSH host aliases.
+    :param command: Any positional arguments are converted to a list and used
+                    to set the :attr:`~.ExternalCommand.command` property of
+                    the :class:`.RemoteCommand` objects constructed by
+                    :func:`tree_foreach()` (a command is required).
+    :param fanout: The maximum number of SSH clients per host (an integer,
+                   defaults to :data:`DEFAULT_FANOUT`).
+    :param relay_python: The name of the Python interpreter on relay hosts (a
+                         string, defaults to :data:`DEFAULT_RELAY_PYTHON`).
+    :param options: Additional keyword arguments are used to initialize the
+                    :class:`.RemoteCommand` objects (see
+                    :func:`~executor.ssh.client.foreach()`).
+    :returns: The list of :class:`.RemoteCommand` objects constructed by
+              :func:`tree_foreach()` (with the results of the remote commands
+              recorded using :func:`~executor.ExternalCommand.record_result()`).
+    :raises: :exc:`~exceptions.ValueError` when no command is given and
+             :exc:`.CommandPoolFailed` when a remote command that has
+             :attr:`.check` enabled (the default) failed. Like the default
+             behavior of :func:`~executor.ssh.client.foreach()` this
+             exception is only raised after the command has run on all hosts.
+
+    When the number of hosts doesn't exceed the fan-out the remote commands
+    are executed directly from the controller, otherwise relays are used
+    (refer to the documentation of the :mod:`executor.ssh.tree` module).
+    The remote commands' output is captured by default. The frames are
+    parsed as they arrive (refer to :func:`read_frames()`) so the result of
+    each remote command is recorded as soon as it has been reported, and the
+    output of all hosts is never buffered as a whole.
+    """
+    hosts = list(hosts)
+    fanout = options.pop('fanout', DEFAULT_FANOUT)
+    relay_python = options.pop('relay_python', DEFAULT_RELAY_PYTHON)
+    # Capture the output of remote commands by default
+    # (unless the caller requested capture=False).
+    if options.get('capture') is not False:
+        options['capture'] = True
+    # Enable error checking of remote commands by default
+    # (unless the caller requested check=False).
+    if options.get('check') is not False:
+        options['check'] = True
+    # The pool is only used to keep track of the results (it's never run).
+    pool = RemoteCommandPool()
+    for ssh_alias in hosts:
+        pool.add(identifier=ssh_alias, command=RemoteCommand(ssh_alias, *command, **options))
+    results = pool.results
+    if not any(cmd.command for ssh_alias, cmd in pool.commands):
+        raise ValueError("Tree fan-out requires a remote command!")
+    job = dict(
+        command=pool.commands[0][1].command_line[-1] if pool.commands else '',
+        fanout=fanout,
+        hosts=[[ssh_alias, cmd.ssh_client_command + [cmd.ssh_alias]] for ssh_alias, cmd in pool.commands],
+        relay_command=quote(relay_python, '-c', RELAY_RUNNER),
+    )
+    timer = Timer()
+    logger.debug("Running remote command on %s using a fan-out of %i ..", pluralize(len(hosts), "host"), fanout)
+    runner = ExternalCommand(sys.executable, '-c', RELAY_RUNNER,
+                             async=True, buffered=False, capture=True, input=json.dumps(job))
+    runner.start()
+    try:
+        for ssh_alias, returncode, stdout, stderr in read_frames(runner.stdout):
+            if ssh_alias in results and not results[ssh_alias].was_started:
+                results[ssh_alias].record_result(returncode, stdout, stderr, check=False)
+    except Exception:
+        runner.terminate()
+        runner.wait(check=False)
+        raise
+    runner.wait()
+    for ssh_alias, cmd in pool.commands:
+        if not cmd.was_started:
+            cmd.record_result(SSH_ERROR_STATUS, stderr=b"No result was reported!\n", check=False)
+    logger.debug("%s (took %s).", format_summary(cmd for ssh_alias, cmd in pool.commands), timer)
+    if pool.unexpected_failures:
+        raise CommandPoolFailed(pool=pool)
+    return [cmd for ssh_alias, cmd in pool.commands]
+
+
+def parse_frames(data):
+    """
+    Parse the frames written by :data:`RELAY_RUNNER`.
+
+    :param data: The output of :data:`RELAY_RUNNER` (a byte string).
+    :returns: Refer to :func:`read_frames()`.
+    :raises: Refer to :func:`read_frames()`.
+    """
+    return read_frames(io.BytesIO(data))
+
+
+def read_frames(handle):
+    """
+    Read the frames written by :data:`RELAY_RUNNER` from a stream.
+
+    :param handle: A readable binary file object (for example the pipe
+                   connected to the standard output of :data:`RELAY_RUNNER`).
+    :returns: A generator of tuples with four values each: The SSH alias (a
+              string), the exit status (an integer) and the output on the
+              standard output and error streams (two byte strings).
+    :raises: :exc:`~exceptions.ValueError` when the stream ends with an
+             incomplete frame.
+
+    Each frame is generated as soon as it has been read completely, so the
+    caller can process results while :data:`RELAY_RUNNER` is still running.
+    """
+    while True:
+        header = read_exactly(handle, FRAME_HEADER.size)
+        if not header:
+            break
+        if len(header) < FRAME_HEADER.size:
+            raise ValueError("Incomplete frame header in relay output!")
+        alias_size, returncode, stdout_size, stderr_size = FRAME_HEADER.unpack(header)
+        body = read_exactly(handle, alias_size + stdout_size + stderr_size)
+        if len(body) < alias_size + stdout_size + stderr_size:
+            raise ValueError("Incomplete frame in relay output!")
+        ssh_alias = body[:alias_size].decode('UTF-8')
+        yield ssh_alias, returncode, body[alias_size:alias_size + stdout_size], body[alias_size + stdout_size:]
+
+
+def read_exactly(handle, size):
+    """
+    Read a number of bytes from a stream.
+
+    :param handle: A readable binary file object.
+    :param size: The number of bytes to read (an integer).
+    :returns: A byte string with the requested number of bytes (it's shorter
+              when the end of the stream was reached).
+    """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = handle.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
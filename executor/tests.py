@@ -43,6 +43,9 @@ environment passwordless sudo access has been configured.
 
 # Standard library modules.
 import datetime
+import functools
+import gc
+import io
 import logging
 import os
 import pwd
@@ -51,48 +54,68 @@ import shlex
 import socket
 import sys
 import tempfile
+import threading
 import time
 import uuid
 
 # External dependencies.
 from humanfriendly import Timer, compact
-from humanfriendly.testing import TemporaryDirectory, TestCase, retry, run_cli
-from mock import MagicMock
+from humanfriendly.testing import CaptureOutput, TemporaryDirectory, TestCase, retry, run_cli
+from mock import MagicMock, patch
 
 # Modules included in our package.
 from executor import (
     COMMAND_NOT_FOUND_STATUS,
     DEFAULT_SHELL,
     DEFAULT_WORKING_DIRECTORY,
+    LAZY_LOAD_THRESHOLD,
     CommandNotFound,
     ExternalCommand,
     ExternalCommandFailed,
+    create_memory_file,
     execute,
+    iter_decoded_lines,
     quote,
     which,
 )
 from executor.cli import main
+from executor.facts import FactCache
 from executor.concurrent import CommandPool, CommandPoolFailed
 from executor.contexts import (
+    AbstractContext,
     ChangeRootContext,
     create_context,
     LocalContext,
     RemoteContext,
     SecureChangeRootContext,
 )
-from executor.process import ProcessTerminationFailed
+from executor.cgroups import ControlGroup, find_cgroup_root, find_current_cgroup
+from executor.limits import get_available_cpus
+from executor.logs import BZ2Appender, LogSink, TRUNCATION_MARKER
+from executor.pipelines import Pipeline
+from executor.process import ProcessTerminationFailed, open_pidfd, wait_for_processes, wait_for_readable
+from executor.sessions import RUNNING_SHELLS, stop_shells
 from executor.chroot import CHROOT_PROGRAM_NAME
 from executor.schroot import SCHROOT_PROGRAM_NAME
 from executor.ssh.client import (
     DEFAULT_CONNECT_TIMEOUT,
+    ConnectionPool,
+    HealthTracker,
     RemoteCommand,
+    RemoteCommandPool,
     RemoteCommandFailed,
     RemoteCommandNotFound,
     RemoteConnectFailed,
     foreach,
+    format_summary,
+    get_network_prefix,
+    iter_foreach,
     remote,
+    summarize_results,
 )
 from executor.ssh.server import SSHServer
+from executor.ssh.tree import FRAME_HEADER, parse_frames, tree_foreach
+from executor.transfer import distribute
 
 MISSING_COMMAND = 'a-program-name-that-no-one-would-ever-use'
 
@@ -179,6 +202,57 @@ class ExecutorTestCase(TestCase):
         for i, line in enumerate(cmd):
             assert i == int(line)
 
+    def test_decoded_output_caching(self):
+        """Make sure decoded output is cached until the command is reset."""
+        cmd = ExternalCommand(r"printf 'na\303\257ve\nsecond line\n'", capture=True)
+        cmd.start()
+        assert cmd.output is cmd.output
+        assert cmd.decoded_stdout is cmd.decoded_stdout
+        assert list(cmd) == [u'na\xefve', u'second line']
+        cmd.reset()
+        assert cmd.output is None
+        assert cmd.stdout_stream.views == {}
+        # Multibyte characters split between chunks should be decoded correctly.
+        chunks = [b'na\xc3', b'\xafve\nsecond', b' line\nno newline']
+        assert list(iter_decoded_lines(chunks, 'UTF-8')) == [u'na\xefve\n', u'second line\n', u'no newline']
+        assert list(iter_decoded_lines(chunks, 'UTF-8', keepends=False))[0] == u'na\xefve'
+
+    def test_wait_for_readable(self):
+        """Make sure file descriptors numbered 1024 and above can be waited on."""
+        import resource
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft_limit != resource.RLIM_INFINITY and soft_limit <= 2000:
+            return self.skipTest("file descriptor limit too low")
+        read_end, write_end = os.pipe()
+        high_fd = os.dup2(read_end, 2000) or 2000
+        try:
+            assert wait_for_readable([high_fd], timeout=0) == []
+            os.write(write_end, b'x')
+            assert wait_for_readable([high_fd], timeout=1) == [high_fd]
+        finally:
+            for fd in read_end, write_end, high_fd:
+                os.close(fd)
+
+    def test_iter_streams(self):
+        """Make sure the standard output and error streams can be read at the same time."""
+        # Write more than a pipe buffer to stderr before writing to stdout
+        # (this would deadlock when only stdout was being read).
+        cmd = ExternalCommand(*python_golf(
+            'import sys',
+            'sys.stderr.write("e" * 1024 * 1024 + "\\n")',
+            'sys.stderr.flush()',
+            'sys.stdout.write("first\\nsecond")',
+        ))
+        collected = []
+        with tempfile.TemporaryFile(mode='w+') as handle:
+            events = list(cmd.iter_streams(tee=dict(stdout=handle, stderr=collected.append)))
+            handle.seek(0)
+            assert handle.read() == 'first\nsecond'
+        cmd.wait()
+        assert [line for stream, line in events if stream == 'stdout'] == ['first', 'second']
+        assert [line for stream, line in events if stream == 'stderr'] == ['e' * 1024 * 1024]
+        assert collected == ['e' * 1024 * 1024]
+
     def test_program_searching(self):
         """Make sure which() works as expected."""
         assert which('python')
@@ -481,6 +555,96 @@ class ExecutorTestCase(TestCase):
             ionice='unknown-class',
         )
 
+    def test_resource_limits(self):
+        """Make sure resource limits, niceness and CPU affinity can be applied natively."""
+        assert execute('ulimit -n', capture=True, rlimits=dict(open_files=64)) == '64'
+        assert execute('ulimit -S -n', capture=True, rlimits=dict(nofile=(32, 64))) == '32'
+        assert int(execute('nice', capture=True, nice=5)) == int(execute('nice', capture=True)) + 5
+        if hasattr(os, 'sched_getaffinity'):
+            cpu = min(os.sched_getaffinity(0))
+            output = execute(*python_golf('import os', 'print(sorted(os.sched_getaffinity(0)))'),
+                             capture=True, cpu_affinity=[cpu])
+            assert output == str([cpu])
+        # The ioprio option should be validated like the ionice option.
+        assert execute('true', ioprio='idle')
+        self.assertRaises(ValueError, ExternalCommand, 'true', ioprio='unknown-class')
+        self.assertRaises(ValueError, ExternalCommand, 'true', cpu_affinity=[])
+        self.assertRaises(ValueError, ExternalCommand, 'true', rlimits=dict(unknown_resource=1))
+        # Without any options no preexec_fn is used (except on Python < 3.2
+        # where the preexec_fn restores the default signal handlers).
+        if sys.version_info[:2] >= (3, 2):
+            assert ExternalCommand('true').preexec_fn is None
+        else:
+            assert ExternalCommand('true').preexec_fn is not None
+        # Commands in a pipeline should be killed by SIGPIPE (regardless of
+        # whether the Python process ignores SIGPIPE).
+        assert execute('yes | head -n1', capture=True) == 'y'
+
+    def test_wait_for_processes(self):
+        """Make sure waiting for multiple processes returns as soon as one ends."""
+        quick = ExternalCommand('sleep 0.1', async=True)
+        slow = ExternalCommand('sleep 10', async=True)
+        quick.start()
+        slow.start()
+        try:
+            pidfd = open_pidfd(slow.pid)
+            if pidfd is None:
+                return self.skipTest("process file descriptors not supported")
+            os.close(pidfd)
+            timer = Timer()
+            assert wait_for_processes([quick, slow], timeout=0.01) == []
+            assert wait_for_processes([quick, slow], timeout=5) == [quick]
+            assert timer.elapsed_time < 1
+        finally:
+            slow.kill()
+            quick.wait()
+
+    def test_process_group_termination(self):
+        """Make sure process groups and sessions are terminated as a whole."""
+        for mode in 'group', 'session':
+            with TemporaryDirectory() as directory:
+                pid_file = os.path.join(directory, 'grandchild.pid')
+                cmd = ExternalCommand('sleep 60 & echo $! > %s; wait' % pid_file,
+                                      async=True, process_group=mode)
+                cmd.start()
+                retry(lambda: os.path.isfile(pid_file) and os.path.getsize(pid_file) > 0)
+                with open(pid_file) as handle:
+                    grandchild = int(handle.read())
+                assert os.getpgid(grandchild) == cmd.pid
+                assert cmd.terminate()
+                assert not cmd.is_group_running
+                retry(lambda: not os.path.exists('/proc/%i' % grandchild))
+        self.assertRaises(ValueError, ExternalCommand, 'true', process_group='unknown-mode')
+
+    def test_control_groups(self):
+        """Make sure external commands and command pools can be placed in control groups."""
+        root = find_cgroup_root()
+        current = find_current_cgroup()
+        if not (current and os.access(current, os.W_OK)):
+            return self.skipTest("cgroup v2 hierarchy not available or not writable")
+        # Control groups are created below the group of the current process by default.
+        assert current.startswith(root)
+        assert ControlGroup(name='example').path == os.path.join(current, 'example')
+        # Make sure daemonized grandchildren are killed together with the command.
+        cmd = ExternalCommand('setsid sleep 60 & sleep 60', async=True, cgroup=True)
+        cmd.start()
+        retry(lambda: len(cmd.cgroup.pids) == 3)
+        pids = cmd.cgroup.pids
+        cmd.kill()
+        cmd.wait()
+        retry(lambda: not any(os.path.exists('/proc/%i' % pid) for pid in pids))
+        assert not cmd.cgroup.exists
+        assert 'usage_usec' in cmd.cgroup_statistics['cpu_stat']
+        # Make sure the commands in a pool get their own control group.
+        pool = CommandPool(concurrency=2, cgroup=ControlGroup(parent=current))
+        for i in range(2):
+            pool.add(ExternalCommand('cat /proc/self/cgroup', capture=True))
+        pool.run()
+        for id, cmd in pool.commands:
+            assert cmd.cgroup.parent is pool.cgroup
+            assert cmd.cgroup.path[len(root):] in cmd.output
+        assert not pool.cgroup.exists
+
     def test_environment_variable_handling(self):
         """Make sure environment variables can be overridden."""
         # Check that environment variables of the current process are passed on to subprocesses.
@@ -585,6 +749,188 @@ class ExecutorTestCase(TestCase):
             assert 'finished' in mapping
             assert mapping['finished'] > mapping['started']
 
+    def test_spill_threshold(self):
+        """Make sure captured output is kept in memory until the spill threshold is exceeded."""
+        for size in 20, 1024 * 1024:
+            cmd = ExternalCommand(*python_golf('import sys', 'sys.stdout.write("x" * %i)' % size),
+                                  async=True, capture=True, capture_stderr=True, spill_threshold=1024)
+            cmd.start()
+            assert cmd.stdout_stream.filename is None
+            assert cmd.stdout_stream.spool is not None
+            cmd.wait()
+            assert cmd.stdout == b'x' * size
+            assert cmd.stderr == b''
+            assert cmd.stdout_stream.spool is None
+        # Output that was spilled to disk should be loaded on demand.
+        cmd = ExternalCommand(*python_golf('import sys', 'sys.stdout.write("y" * 4096)'),
+                              async=True, capture=True, spill_threshold=1024)
+        cmd.wait()
+        assert cmd.stdout_stream.is_spilled
+        assert cmd.stdout_stream.cached_output is None
+        view = cmd.stdout_view
+        assert isinstance(view, memoryview)
+        assert view.tobytes() == b'y' * 4096
+        # Python 2 can't create a memoryview of a memory mapping.
+        if sys.version_info[0] >= 3:
+            assert cmd.stdout_stream.cached_output is None
+        assert cmd.stdout == b'y' * 4096
+        assert not cmd.stdout_stream.is_spilled
+        assert cmd.stdout_view.tobytes() == b'y' * 4096
+        # Output that's still being produced should be available as well.
+        cmd = ExternalCommand('echo first && sleep 10', async=True, capture=True, spill_threshold=1024)
+        with cmd:
+            retry(lambda: cmd.stdout == b'first\n')
+
+    def test_lazy_loading(self):
+        """Make sure large output captured to temporary files is loaded on demand."""
+        size = LAZY_LOAD_THRESHOLD + 1
+        program = python_golf('import sys', 'sys.stdout.write("z" * %i)' % size)
+        # Without lazy loading the output is loaded when the command finishes.
+        cmd = ExternalCommand(*program, async=True, capture=True)
+        cmd.wait()
+        assert not cmd.stdout_stream.is_spilled
+        assert cmd.stdout_stream.cached_output == b'z' * size
+        # With lazy loading the output is kept in the temporary file.
+        cmd = ExternalCommand(*program, async=True, capture=True, lazy_loading=True)
+        cmd.wait()
+        assert cmd.stdout_stream.is_spilled
+        assert cmd.stdout_stream.cached_output is None
+        assert cmd.stdout_stream.filename is None
+        assert cmd.stdout_size == size
+        view = cmd.stdout_view
+        assert view.tobytes() == b'z' * size
+        # Python 2 can't create a memoryview of a memory mapping.
+        if sys.version_info[0] >= 3:
+            assert len(cmd.stdout_stream.mappings) == 1
+        # Mappings are closed by cleanup() (once the view has been released).
+        del view
+        cmd.stdout_stream.cleanup()
+        assert not cmd.stdout_stream.mappings
+        assert cmd.stdout == b'z' * size
+        # Small output is still loaded when the command finishes.
+        cmd = ExternalCommand('echo small', async=True, capture=True, lazy_loading=True)
+        cmd.wait()
+        assert not cmd.stdout_stream.is_spilled
+        assert cmd.stdout_stream.cached_output == b'small\n'
+
+    def test_streaming_input(self):
+        """Make sure file objects and iterables can be used as input."""
+        def generate_input():
+            for i in range(100000):
+                yield u'line %i\n' % i
+        expected = u''.join(u'line %i\n' % i for i in range(100000)).encode('ascii')
+        for async in False, True:
+            # Generators are fed through a pipe by a background thread.
+            cmd = ExternalCommand('cat', async=async, capture=True, input=generate_input())
+            cmd.wait()
+            assert cmd.stdout == expected
+            # File-like objects without a file descriptor are read in chunks.
+            cmd = ExternalCommand('cat', async=async, capture=True, input=io.BytesIO(expected))
+            cmd.wait()
+            assert cmd.stdout == expected
+        # Real files are connected directly to the standard input stream.
+        with tempfile.TemporaryFile() as handle:
+            handle.write(b'from a file\n')
+            handle.flush()
+            handle.seek(0)
+            assert execute('cat', input=handle, capture=True) == 'from a file'
+        # Input that isn't consumed shouldn't cause a hang or an error.
+        infinite_input = iter(lambda: b'y\n', None)
+        assert execute('head', '-n1', input=infinite_input, capture=True) == 'y'
+
+    def test_pipelines(self):
+        """Make sure external commands can be connected using pipes."""
+        pipeline = (ExternalCommand('seq', '20') |
+                    ExternalCommand('grep', '5') |
+                    ExternalCommand('wc', '-l', capture=True))
+        assert isinstance(pipeline, Pipeline)
+        assert len(pipeline.commands) == 3
+        assert str(pipeline) == 'seq 20 | grep 5 | wc -l'
+        pipeline.wait()
+        assert pipeline.output == '2'
+        assert pipeline.succeeded
+        assert pipeline.returncodes == [0, 0, 0]
+        # Large amounts of data should flow through the pipeline.
+        size = 1024 * 1024 * 10
+        pipeline = Pipeline(ExternalCommand('head', '-c', str(size), '/dev/zero'),
+                            ExternalCommand('wc', '-c', capture=True))
+        pipeline.wait()
+        assert int(pipeline.output) == size
+        # Commands killed by SIGPIPE shouldn't be considered failures.
+        pipeline = ExternalCommand('yes') | ExternalCommand('head', '-n1', capture=True)
+        pipeline.wait()
+        assert pipeline.output == 'y'
+        assert pipeline.succeeded
+        # Failing commands should be reported.
+        pipeline = ExternalCommand('echo 42 && exit 1') | ExternalCommand('cat', capture=True)
+        self.assertRaises(ExternalCommandFailed, pipeline.wait)
+        assert pipeline.output == '42'
+        assert pipeline.failed_commands == pipeline.commands[:1]
+        # Commands that were started shouldn't be left running when a later command fails to start.
+        pipeline = ExternalCommand('sleep', '60') | ExternalCommand('executor-missing-program', '--help')
+        self.assertRaises(CommandNotFound, pipeline.start)
+        assert pipeline.commands[0].is_finished
+
+    def test_capture_head_tail(self):
+        """Make sure the captured output can be bounded to the start and/or end of the output."""
+        size = 1024 * 1024
+        script = python_golf('import sys', 'sys.stdout.write("a" * %i + "b" * %i)' % (size, size))
+        for async in False, True:
+            cmd = ExternalCommand(*script, async=async, capture=True, capture_tail=10)
+            cmd.wait()
+            assert cmd.stdout == b'b' * 10
+            assert cmd.stdout_size == size * 2
+            cmd = ExternalCommand(*script, async=async, capture=True, capture_head=5, capture_tail=5)
+            cmd.wait()
+            assert cmd.stdout == b'a' * 5 + b'b' * 5
+            assert cmd.stdout_size == size * 2
+        # The standard error stream should be bounded as well.
+        cmd = ExternalCommand('echo -n 1234567890 >&2', capture=True, capture_stderr=True, capture_head=3)
+        cmd.start()
+        assert cmd.stderr == b'123'
+        assert cmd.stderr_size == 10
+        assert cmd.stdout == b''
+        # Without bounds the size should match the captured output.
+        cmd = ExternalCommand('echo -n 12345', capture=True)
+        cmd.start()
+        assert cmd.stdout_size == 5
+        # Bounds can't be combined with unbuffered output.
+        cmd = ExternalCommand('true', async=True, buffered=False, capture=True, capture_tail=10)
+        self.assertRaises(ValueError, cmd.start)
+        assert not cmd.was_started
+
+    def test_memory_files(self):
+        """Make sure anonymous memory files can be used for input and captured output."""
+        fd = create_memory_file('executor-test')
+        if fd is None:
+            return self.skipTest("anonymous memory files not supported")
+        os.close(fd)
+        cmd = ExternalCommand('cat', async=True, capture=True, input='memory file', memory_files=True)
+        cmd.start()
+        assert cmd.stdin_stream.is_memory_file
+        assert cmd.stdout_stream.is_memory_file
+        assert cmd.stdout_stream.filename.startswith('/proc/self/fd/')
+        cmd.wait()
+        assert cmd.output == 'memory file'
+        assert cmd.stdout_stream.filename is None
+
+    def test_lifecycle_timestamps(self):
+        """Make sure the lifecycle timestamps of external commands are recorded."""
+        for async in True, False:
+            cmd = ExternalCommand('sleep', '0.1', async=async)
+            assert cmd.created_time is not None
+            assert cmd.started_time is None
+            assert cmd.runtime is None
+            cmd.start()
+            assert cmd.started_time >= cmd.created_time
+            cmd.wait()
+            assert cmd.exited_time >= cmd.started_time
+            assert cmd.collected_time >= cmd.exited_time
+            assert cmd.runtime >= 0.1
+            assert cmd.collect_delay >= 0
+            # Commands that aren't part of a pool aren't queued.
+            assert cmd.queue_delay is None
+
     def test_repr(self):
         """Make sure that repr() on external commands gives sane output."""
         cmd = ExternalCommand('echo 42',
@@ -623,6 +969,44 @@ class ExecutorTestCase(TestCase):
         assert all(cmd.returncode == 0 for cmd in results.values())
         assert timer.elapsed_time < (num_commands * sleep_time)
 
+    def test_command_pool_statistics(self):
+        """Make sure command pools report timing statistics."""
+        pool = CommandPool(concurrency=2)
+        assert pool.statistics['runtime']['p50'] is None
+        for i in range(4):
+            pool.add(ExternalCommand('sleep 0.2'))
+        pool.run()
+        assert all(cmd.queued_time is not None for id, cmd in pool.commands)
+        statistics = pool.statistics
+        for name in 'runtime', 'queue_delay', 'scheduler_overhead':
+            for key in 'p50', 'p95', 'p99':
+                assert statistics[name][key] is not None
+            assert statistics[name]['p50'] <= statistics[name]['p95'] <= statistics[name]['p99']
+        assert statistics['runtime']['p50'] >= 0.2
+        # With a concurrency of two the last commands must have been queued.
+        assert statistics['queue_delay']['p99'] >= 0.2
+
+    def test_command_pool_cpu_pinning(self):
+        """Make sure command pools can pin commands to disjoint sets of CPUs."""
+        pool = CommandPool(concurrency=2, cpu_pinning=True)
+        explicit = ExternalCommand('sleep 0.1', cpu_affinity=[0])
+        pool.add(explicit)
+        for i in range(3):
+            pool.add(ExternalCommand('sleep 0.1'))
+        assigned = {}
+        for identifier, cmd in pool.commands:
+            cmd.start_event = lambda cmd: assigned.__setitem__(id(cmd), cmd.cpu_affinity)
+        pool.run()
+        assert explicit.cpu_affinity == [0]
+        cpus = set()
+        for identifier, cmd in pool.commands:
+            assert assigned[id(cmd)]
+            cpus.update(assigned[id(cmd)])
+            # Automatically assigned CPUs are released when commands are collected.
+            assert cmd.cpu_affinity is None or cmd is explicit
+        assert cpus.issubset(set(get_available_cpus()))
+        assert not pool.pinned
+
     def test_command_pool_resumable(self):
         """Make sure command pools can be resumed after raising exceptions."""
         pool = CommandPool()
@@ -704,6 +1088,78 @@ class ExecutorTestCase(TestCase):
                     contents = handle.read()
                 assert filename == ('%s.log' % contents.strip())
 
+    def test_command_pool_logs_compression(self):
+        """Make sure command pools can compress and truncate log files."""
+        import gzip
+        with TemporaryDirectory() as directory:
+            pool = CommandPool(concurrency=2, logs_directory=directory, logs_compression='gzip', logs_max_size=20)
+            pool.add(identifier='short', command=ExternalCommand('echo short; echo error >&2'))
+            pool.add(identifier='long', command=ExternalCommand('seq 1000'))
+            pool.run()
+            assert sorted(os.listdir(directory)) == ['long.log.gz', 'short.log.gz']
+            with gzip.open(os.path.join(directory, 'short.log.gz')) as handle:
+                assert sorted(handle.read().split()) == [b'error', b'short']
+            with gzip.open(os.path.join(directory, 'long.log.gz')) as handle:
+                contents = handle.read()
+            assert contents.startswith(b'1\n2\n3\n4\n5\n')
+            assert (TRUNCATION_MARKER % (len(''.join('%i\n' % i for i in range(1, 1001))) - 20)) in contents
+        self.assertRaises(ValueError, CommandPool, logs_compression='zip')
+        # Compressed streams can be appended to bzip2 files on all Python versions.
+        import bz2
+        with TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'appended.log.bz2')
+            for data in b'first\n', b'second\n':
+                appender = BZ2Appender(filename)
+                appender.write(data)
+                appender.close()
+            # Before Python 3.3 the bz2 module can't read multiple streams.
+            if sys.version_info[:2] >= (3, 3):
+                with bz2.BZ2File(filename) as handle:
+                    assert handle.read() == b'first\nsecond\n'
+            elif which('bzcat'):
+                cmd = ExternalCommand('bzcat', filename, capture=True)
+                cmd.wait()
+                assert cmd.stdout == b'first\nsecond\n'
+
+    def test_command_pool_logs_sink(self):
+        """Make sure command pools can multiplex the output of commands into a shared log sink."""
+        with TemporaryDirectory() as directory:
+            with LogSink(directory, max_segment_size=1024) as sink:
+                pool = CommandPool(concurrency=5, logs_sink=sink)
+                for i in range(1, 11):
+                    pool.add(identifier=i, command=ExternalCommand('seq %i; echo error %i >&2' % (i * 50, i)))
+                pool.run()
+                # The output should be spread over multiple segments.
+                assert len(sink.segments) > 1
+                for i in range(1, 11):
+                    expected = ''.join('%i\n' % n for n in range(1, i * 50 + 1))
+                    assert sink.extract(i, streams=['stdout']) == expected.encode('ascii')
+                    assert sink.extract(i, streams=['stderr']) == ('error %i\n' % i).encode('ascii')
+                records = list(sink.iter_records())
+                assert set(identifier for identifier, stream, timestamp, data in records) == \
+                    set(str(i) for i in range(1, 11))
+                # Old segments can be removed.
+                sink.max_segments = 1
+                sink.rotate()
+                assert len(sink.segments) == 1
+                assert not any(sink.extract(i) for i in range(1, 11))
+                # The indexes of removed segments should be removed as well.
+                assert sorted(os.listdir(directory)) == [
+                    os.path.basename(sink.get_index_filename(sink.segments[0])),
+                    os.path.basename(sink.get_segment_filename(sink.segments[0])),
+                ]
+
+    def test_command_pool_iter_results(self):
+        """Make sure command pools can generate results as commands finish and relay live output."""
+        pool = CommandPool(concurrency=3, live_output=True)
+        pool.add(identifier='slow', command=ExternalCommand('sleep 1; echo slow'))
+        pool.add(identifier='fast', command=ExternalCommand('echo fast; printf incomplete'))
+        with CaptureOutput() as capturer:
+            identifiers = [identifier for identifier, command in pool.iter_results()]
+            output = capturer.get_lines()
+        assert identifiers == ['fast', 'slow']
+        assert output == ['fast: fast', 'fast: incomplete', 'slow: slow']
+
     def test_concurrency_control_with_groups(self):
         """Make sure command pools support ``group_by`` for high level concurrency control."""
         pool = CommandPool(concurrency=10)
@@ -797,6 +1253,57 @@ class ExecutorTestCase(TestCase):
             remote, 'this.domain.surely.wont.exist.right', 'date', silent=True,
         )
 
+    def test_ssh_connection_pool(self):
+        """Make sure remote commands can share SSH connections."""
+        # Make sure the control socket is used when it's given.
+        cmd = RemoteCommand('localhost', 'true', control_path='/tmp/socket')
+        assert 'ControlPath=/tmp/socket' in cmd.command_line
+        # Make sure remote commands don't wait for slow master connections.
+        with ConnectionPool() as pool:
+            slow_ssh = ['sh', '-c', 'sleep 10', 'ssh']
+            cmd = RemoteCommand('localhost', 'true', async=True, check=False,
+                                connection_pool=pool, ssh_command=slow_ssh)
+            timer = Timer()
+            cmd.start()
+            assert timer.elapsed_time < 5
+            assert cmd.control_path is None
+            assert len(pool.pending) == 1
+            cmd.terminate()
+            cmd.wait(check=False)
+        assert not pool.pending
+        # Make sure the pool can be closed while a master connection is being waited for.
+        pool = ConnectionPool(master_timeout=10)
+        cmd = RemoteCommand('localhost', 'true', connection_pool=pool, ssh_command=slow_ssh)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(pool.connect(cmd)))
+        thread.start()
+        retry(lambda: len(pool.pending) == 1)
+        timer = Timer()
+        pool.close()
+        thread.join()
+        assert timer.elapsed_time < 5
+        assert results == [None]
+        assert not pool.masters
+        assert not pool.pending
+        with ConnectionPool(master_timeout=10) as pool:
+            # Make sure remote commands fall back to separate connections
+            # when the master connection can't be established.
+            cmd = RemoteCommand('localhost', 'true', check=False, connection_pool=pool, ssh_command=['false'])
+            cmd.start()
+            assert cmd.control_path is None
+            assert not pool.masters
+            assert not pool.pending
+            # Make sure remote commands to the same host share a master connection.
+            with SSHServer() as server:
+                context = RemoteContext('127.0.0.1', connection_pool=pool, **server.client_options)
+                assert context.exists('/')
+                assert context.cpu_count >= 1
+                assert len(pool.masters) == 1
+                control_path = list(pool.masters)[0]
+                assert os.path.exists(control_path)
+                pool.close()
+                assert not os.path.exists(control_path)
+
     def test_remote_command_missing(self):
         """Make sure a specific exception is raised when a remote command is missing."""
         with SSHServer() as server:
@@ -832,6 +1339,99 @@ class ExecutorTestCase(TestCase):
             assert sorted(ssh_aliases) == sorted(cmd.ssh_alias for cmd in results)
             assert len(ssh_aliases) == len(set(cmd.output for cmd in results))
 
+    def test_iter_foreach(self):
+        """Make sure the results of remote command pools can be generated as hosts finish."""
+        with SSHServer() as server:
+            ssh_aliases = ['127.0.0.%i' % i for i in (1, 2, 3, 4)]
+            results = list(iter_foreach(ssh_aliases, 'echo $SSH_CONNECTION', concurrency=3, **server.client_options))
+            assert sorted(ssh_aliases) == sorted(cmd.ssh_alias for cmd in results)
+            summary = summarize_results(results)
+            assert summary['succeeded'] == sorted(ssh_aliases)
+            assert "succeeded on 4 hosts" in format_summary(results)
+
+    def test_tree_foreach(self):
+        """Make sure remote commands can be fanned out through a tree of relay hosts."""
+        with TemporaryDirectory() as directory:
+            # Create a fake SSH client that executes the remote command locally
+            # (except for the host named `host-3' which is unreachable).
+            fake_ssh = os.path.join(directory, 'ssh')
+            with open(fake_ssh, 'w') as handle:
+                handle.write('#!/bin/sh\n')
+                handle.write('while [ $# -gt 2 ]; do shift; done\n')
+                handle.write('[ "$1" = host-3 ] && exit 255\n')
+                handle.write('exec sh -c "$2"\n')
+            os.chmod(fake_ssh, 0o755)
+            hosts = ['host-%i' % i for i in range(20)]
+            options = dict(fanout=3, relay_python=sys.executable, ssh_command=[fake_ssh])
+            self.assertRaises(CommandPoolFailed, tree_foreach, hosts, 'echo', '42', **options)
+            results = tree_foreach(hosts, 'echo', '42', check=False, **options)
+            assert [cmd.ssh_alias for cmd in results] == hosts
+            # The tree consists of the relays host-0, host-7 and host-14, host-0
+            # relays to host-1, host-3 and host-5 so host-4 is unreachable as well.
+            failed = [cmd.ssh_alias for cmd in results if cmd.failed]
+            assert failed == ['host-3', 'host-4']
+            assert all(cmd.returncode == 255 for cmd in results if cmd.failed)
+            assert all(cmd.output == '42' for cmd in results if cmd.succeeded)
+        self.assertRaises(ValueError, tree_foreach, hosts)
+        # Make sure frames are parsed correctly and incomplete frames are detected.
+        frames = FRAME_HEADER.pack(6, 0, 3, 0) + b'host-1' + b'42\n' + FRAME_HEADER.pack(6, 1, 0, 4) + b'host-2fail'
+        assert list(parse_frames(frames)) == [('host-1', 0, b'42\n', b''), ('host-2', 1, b'', b'fail')]
+        self.assertRaises(ValueError, list, parse_frames(frames[:-1]))
+        self.assertRaises(ValueError, list, parse_frames(frames[:FRAME_HEADER.size - 1]))
+
+    def test_remote_command_pool_health(self):
+        """Make sure remote command pools fail fast for unhealthy hosts and adapt their concurrency."""
+        with TemporaryDirectory() as directory:
+            # Create a fake SSH client that logs the hosts it connects to and
+            # fails to connect to the hosts in the domain `dead.example'.
+            fake_ssh = os.path.join(directory, 'ssh')
+            connections = os.path.join(directory, 'connections.log')
+            with open(fake_ssh, 'w') as handle:
+                handle.write('#!/bin/sh\n')
+                handle.write('while [ $# -gt 2 ]; do shift; done\n')
+                handle.write('echo "$1" >> %s\n' % quote(connections))
+                handle.write('case "$1" in *.dead.example) exit 255;; esac\n')
+                handle.write('exec sh -c "$2"\n')
+            os.chmod(fake_ssh, 0o755)
+            tracker = HealthTracker(prefix_failure_threshold=3)
+            hosts = ['host-%i.dead.example' % i for i in range(1, 6)] + ['host-1.good.example', 'host-2.good.example']
+            pool = RemoteCommandPool(concurrency=4, health_tracker=tracker)
+            for ssh_alias in hosts:
+                pool.add(RemoteCommand(ssh_alias, 'true', check=False, ssh_command=[fake_ssh]))
+            pool.run()
+            with open(connections) as handle:
+                connected = handle.read().split()
+            # The circuit breaker of the network prefix opened after three
+            # failures so the fifth host was never contacted.
+            assert 'host-5.dead.example' not in connected
+            assert 'host-1.good.example' in connected
+            assert [cmd.returncode for id, cmd in pool.commands] == [255] * 5 + [0, 0]
+            # The concurrency dropped to one and then grew by one for every success.
+            assert pool.concurrency_limit == 3
+            # The health of hosts is remembered between pools.
+            assert tracker.is_open('host-1.dead.example')
+            assert not tracker.is_open('host-1.good.example')
+        assert get_network_prefix('10.1.2.3') == '10.1.2.0/24'
+        assert get_network_prefix('server.example.com') == 'example.com'
+        assert get_network_prefix('web1.dc1.example.com') == 'dc1.example.com'
+        assert get_network_prefix('example.com') is None
+        assert get_network_prefix('localhost') is None
+        # The grouping of hosts into network prefixes can be customized (or disabled).
+        tracker = HealthTracker(prefix_function=lambda ssh_alias: ssh_alias.split('-')[0])
+        assert [b.name for b in tracker.get_breakers('rack1-web1')] == ['rack1-web1', 'rack1']
+        tracker = HealthTracker(prefix_function=None)
+        assert [b.name for b in tracker.get_breakers('web1.dc1.example.com')] == ['web1.dc1.example.com']
+        # Only a single thread should be allowed to probe a half-open circuit breaker.
+        tracker = HealthTracker(failure_threshold=1, reset_timeout=0)
+        tracker.record('unhealthy-host', connect_failed=True)
+        allowed = []
+        threads = [threading.Thread(target=lambda: allowed.append(tracker.allow('unhealthy-host'))) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(allowed) == [False] * 9 + [True]
+
     def test_foreach_with_logging(self):
         """Make sure remote command pools can log output."""
         with TemporaryDirectory() as directory:
@@ -932,6 +1532,232 @@ class ExecutorTestCase(TestCase):
         """Test a local command context."""
         self.check_context(LocalContext())
 
+    def test_stat_many(self):
+        """Test that the status of multiple pathnames can be checked at once."""
+        context = LocalContext()
+        with TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'file with spaces')
+            with open(filename, 'w') as handle:
+                handle.write('42')
+            missing = os.path.join(directory, 'missing')
+            pathnames = [directory, filename, missing]
+            # Check the native implementation and the implementation that executes a command.
+            for results in context.stat_many(pathnames), AbstractContext.stat_many(context, pathnames):
+                assert results[directory].exists and results[directory].is_directory
+                assert results[filename].exists and results[filename].is_file
+                assert results[filename].is_readable and results[filename].is_writable
+                assert results[filename].size == 2
+                assert not results[missing].exists
+                assert results[missing].size is None
+            assert context.exists_many(pathnames) == {directory: True, filename: True, missing: False}
+
+    def test_local_context_native_access(self):
+        """Test that local contexts avoid spawning external commands when possible."""
+        context = LocalContext()
+        assert context.native_access
+        assert not LocalContext(sudo=True).native_access
+        assert not LocalContext(fakeroot=True).native_access
+        assert not LocalContext(virtual_environment='/opt/venv').native_access
+        with TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'file')
+            with open(filename, 'wb') as handle:
+                handle.write(b'contents')
+            # Get the results of the implementations that spawn commands.
+            expected = [
+                AbstractContext.exists(context, filename),
+                AbstractContext.is_file(context, directory),
+                AbstractContext.is_directory(context, directory),
+                AbstractContext.is_readable(context, filename),
+                AbstractContext.is_writable(context, filename),
+                AbstractContext.read_file(context, filename),
+                AbstractContext.list_entries(context, directory),
+                AbstractContext.find_program(context, 'sh', 'cat'),
+            ]
+            # Make sure the native implementations don't spawn commands.
+            context.start_command = MagicMock(side_effect=AssertionError)
+            assert expected == [
+                context.exists(filename),
+                context.is_file(directory),
+                context.is_directory(directory),
+                context.is_readable(filename),
+                context.is_writable(filename),
+                context.read_file(filename),
+                context.list_entries(directory),
+                context.find_program('sh', 'cat'),
+            ]
+            # Relative pathnames are resolved using the working directory of the context.
+            assert LocalContext(directory=directory).is_file('file')
+            # Errors are still reported by the commands.
+            del context.start_command
+            self.assertRaises(ExternalCommandFailed, context.read_file, os.path.join(directory, 'missing'))
+
+    def test_file_transfer(self):
+        """Test that files can be uploaded, downloaded, synchronized and distributed using tar streams."""
+        context = LocalContext()
+        with TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'source')
+            os.makedirs(os.path.join(source, 'nested'))
+            with open(os.path.join(source, 'nested', 'file'), 'w') as handle:
+                handle.write('contents')
+            # Upload and download the directory (with and without compression).
+            context.upload([source], os.path.join(directory, 'uploaded'), compression='gzip')
+            assert context.read_file(os.path.join(directory, 'uploaded', 'source', 'nested', 'file')) == b'contents'
+            context.download([os.path.join(source, 'nested')], os.path.join(directory, 'downloaded'))
+            assert context.list_entries(os.path.join(directory, 'downloaded', 'nested')) == ['file']
+            self.assertRaises(ValueError, context.upload, [source], directory, compression='zip')
+            # Relative pathnames in different directories are supported for
+            # local files (tar interprets each --directory option relative to
+            # the previous one) but rejected for files in the context.
+            os.makedirs(os.path.join(directory, 'other'))
+            with open(os.path.join(directory, 'other', 'file'), 'w') as handle:
+                handle.write('other contents')
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                context.upload(['source/nested', 'other/file'], 'relative')
+                assert context.list_entries(os.path.join('relative', 'nested')) == ['file']
+                assert context.read_file(os.path.join('relative', 'file')) == b'other contents'
+                self.assertRaises(ValueError, context.download, ['source/nested', 'other/file'], 'relative')
+                context.download(['source/nested', os.path.join(directory, 'other', 'file')], 'mixed')
+                assert context.list_entries('mixed') == ['file', 'nested']
+            finally:
+                os.chdir(cwd)
+            # Synchronize the directory using rsync (when available) and using tar.
+            tar_context = LocalContext()
+            tar_context.prepare_rsync = MagicMock(return_value=None)
+            for i, sync_context in enumerate((context, tar_context)):
+                target = os.path.join(directory, 'synced-%i' % i)
+                sync_context.sync(source, target)
+                assert context.read_file(os.path.join(target, 'nested', 'file')) == b'contents'
+            # Distribute the directory to a group of (fake) remote hosts.
+            fake_ssh = os.path.join(directory, 'ssh')
+            with open(fake_ssh, 'w') as handle:
+                handle.write('#!/bin/sh\n')
+                handle.write('while [ $# -gt 2 ]; do shift; done\n')
+                handle.write('mkdir -p "%s/$1" && cd "%s/$1" && exec sh -c "$2"\n' % (directory, directory))
+            os.chmod(fake_ssh, 0o755)
+            hosts = ['host-%i' % i for i in range(5)]
+            tracker = HealthTracker()
+            results = distribute(hosts, [source], 'artifacts', concurrency=2,
+                                 health_tracker=tracker, ssh_command=[fake_ssh])
+            assert all(cmd.succeeded for cmd in results)
+            for ssh_alias in hosts:
+                pathname = os.path.join(directory, ssh_alias, 'artifacts', 'source', 'nested', 'file')
+                assert context.read_file(pathname) == b'contents'
+            # Make sure the pool options were used.
+            assert sorted(name for kind, name in tracker.breakers) == hosts
+        # Make sure relative rsync targets are relative to the directory of a remote context.
+        with patch('executor.contexts.which', return_value='/usr/bin/rsync'):
+            with patch.object(RemoteContext, 'have_rsync', True):
+                remote_context = RemoteContext('server', directory='/srv')
+                assert remote_context.prepare_rsync('source', 'target').command_line[-1] == 'server:/srv/target/'
+                assert remote_context.prepare_rsync('source', '/target').command_line[-1] == 'server:/target/'
+
+    def test_streaming_file_access(self):
+        """Test that files can be read and written as streams."""
+        context = LocalContext()
+        contents = b''.join(('line %i\n' % i).encode('ascii') for i in range(10000))
+        with TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'file')
+            # Test the native implementations and the implementations that execute commands.
+            for open_read, open_write in ((context.open_read, context.open_write),
+                                          (functools.partial(AbstractContext.open_read, context),
+                                           functools.partial(AbstractContext.open_write, context))):
+                with open_write(filename) as handle:
+                    for offset in range(0, len(contents), 1000):
+                        handle.write(contents[offset:offset + 1000])
+                assert context.read_file(filename) == contents
+                with open_read(filename) as handle:
+                    assert next(iter(handle)) == b'line 0\n'
+                with open_read(filename) as handle:
+                    assert handle.read() == contents
+            assert b''.join(context.read_chunks(filename, chunk_size=4096)) == contents
+            # Errors are reported by the commands.
+            handle = AbstractContext.open_read(context, os.path.join(directory, 'missing'))
+            self.assertRaises(ExternalCommandFailed, handle.read)
+            handle = AbstractContext.open_write(context, os.path.join(directory, 'missing', 'file'))
+            self.assertRaises(ExternalCommandFailed, handle.close)
+
+    def test_fact_cache(self):
+        """Test that facts are gathered in a single command and cached on disk."""
+        with TemporaryDirectory() as directory:
+            cache = FactCache(directory=directory, ttl=60)
+            context = LocalContext(fact_cache=cache)
+            # All facts are gathered by a single command.
+            context.start_command = MagicMock(wraps=context.start_command)
+            expected = [context.distributor_id, context.distribution_codename, context.have_ionice]
+            assert context.start_command.call_count == 1
+            assert expected == [
+                context.capture('lsb_release', '--short', '--id', check=False, silent=True).lower(),
+                context.capture('lsb_release', '--short', '--codename', check=False, silent=True).lower(),
+                bool(context.find_program('ionice')),
+            ]
+            assert os.path.isfile(cache.get_filename(context.identity))
+            # New contexts for the same system use the cached facts.
+            context = LocalContext(fact_cache=cache)
+            context.start_command = MagicMock(side_effect=AssertionError)
+            assert [context.distributor_id, context.distribution_codename, context.have_ionice] == expected
+            # Expired facts are gathered again.
+            cache.ttl = 0
+            assert cache.load(context.identity) is None
+        # Contexts are identified by their SSH alias, remote user and port.
+        assert RemoteContext('user@server', port=2222).identity == 'ssh://user@server:2222'
+        context = SecureChangeRootContext('chroot', parent=RemoteContext('server'))
+        assert context.identity == 'ssh://server/schroot:chroot'
+
+    def test_persistent_shell(self):
+        """Test that commands can be executed in a persistent shell."""
+        context = LocalContext(persistent_shell=True)
+        with context:
+            # Make sure the commands are executed by the same shell.
+            assert context.capture('sh', '-c', 'echo $PPID') == context.capture('sh', '-c', 'echo $PPID')
+            assert context.shell_session.is_running
+            # Make sure output and exit status are reported correctly.
+            assert context.exists('/')
+            assert not context.exists('/' + uuid.uuid4().hex)
+            assert context.capture('echo', 'foo') == 'foo'
+            assert context.capture('sh', '-c', 'echo bar >&2', merge_streams=True) == 'bar'
+            self.assertRaises(ExternalCommandFailed, context.execute, 'false')
+            # Make sure commands can't affect the persistent shell.
+            assert not context.test('exit 5')
+            assert context.capture('pwd', directory='/') == '/'
+            assert context.capture('sh', '-c', 'echo $foo', environment=dict(foo='bar')) == 'bar'
+            # Make sure unsupported options fall back to a separate process.
+            assert context.capture('cat', input='baz') == 'baz'
+            # Make sure concurrent commands don't corrupt each other's output.
+            results = {}
+
+            def run_commands(identifier):
+                results[identifier] = [context.capture('echo', '%i-%i' % (identifier, i)) for i in range(10)]
+            threads = [threading.Thread(target=run_commands, args=(identifier,)) for identifier in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results == dict((identifier, ['%i-%i' % (identifier, i) for i in range(10)])
+                                   for identifier in range(5))
+        assert not context.shell_session.is_running
+        # Make sure shells are stopped when their session is garbage collected
+        # (log records captured by the test runner would keep the context alive).
+        logging.disable(logging.CRITICAL)
+        try:
+            context = LocalContext(persistent_shell=True)
+            assert context.capture('echo', 'foo') == 'foo'
+            process = context.shell_session.process
+            assert process.is_running
+            context = None
+            gc.collect()
+            assert not process.is_running
+        finally:
+            logging.disable(logging.NOTSET)
+        # Make sure shells that are still running are stopped at exit.
+        context = LocalContext(persistent_shell=True)
+        assert context.capture('echo', 'foo') == 'foo'
+        process = context.shell_session.process
+        stop_shells()
+        assert not process.is_running
+        assert not RUNNING_SHELLS
+
     def test_remote_context(self):
         """Test a remote command context."""
         with SSHServer() as server:
@@ -0,0 +1,323 @@
+# Programmer friendly subprocess wrapper.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 19, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Efficient transfer of files and directory trees using tar streams.
+
+The :mod:`executor.transfer` module implements the logic behind the
+:func:`~executor.contexts.AbstractContext.upload()`,
+:func:`~executor.contexts.AbstractContext.download()` and
+:func:`~executor.contexts.AbstractContext.sync()` methods of command execution
+contexts. Instead of reading files into Python and writing them to the context
+one file and one command at a time (which is what
+:func:`~executor.contexts.AbstractContext.read_file()` and
+:func:`~executor.contexts.AbstractContext.write_file()` do) the files are
+archived by ``tar`` on one side and extracted by ``tar`` on the other side.
+The two commands are connected using a :class:`~executor.pipelines.Pipeline`
+so the data never passes through the Python process. The :func:`distribute()`
+function uploads files to many remote hosts at once using a
+:class:`~executor.ssh.client.RemoteCommandPool`.
+"""
+
+# Standard library modules.
+import logging
+import os
+import posixpath
+import tempfile
+
+# External dependencies.
+from humanfriendly import Timer, pluralize
+
+# Modules included in our package.
+from executor import ExternalCommand, quote
+from executor.pipelines import Pipeline
+from executor.ssh.client import DEFAULT_CONCURRENCY, RemoteCommand, RemoteCommandPool
+
+# Initialize a logger for this module.
+logger = logging.getLogger(__name__)
+
+TAR_COMPRESSION_OPTIONS = dict(bz2='--bzip2', gzip='--gzip', lzma='--xz')
+"""A dictionary that maps the supported compression methods to the corresponding ``tar`` options."""
+
+
+def get_compression_options(compression=None):
+    """
+    Get the ``tar`` command line options for a compression method.
+
+    :param compression: One of the keys of :data:`TAR_COMPRESSION_OPTIONS` or
+                        :data:`None` (to disable compression).
+    :returns: A list of strings.
+    :raises: :exc:`~exceptions.ValueError` when the compression method isn't supported.
+    """
+    if compression is None:
+        return []
+    if compression not in TAR_COMPRESSION_OPTIONS:
+        msg = "Unsupported compression method %r! (supported methods are %s)"
+        raise ValueError(msg % (compression, ', '.join(sorted(TAR_COMPRESSION_OPTIONS))))
+    return [TAR_COMPRESSION_OPTIONS[compression]]
+
+
+def get_archive_command(paths, compression=None):
+    """
+    Get the command line that creates a tar archive on its standard output stream.
+
+    :param paths: An iterable of strings with the pathnames of files and/or
+                  directories (each pathname is added to the archive under
+                  its base name).
+    :param compression: Refer to :func:`get_compression_options()`.
+    :returns: A list of strings.
+    :raises: :exc:`~exceptions.ValueError` when no pathnames are given, a
+             pathname doesn't have a base name (like ``/``) or relative
+             pathnames in different directories are given.
+
+    The pathnames are grouped by directory and each group is preceded by a
+    ``--directory`` option. Because ``tar`` interprets a relative
+    ``--directory`` option relative to the previous one, all relative
+    pathnames must share the same directory (which is added to the
+    archive first). Callers that archive local files should pass
+    absolute pathnames (see :func:`upload()` and :func:`distribute()`).
+    """
+    directories = []
+    members = {}
+    relative_directory = None
+    for pathname in paths:
+        directory, name = posixpath.split(posixpath.normpath(pathname))
+        if name in ('', posixpath.curdir, posixpath.pardir):
+            msg = "Can't determine the base name of %r! (use sync() to transfer the contents of a directory)"
+            raise ValueError(msg % pathname)
+        directory = directory or posixpath.curdir
+        if not posixpath.isabs(directory):
+            if relative_directory not in (None, directory):
+                msg = "Can't archive relative pathnames in different directories! (%r and %r)"
+                raise ValueError(msg % (relative_directory, directory))
+            relative_directory = directory
+        if directory not in members:
+            directories.append(directory)
+            members[directory] = []
+        members[directory].append(name)
+    if not directories:
+        raise ValueError("No pathnames given to archive!")
+    if relative_directory is not None:
+        # The relative directory must come before any absolute directories.
+        directories.remove(relative_directory)
+        directories.insert(0, relative_directory)
+    command_line = ['tar', '--create', '--file=-'] + get_compression_options(compression)
+    for directory in directories:
+        command_line.append('--directory=%s' % directory)
+        command_line.extend(members[directory])
+    return command_line
+
+
+def get_extract_command(directory, compression=None):
+    """
+    Get the shell command that extracts a tar archive from its standard input stream.
+
+    :param directory: The pathname of the directory where the archive should
+                      be extracted (a string, the directory is created when it
+                      doesn't exist yet).
+    :param compression: Refer to :func:`get_compression_options()`.
+    :returns: A shell command (a string).
+    """
+    return 'mkdir -p %s && %s' % (
+        quote(directory),
+        quote(['tar', '--extract', '--file=-'] + get_compression_options(compression) + ['--directory=%s' % directory]),
+    )
+
+
+def distribute(hosts, paths, directory, compression=None, **options):
+    """
+    Upload files and/or directories to a group of remote hosts.
+
+    :param hosts: An iterable of strings with SSH host aliases.
+    :param paths: An iterable of strings with local pathnames (refer to
+                  :func:`get_archive_command()`).
+    :param directory: The pathname of the directory on the remote hosts where
+                      the files should be extracted (a string).
+    :param compression: Refer to :func:`get_compression_options()`.
+    :param concurrency: The value of :attr:`.concurrency` to use
+                        (defaults to :data:`.DEFAULT_CONCURRENCY`).
+    :param delay_checks: The value of :attr:`.delay_checks` to use
+                         (defaults to :data:`True`).
+    :param connection_pool: The value of :attr:`.RemoteCommandPool.connection_pool`
+                            to use (defaults to :data:`None`).
+    :param health_tracker: The value of :attr:`.RemoteCommandPool.health_tracker`
+                           to use (defaults to :data:`None`).
+    :param logs_directory: The value of :attr:`.logs_directory` to
+                           use (defaults to :data:`None`).
+    :param options: Additional keyword arguments are used to initialize the
+                    :class:`.RemoteCommand` objects (for example ``sudo=True``).
+    :returns: The list of :class:`.RemoteCommand` objects that extracted the
+              archive on the remote hosts.
+    :raises: Refer to :func:`.foreach()`.
+
+    The archive is created only once (in a temporary file) and each remote
+    command reads the archive directly from the temporary file (refer to
+    :class:`ArchiveReader`) so that distributing artifacts to many hosts is
+    limited by the network and not by the Python process.
+    """
+    hosts = list(hosts)
+    # Separate command pool options from command options.
+    concurrency = options.pop('concurrency', DEFAULT_CONCURRENCY)
+    delay_checks = options.pop('delay_checks', True)
+    connection_pool = options.pop('connection_pool', None)
+    health_tracker = options.pop('health_tracker', None)
+    logs_directory = options.pop('logs_directory', None)
+    if options.get('check') is not False:
+        options['check'] = True
+    timer = Timer()
+    pool = RemoteCommandPool(concurrency=concurrency,
+                             connection_pool=connection_pool,
+                             delay_checks=delay_checks,
+                             health_tracker=health_tracker,
+                             logs_directory=logs_directory)
+    paths = [os.path.abspath(pathname) for pathname in paths]
+    with tempfile.NamedTemporaryFile(prefix='executor-', suffix='.tar') as archive:
+        ExternalCommand(*get_archive_command(paths, compression), stdout_file=archive).start()
+        logger.debug("Distributing %s to %s ..", archive.name, pluralize(len(hosts), "host"))
+        for ssh_alias in hosts:
+            reader = ArchiveReader(archive.name)
+            pool.add(identifier=ssh_alias, command=RemoteCommand(
+                ssh_alias, get_extract_command(directory, compression),
+                finish_event=reader.on_finish, input=reader, **options
+            ))
+        pool.run()
+    logger.debug("Finished distributing files to %s in %s.", pluralize(len(hosts), "host"), timer)
+    return [cmd for ssh_alias, cmd in pool.commands]
+
+
+class ArchiveReader(object):
+
+    """
+    File-like object that opens an archive when an external command needs it.
+
+    :func:`distribute()` creates one command per remote host, but the archive
+    is only opened when the command is started (when
+    :func:`~executor.CachedStream.prepare_input()` asks for the file
+    descriptor) and closed when the command finishes. This way the number of
+    open file descriptors is limited by the concurrency of the pool instead of
+    the number of remote hosts.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize an :class:`ArchiveReader` object.
+
+        :param filename: The pathname of the archive (a string).
+        """
+        self.filename = filename
+        self.handle = None
+
+    def fileno(self):
+        """Open the archive (if it isn't open yet) and return its file descriptor (an integer)."""
+        if self.handle is None:
+            self.handle = open(self.filename, 'rb')
+        return self.handle.fileno()
+
+    def read(self, size=-1):
+        """Read from the archive (refer to :func:`io.RawIOBase.read()`)."""
+        self.fileno()
+        return self.handle.read(size)
+
+    def close(self):
+        """Close the archive (if it's open)."""
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def on_finish(self, command):
+        """Close the archive when the command has finished (used as :attr:`~executor.ExternalCommand.finish_event`)."""
+        self.close()
+
+
+def upload(context, paths, directory, compression=None):
+    """
+    Upload local files and/or directories to a command execution context.
+
+    :param context: The command execution context (an
+                    :class:`~executor.contexts.AbstractContext` object).
+    :param paths: An iterable of strings with local pathnames (refer to
+                  :func:`get_archive_command()`).
+    :param directory: The pathname of the directory in the context where the
+                      files should be extracted (a string).
+    :param compression: Refer to :func:`get_compression_options()`.
+    :raises: :exc:`~executor.ExternalCommandFailed` when ``tar`` fails on
+             either side.
+    """
+    source = ExternalCommand(*get_archive_command([os.path.abspath(pathname) for pathname in paths], compression))
+    target = context.prepare(get_extract_command(directory, compression), shell=True)
+    transfer(source, target, "Uploading files to %s ..", context)
+
+
+def download(context, paths, directory, compression=None):
+    """
+    Download files and/or directories from a command execution context.
+
+    :param context: The command execution context (an
+                    :class:`~executor.contexts.AbstractContext` object).
+    :param paths: An iterable of strings with pathnames in the context
+                  (refer to :func:`get_archive_command()`, relative pathnames
+                  are relative to the working directory of the context and
+                  must share the same directory).
+    :param directory: The pathname of the local directory where the files
+                      should be extracted (a string).
+    :param compression: Refer to :func:`get_compression_options()`.
+    :raises: :exc:`~executor.ExternalCommandFailed` when ``tar`` fails on
+             either side, :exc:`~exceptions.ValueError` when
+             :func:`get_archive_command()` rejects the pathnames.
+    """
+    source = context.prepare(*get_archive_command(paths, compression))
+    target = ExternalCommand(get_extract_command(directory, compression))
+    transfer(source, target, "Downloading files from %s ..", context)
+
+
+def sync(context, source_directory, target_directory, compression=None):
+    """
+    Copy the contents of a local directory to a directory in a command execution context.
+
+    :param context: The command execution context (an
+                    :class:`~executor.contexts.AbstractContext` object).
+    :param source_directory: The pathname of the local directory (a string).
+    :param target_directory: The pathname of the directory in the context (a string).
+    :param compression: Refer to :func:`get_compression_options()`. When
+                        rsync_ is used any compression method enables the
+                        ``--compress`` option of rsync_.
+    :raises: :exc:`~executor.ExternalCommandFailed` when rsync_ or ``tar`` fails.
+
+    When :func:`~executor.contexts.AbstractContext.prepare_rsync()` returns
+    a command (because rsync_ is available on both sides) only the
+    differences between the two directories are transferred, otherwise the
+    complete contents of the source directory are streamed using ``tar``.
+    Files in the target directory that don't exist in the source directory
+    are never removed.
+
+    .. _rsync: https://rsync.samba.org/
+    """
+    get_compression_options(compression)
+    command = context.prepare_rsync(source_directory, target_directory, compress=compression is not None)
+    if command is not None:
+        logger.debug("Synchronizing %s to %s using rsync ..", source_directory, context)
+        command.wait()
+    else:
+        source = ExternalCommand(*['tar', '--create', '--file=-'] + get_compression_options(compression) + [
+            '--directory=%s' % source_directory, os.curdir,
+        ])
+        target = context.prepare(get_extract_command(target_directory, compression), shell=True)
+        transfer(source, target, "Synchronizing %s to %%s using tar .." % source_directory, context)
+
+
+def transfer(source, target, message, context):
+    """
+    Connect two commands using a :class:`~executor.pipelines.Pipeline` and wait for them to finish.
+
+    :param source: The command that creates the archive (an :class:`~executor.ExternalCommand` object).
+    :param target: The command that extracts the archive (an :class:`~executor.ExternalCommand` object).
+    :param message: The log message (a string with a ``%s`` placeholder for the context).
+    :param context: The command execution context (used in the log message).
+    """
+    timer = Timer()
+    logger.debug(message, context)
+    Pipeline(source, target).wait()
+    logger.debug("Finished transfer in %s.", timer)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# Benchmark for decoding of captured output by the `executor' package.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://executor.readthedocs.io
+
+"""
+Benchmark decoding of captured output.
+
+This script runs a command that generates a lot of output and compares:
+
+1. Repeated access to :attr:`~executor.ExternalCommand.output` and iteration
+   over the lines of output, which used to decode the output on every access
+   and now uses the cached views of :func:`~executor.CachedStream.get_view()`.
+
+2. Decoding of output that's read in chunks (the way unbuffered commands are
+   iterated) by decoding each line separately versus decoding the chunks
+   using :func:`~executor.iter_decoded_lines()`.
+
+Usage: ``python scripts/benchmark-decoding.py [NUM_LINES]``
+"""
+
+# Standard library modules.
+import io
+import sys
+
+# External dependencies.
+from humanfriendly import Timer, format_size
+
+# Modules included in our package.
+from executor import ExternalCommand, iter_decoded_lines
+
+
+def main():
+    """Command line interface for the decoding benchmark."""
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 250000
+    repetitions = 10
+    cmd = ExternalCommand(
+        sys.executable, '-c', 'import sys; sys.stdout.write(u"na\\xefve line of output\\n" * %i)' % num_lines,
+        capture=True, environment=dict(PYTHONIOENCODING='UTF-8'),
+    )
+    cmd.start()
+    raw = cmd.stdout
+    print("Captured %s of output (%i lines)." % (format_size(len(raw)), num_lines))
+    # Repeated access to the decoded output (cached).
+    with Timer(resumable=True) as timer:
+        for i in range(repetitions):
+            len(cmd.output)
+            sum(1 for line in cmd)
+    print("Cached: %i times output + iteration took %s." % (repetitions, timer))
+    # Repeated access to the decoded output (without caching).
+    with Timer(resumable=True) as timer:
+        for i in range(repetitions):
+            len(raw.decode(cmd.encoding).strip())
+            sum(1 for line in raw.decode(cmd.encoding).splitlines())
+    print("Uncached: %i times output + iteration took %s." % (repetitions, timer))
+    # Incremental decoding of chunks versus decoding line by line.
+    with Timer(resumable=True) as timer:
+        handle = io.BytesIO(raw)
+        count = sum(1 for line in iter(lambda: handle.readline().decode(cmd.encoding), u''))
+    print("Line by line: decoding %i lines took %s." % (count, timer))
+    with Timer(resumable=True) as timer:
+        handle = io.BytesIO(raw)
+        count = sum(1 for line in iter_decoded_lines(iter(lambda: handle.read(65536), b''), cmd.encoding))
+    print("Incremental: decoding %i lines took %s." % (count, timer))
+
+
+if __name__ == '__main__':
+    main()